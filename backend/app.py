@@ -2,10 +2,46 @@
 import os
 import json
 import uuid
-import shutil
 import subprocess
+import time
+import shlex
+import math
+import codecs
+import contextvars
+import queue
 import threading
-from flask import Flask, request, jsonify, send_from_directory
+import atexit
+import hmac
+import socket
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
+
+from catalog import QuestionCatalog, CHECK_INTERVAL as CATALOG_CHECK_INTERVAL
+from bundle import QuestionBundle, BundleBuilder, build_bundle
+from render import StepRenderer
+from http_cache import ResponseCache, choose_encoding
+from assets import StaticAssets
+from search import QuestionIndex
+from executor import CommandExecutor, QueueFull
+from ratelimit import RateLimiter
+from limits import ResourceLimits
+from metrics import Registry
+from result_cache import SingleFlightCache
+from resource_cache import ResourceCache
+from streams import SessionOutput
+from shell import PersistentShell
+from sessions import Session, SessionManager
+from session_store import SessionStore
+from workspaces import WorkspaceStore, is_cleanup_command
+from audit import AuditLog
+from question_files import QuestionFiles, VersionConflict, valid_question_id, valid_step_id
+from namespace_pool import NamespacePool, wait_for_deletion
+from sweeper import SweeperLock
+from validation import Validator, substitute_namespace
 
 app = Flask(__name__)
 
@@ -14,27 +50,523 @@ PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 FRONTEND_DIR = os.path.join(PROJECT_ROOT, 'frontend')
 LAB_DIR = os.path.join(os.path.dirname(__file__), 'labs')
 QUESTIONS_DIR = os.path.join(os.path.dirname(__file__), 'questions')
-WORKSPACE_DIR = os.path.join(PROJECT_ROOT, 'workspace')
+WORKSPACE_DIR = os.environ.get('LAB_WORKSPACE_DIR', os.path.join(PROJECT_ROOT, 'workspace'))
+
+# Command execution settings
+EXEC_MAX_WORKERS = int(os.environ.get('EXEC_MAX_WORKERS', '8'))
+EXEC_MAX_QUEUE = int(os.environ.get('EXEC_MAX_QUEUE', '64'))
+EXEC_QUEUE_TIMEOUT = float(os.environ.get('EXEC_QUEUE_TIMEOUT', '30'))
+VALIDATION_TIMEOUT = 10
+VALIDATION_CACHE_TTL = float(os.environ.get('VALIDATION_CACHE_TTL', '3'))
+VALIDATION_CACHE_SIZE = int(os.environ.get('VALIDATION_CACHE_SIZE', '1024'))
+VALIDATION_FAILURE_TTL = float(os.environ.get('VALIDATION_FAILURE_TTL', '0'))
+TERMINAL_TIMEOUT = 30
+BATCH_MAX_FANOUT = int(os.environ.get('BATCH_MAX_FANOUT', '4'))
+GRADE_MAX_CONCURRENCY = int(os.environ.get('GRADE_MAX_CONCURRENCY', '16'))
+OUTPUT_MAX_BYTES = int(os.environ.get('OUTPUT_MAX_BYTES', str(1024 * 1024)))
+STREAM_QUEUE_CHUNKS = 64
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '1024'))
+STATIC_CHECK_INTERVAL = float(os.environ.get('STATIC_CHECK_INTERVAL', '2'))
+QUESTIONS_PAGE_SIZE = int(os.environ.get('QUESTIONS_PAGE_SIZE', '100'))
+QUESTIONS_PAGE_MAX = 500
+
+# Sourced in every session shell opened by /api/bootstrap, and the commands
+# run alongside it whose output is returned to the browser
+SESSION_INIT_SCRIPT = os.environ.get('SESSION_INIT_SCRIPT', os.path.join(PROJECT_ROOT, 'scripts', 'oc_workspace_init.sh'))
+BOOTSTRAP_PROBES = [c.strip() for c in os.environ.get('BOOTSTRAP_PROBES', 'oc project -q').split(',') if c.strip()]
+BOOTSTRAP_MAX_PROBES = 4
+SESSION_BUFFER_BYTES = int(os.environ.get('SESSION_BUFFER_BYTES', str(256 * 1024)))
+STREAM_HEARTBEAT = 15
+SESSION_IDLE_TTL = float(os.environ.get('SESSION_IDLE_TTL', '3600'))
+SESSION_REAP_INTERVAL = float(os.environ.get('SESSION_REAP_INTERVAL', '60'))
+NAMESPACE_POOL_SIZE = int(os.environ.get('NAMESPACE_POOL_SIZE', '0'))
+NAMESPACE_POOL_PREFIX = os.environ.get('NAMESPACE_POOL_PREFIX', 'lab')
+NAMESPACE_DELETE_TIMEOUT = float(os.environ.get('NAMESPACE_DELETE_TIMEOUT', '120'))
+# Longest a named /api/create-namespace waits for the old namespace to go
+NAMESPACE_CREATE_WAIT = 5
+NAMESPACE_RETRY_AFTER = 5
+
+# Resource limits for student processes; 0 disables a limit
+SESSION_CPU_SECONDS = int(os.environ.get('SESSION_CPU_SECONDS', '20'))
+SESSION_MEMORY_MB = int(os.environ.get('SESSION_MEMORY_MB', '4096'))
+SESSION_MAX_PROCESSES = int(os.environ.get('SESSION_MAX_PROCESSES', '256'))
+SESSION_NPROC_RLIMIT = int(os.environ.get('SESSION_NPROC_RLIMIT', '0'))
+SESSION_FILE_MB = int(os.environ.get('SESSION_FILE_MB', '512'))
+SESSION_CPU_QUOTA = float(os.environ.get('SESSION_CPU_QUOTA', '1'))
+LAB_CGROUP_ROOT = os.environ.get('LAB_CGROUP_ROOT')
+
+# Command rate limits (commands per second, burst); a rate of 0 disables one
+SESSION_RATE_LIMIT = float(os.environ.get('SESSION_RATE_LIMIT', '2'))
+SESSION_RATE_BURST = float(os.environ.get('SESSION_RATE_BURST', '10'))
+IP_RATE_LIMIT = float(os.environ.get('IP_RATE_LIMIT', '20'))
+IP_RATE_BURST = float(os.environ.get('IP_RATE_BURST', '100'))
+# Proxies whose X-Forwarded-For is believed; other clients are keyed on their own address
+TRUSTED_PROXIES = {a.strip() for a in os.environ.get('TRUSTED_PROXIES', '').split(',') if a.strip()}
+# Worker processes sharing the port (set by serve.py); each keeps its own IP buckets
+WORKER_COUNT = max(1, int(os.environ.get('LAB_WORKERS', '1')))
+
+# Requests and commands slower than this are logged with their request id
+SLOW_LOG_SECONDS = float(os.environ.get('SLOW_LOG_SECONDS', '2'))
 
-# Dictionary to keep track of active sessions and their workspaces
-active_sessions = {}
+# Compiled question/lab bundle (see bundle.py), used when the file exists;
+# admin edits rebuild it in the background unless auto-rebuild is off
+LAB_BUNDLE = os.environ.get('LAB_BUNDLE', os.path.join(os.path.dirname(__file__), 'content.bundle'))
+BUNDLE_AUTO_REBUILD = os.environ.get('BUNDLE_AUTO_REBUILD', '1') == '1'
+BUNDLE_REBUILD_DELAY = float(os.environ.get('BUNDLE_REBUILD_DELAY', '1'))
+
+# Session workspaces: created on first command, archived once ended or idle
+WORKSPACE_QUOTA_MB = int(os.environ.get('WORKSPACE_QUOTA_MB', '1024'))
+WORKSPACE_ARCHIVE_DIR = os.environ.get('WORKSPACE_ARCHIVE_DIR', os.path.join(WORKSPACE_DIR, 'archive'))
+WORKSPACE_ARCHIVE_DELAY = float(os.environ.get('WORKSPACE_ARCHIVE_DELAY', '60'))
+WORKSPACE_IDLE_ARCHIVE = float(os.environ.get('WORKSPACE_IDLE_ARCHIVE', '86400'))
+WORKSPACE_SWEEP_INTERVAL = float(os.environ.get('WORKSPACE_SWEEP_INTERVAL', '3600'))
+WORKSPACE_QUOTA_INTERVAL = float(os.environ.get('WORKSPACE_QUOTA_INTERVAL', '10'))
+
+# Audit log of terminal commands and validation results (empty path disables it)
+AUDIT_DB = os.environ.get('LAB_AUDIT_DB', os.path.join(WORKSPACE_DIR, 'audit.db'))
+AUDIT_MAX_OUTPUT = int(os.environ.get('AUDIT_MAX_OUTPUT', '4096'))
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', '200'))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', '1'))
+AUDIT_QUEUE_SIZE = 10000
+AUDIT_QUERY_MAX = 1000
+
+# Multi-worker mode (see serve.py): sessions are shared through SQLite and
+# each worker listens on a private address so requests for a session can be
+# forwarded to the worker that owns its processes
+MULTI_WORKER = os.environ.get('LAB_MULTI_WORKER') == '1'
+SESSION_DB = os.environ.get('LAB_SESSION_DB', os.path.join(WORKSPACE_DIR, 'sessions.db'))
+# Per-boot secret (set by serve.py) proving a request was forwarded by a sibling worker
+FORWARD_SECRET = os.environ.get('LAB_FORWARD_SECRET', '')
+WORKER_ADDR = None
 
 # Setup workspaces directory
 os.makedirs(os.path.join(WORKSPACE_DIR, 'namespace'), exist_ok=True)
 
+# The one process (of serve.py's workers) that sweeps idle workspaces and pool leftovers
+sweeper_lock = SweeperLock(os.path.join(WORKSPACE_DIR, '.sweeper.lock'))
+
+# Active sessions and their workspaces; idle ones are reaped in the background
+active_sessions = SessionManager(
+    idle_ttl=SESSION_IDLE_TTL,
+    reap_interval=SESSION_REAP_INTERVAL,
+    store=SessionStore(SESSION_DB) if MULTI_WORKER else None
+)
+active_sessions.start_reaper()
+
+workspaces = WorkspaceStore(
+    os.path.join(WORKSPACE_DIR, 'namespace'),
+    WORKSPACE_ARCHIVE_DIR,
+    quota_mb=WORKSPACE_QUOTA_MB,
+    archive_delay=WORKSPACE_ARCHIVE_DELAY,
+    idle_after=WORKSPACE_IDLE_ARCHIVE,
+    sweep_interval=WORKSPACE_SWEEP_INTERVAL,
+    in_use=active_sessions.workspaces,
+    quota_interval=WORKSPACE_QUOTA_INTERVAL
+).start(sweeper=sweeper_lock.held)
+active_sessions.on_release = lambda session: workspaces.release(session.workspace)
+
+# Parsed question and lab trees, kept in memory between requests
+content_bundle = QuestionBundle(LAB_BUNDLE, check_interval=CATALOG_CHECK_INTERVAL)
+question_catalog = QuestionCatalog(QUESTIONS_DIR, bundle=content_bundle, tree='questions')
+lab_catalog = QuestionCatalog(LAB_DIR, validation_file='validate.json', bundle=content_bundle, tree='labs')
+question_files = QuestionFiles(QUESTIONS_DIR)
+question_index = QuestionIndex(question_catalog, check_interval=CATALOG_CHECK_INTERVAL).start()
+BUNDLE_TREES = {
+    'questions': (QUESTIONS_DIR, 'validation.json'),
+    'labs': (LAB_DIR, 'validate.json')
+}
+
+def bundle_built(changed):
+    question_catalog.bundle_built([i for tree, i in changed if tree == 'questions'])
+    lab_catalog.bundle_built([i for tree, i in changed if tree == 'labs'])
+
+bundle_builder = BundleBuilder(content_bundle, BUNDLE_TREES, delay=BUNDLE_REBUILD_DELAY, on_built=bundle_built)
+
+def question_changed(question_id):
+    """Reload an edited question and queue a bundle rebuild if one is in use"""
+    question_catalog.refresh(question_id)
+    question_index.update(question_id)
+    if BUNDLE_AUTO_REBUILD and content_bundle.available:
+        bundle_builder.schedule('questions', question_id)
+
+# Shared worker pool for validation and terminal commands
+executor = CommandExecutor(max_workers=EXEC_MAX_WORKERS, max_queue=EXEC_MAX_QUEUE, max_output=OUTPUT_MAX_BYTES)
+
+# Records are queued here and written in batches by a background thread
+audit_log = None
+if AUDIT_DB:
+    os.makedirs(os.path.dirname(os.path.abspath(AUDIT_DB)), exist_ok=True)
+    audit_log = AuditLog(
+        AUDIT_DB,
+        max_output=AUDIT_MAX_OUTPUT,
+        batch_size=AUDIT_BATCH_SIZE,
+        flush_interval=AUDIT_FLUSH_INTERVAL,
+        max_queue=AUDIT_QUEUE_SIZE
+    ).start()
+    # Write what is still queued when the server stops
+    atexit.register(audit_log.flush, 2)
+
+# Per-session and per-IP token buckets in front of the executor. Session-less
+# requests are spread over the workers, so each enforces its share of the IP limit
+command_limiter = RateLimiter({
+    'session': (SESSION_RATE_LIMIT, SESSION_RATE_BURST),
+    'ip': (IP_RATE_LIMIT / WORKER_COUNT, max(1, IP_RATE_BURST / WORKER_COUNT))
+})
+
+# rlimits (and per-session cgroups when LAB_CGROUP_ROOT is delegated to us)
+resource_limits = ResourceLimits(
+    cpu_seconds=SESSION_CPU_SECONDS,
+    memory_mb=SESSION_MEMORY_MB,
+    max_processes=SESSION_MAX_PROCESSES,
+    nproc_rlimit=SESSION_NPROC_RLIMIT,
+    file_mb=SESSION_FILE_MB,
+    cgroup_root=LAB_CGROUP_ROOT,
+    cpu_quota=SESSION_CPU_QUOTA
+)
+
+# Identical validations share one execution; passing ones are cached for a few
+# seconds, failing ones only for VALIDATION_FAILURE_TTL so a fix shows at once
+validation_cache = SingleFlightCache(
+    ttl=VALIDATION_CACHE_TTL,
+    max_entries=VALIDATION_CACHE_SIZE,
+    cacheable=lambda result: not (result.timed_out or result.cancelled),
+    failed=lambda result: result.returncode != 0,
+    failure_ttl=VALIDATION_FAILURE_TTL
+)
+
+# Step Markdown rendered to HTML once, and serialized/compressed question responses
+step_renderer = StepRenderer()
+response_cache = ResponseCache(max_entries=RESPONSE_CACHE_SIZE)
+
+# Frontend files in memory, fingerprinted and precompressed
+static_assets = StaticAssets(FRONTEND_DIR, check_interval=STATIC_CHECK_INTERVAL)
+static_assets.refresh()
+
+def run_namespace_command(command, timeout):
+    return executor.run(command, timeout=timeout, kind='namespace', queue_timeout=EXEC_QUEUE_TIMEOUT,
+                        client='namespace-admin')
+
+# Optional pool of warm namespaces handed out by /api/create-namespace
+namespace_pool = None
+if NAMESPACE_POOL_SIZE > 0:
+    namespace_pool = NamespacePool(
+        run_namespace_command,
+        size=NAMESPACE_POOL_SIZE,
+        prefix=NAMESPACE_POOL_PREFIX,
+        delete_timeout=NAMESPACE_DELETE_TIMEOUT
+    ).start(sweeper=sweeper_lock.held)
+
+# Optional list+watch cache of cluster objects for read-only validations
+resource_cache = ResourceCache.from_env()
+if resource_cache is not None:
+    resource_cache.start()
+
+# Runs step checks and grading; audit() and audit_scope() are defined below
+validator = Validator(
+    executor,
+    validation_cache,
+    resource_cache=resource_cache,
+    timeout=VALIDATION_TIMEOUT,
+    queue_timeout=EXEC_QUEUE_TIMEOUT,
+    fanout=BATCH_MAX_FANOUT,
+    max_concurrency=GRADE_MAX_CONCURRENCY,
+    audit=lambda kind, **fields: audit(kind, **fields),
+    scope=lambda **fields: audit_scope(**fields)
+)
+
+# Id of the request being served, also visible to the commands it queued
+request_id_var = contextvars.ContextVar('request_id', default=None)
+# Session, namespace, question and step that audit records of commands run now belong to
+audit_scope_var = contextvars.ContextVar('audit_scope', default={})
+
+@contextmanager
+def audit_scope(**fields):
+    """Attribute commands run (or queued) inside to these fields, on top of the enclosing scope"""
+    token = audit_scope_var.set(dict(audit_scope_var.get(), **{k: v for k, v in fields.items() if v is not None}))
+    try:
+        yield
+    finally:
+        audit_scope_var.reset(token)
+
+def session_audit_fields(session_id):
+    """Audit fields for a session id sent by the client: session_id only if it names a live session"""
+    if session_id and session_id in active_sessions:
+        return {'session_id': session_id}
+    return {'claimed_session_id': session_id or None}
+
+def audit(kind, **fields):
+    """Queue an audit record tagged with the current scope and request id"""
+    if audit_log is None:
+        return
+    scope = audit_scope_var.get()
+    fields = {name: value for name, value in fields.items() if value is not None or name not in scope}
+    audit_log.record(kind, request_id=request_id_var.get(), **dict(scope, **fields))
+
+# Metrics served at /metrics (per process)
+metrics = Registry()
+request_seconds = metrics.histogram('lab_http_request_duration_seconds', 'Request latency by route')
+command_seconds = metrics.histogram('lab_command_duration_seconds', 'Command spawn-to-exit time by kind')
+command_timeouts = metrics.counter('lab_command_timeouts_total', 'Commands killed at their timeout')
+question_load_seconds = metrics.histogram('lab_get_question_seconds', 'Time spent loading a question for /api/questions/<id>')
+validations_total = metrics.counter('lab_validations_total', 'Step checks by question and outcome')
+metrics.gauge('lab_validation_pass_ratio', 'Share of step checks that passed, per question',
+              fn=lambda: validation_pass_ratios())
+metrics.counter('lab_catalog_file_reads_total', 'Files read to (re)load questions and labs',
+                fn=lambda: question_catalog.stats()['file_reads'] + lab_catalog.stats()['file_reads'])
+metrics.counter('lab_catalog_loads_total', 'Question and lab (re)loads from disk',
+                fn=lambda: question_catalog.stats()['loads'] + lab_catalog.stats()['loads'])
+metrics.counter('lab_catalog_bundle_lookups_total', 'Question and lab lookups answered from the bundle',
+                fn=lambda: question_catalog.stats()['bundle_lookups'] + lab_catalog.stats()['bundle_lookups'])
+metrics.counter('lab_step_renders_total', 'Step Markdown renders (cache misses)',
+                fn=lambda: step_renderer.stats()['renders'])
+metrics.counter('lab_response_cache_hits_total', 'Question responses served from the response cache',
+                fn=lambda: response_cache.stats()['hits'])
+metrics.counter('lab_not_modified_total', 'Question responses answered with 304 Not Modified',
+                fn=lambda: response_cache.stats()['not_modified'])
+metrics.counter('lab_workspaces_archived_total', 'Workspaces packed into archives or deleted as empty',
+                fn=lambda: workspaces.stats()['archived'] + workspaces.stats()['deleted_empty'])
+metrics.counter('lab_workspaces_restored_total', 'Archived workspaces unpacked for a returning student',
+                fn=lambda: workspaces.stats()['restored'])
+metrics.counter('lab_audit_records_written_total', 'Audit records written to the audit database',
+                fn=lambda: audit_log.stats()['written'] if audit_log is not None else 0)
+metrics.counter('lab_audit_records_dropped_total', 'Audit records dropped because the write queue was full',
+                fn=lambda: audit_log.stats()['dropped'] if audit_log is not None else 0)
+metrics.gauge('lab_active_sessions', 'Sessions held by this process', fn=lambda: len(active_sessions))
+metrics.gauge('lab_live_child_processes', 'Session shells/processes and running commands',
+              fn=lambda: active_sessions.stats()['processes'] + executor.stats()['in_flight'])
+metrics.gauge('lab_executor_queue_depth', 'Commands waiting for a worker', fn=lambda: executor.stats()['queue_depth'])
+metrics.counter('lab_executor_rejected_total', 'Commands rejected because the queue was full',
+                fn=lambda: executor.stats()['rejected'])
+metrics.counter('lab_rate_limited_total', 'Requests refused by the rate limiter',
+                fn=lambda: [({'scope': scope}, limit['limited'])
+                            for scope, limit in command_limiter.stats()['limits'].items()])
+metrics.counter('lab_resource_limit_hits_total', 'Terminal commands stopped by a resource limit',
+                fn=lambda: [({'limit': name}, count) for name, count in resource_limits.stats()['hits'].items()])
+metrics.counter('lab_validation_cache_hits_total', 'Validations answered from the result cache',
+                fn=lambda: validation_cache.stats()['hits'])
+
+def validation_pass_ratios():
+    totals = {}
+    for _, labels, count in validations_total.samples():
+        labels = dict(labels)
+        passed, total = totals.get(labels['question'], (0, 0))
+        totals[labels['question']] = (passed + (count if labels['result'] == 'passed' else 0), total + count)
+    return [({'question': question}, passed / total) for question, (passed, total) in totals.items()]
+
+def record_validation(question, body):
+    if 'passed' in body:
+        validations_total.inc(question=question, result='passed' if body['passed'] else 'failed')
+    else:
+        validations_total.inc(question=question, result='error')
+
+def record_command(job, result):
+    """Executor hook: time every command and log slow ones with their request id"""
+    command_seconds.observe(result.duration, kind=job.kind)
+    if result.timed_out:
+        command_timeouts.inc(kind=job.kind)
+    if result.duration >= SLOW_LOG_SECONDS:
+        app.logger.warning("[%s] slow %s command: %.2fs rc=%s: %s", request_id_var.get() or '-',
+                           job.kind, result.duration, result.returncode, job.command)
+    if job.kind == 'terminal':
+        output = result.stdout
+        if result.stderr:
+            output = f"{output}\n{result.stderr}" if output else result.stderr
+        audit('terminal', command=job.command, exit_code=None if result.timed_out else result.returncode,
+              duration_ms=round(result.duration * 1000, 2), output=output, truncated=result.truncated)
+
+executor.on_complete = record_command
+
+@app.before_request
+def start_request():
+    """Assign a request id (kept across forwarding between workers) and start the timer"""
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    g.request_token = request_id_var.set(g.request_id)
+    g.request_started = time.monotonic()
+
+@app.after_request
+def finish_request(response):
+    """Record the route's latency and echo the request id"""
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    started = g.get('request_started')
+    if started is not None:
+        elapsed = time.monotonic() - started
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_seconds.observe(elapsed, route=route, method=request.method)
+        if elapsed >= SLOW_LOG_SECONDS:
+            app.logger.warning("[%s] slow request: %s %s -> %s in %.2fs", g.request_id,
+                               request.method, request.path, response.status_code, elapsed)
+    return response
+
+@app.teardown_request
+def reset_request_id(exc=None):
+    token = g.pop('request_token', None)
+    if token is not None:
+        request_id_var.reset(token)
+
+# Endpoints that need the worker holding the session's shell or process
+SESSION_ENDPOINTS = {
+    'delete_session', 'execute_command', 'get_session_output', 'stream_session_output',
+    'session_end', 'terminal_execute'
+}
+
+def start_worker_listener():
+    """Serve this worker's app on a private port for requests forwarded by other workers"""
+    from werkzeug.serving import make_server
+    
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='worker-listener', daemon=True).start()
+    return f"127.0.0.1:{server.server_port}"
+
+if MULTI_WORKER:
+    WORKER_ADDR = start_worker_listener()
+    active_sessions.owner = WORKER_ADDR
+
+def forward_request(owner):
+    """Proxy the current request to the worker at `owner` and relay its response"""
+    headers = {'X-Lab-Forwarded': FORWARD_SECRET, 'X-Forwarded-For': client_address(), 'X-Request-ID': g.request_id}
+    for name in ('Content-Type', 'Last-Event-ID', 'Accept'):
+        if name in request.headers:
+            headers[name] = request.headers[name]
+    
+    upstream_request = urllib.request.Request(
+        f"http://{owner}{request.full_path}",
+        data=request.get_data() or None,
+        headers=headers,
+        method=request.method
+    )
+    try:
+        upstream = urllib.request.urlopen(upstream_request, timeout=TERMINAL_TIMEOUT + EXEC_QUEUE_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        upstream = e
+    
+    content_type = upstream.headers.get('Content-Type', 'application/json')
+    if content_type.startswith('text/event-stream'):
+        def relay():
+            with upstream:
+                for line in upstream:
+                    yield line
+        return Response(relay(), status=upstream.status, content_type=content_type,
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
+    with upstream:
+        body = upstream.read()
+    return Response(body, status=upstream.status, content_type=content_type)
+
+def is_forwarded():
+    """Whether the request was forwarded by a sibling worker (a client can't forge the secret)"""
+    forwarded = request.headers.get('X-Lab-Forwarded', '')
+    return bool(FORWARD_SECRET) and hmac.compare_digest(forwarded.encode(), FORWARD_SECRET.encode())
+
+@app.before_request
+def route_to_session_owner():
+    """Sticky routing: run session requests on the worker that owns the session"""
+    if WORKER_ADDR is None or request.endpoint not in SESSION_ENDPOINTS:
+        return None
+    if is_forwarded():
+        return None
+    
+    session_id = (request.view_args or {}).get('session_id')
+    if session_id is None:
+        session_id = (request.get_json(silent=True) or {}).get('sessionId')
+    if not session_id:
+        return None
+    
+    owner = active_sessions.owner_of(session_id)
+    if owner is None or owner == WORKER_ADDR:
+        return None
+    
+    try:
+        return forward_request(owner)
+    except urllib.error.URLError as e:
+        if isinstance(e.reason, ConnectionRefusedError):
+            # Nothing listens on the owner's port: it is gone, take the session over here
+            active_sessions.adopt(session_id)
+            return None
+        if isinstance(e.reason, (TimeoutError, socket.timeout)):
+            # Alive but slow; adopting would split the session across two workers
+            return jsonify({"error": "The worker holding this session did not answer in time"}), 504
+        return jsonify({"error": f"Failed to reach the worker holding this session: {e.reason}"}), 502
+    except (TimeoutError, socket.timeout):
+        return jsonify({"error": "The worker holding this session did not answer in time"}), 504
+
+def client_address():
+    """Caller IP, as reported by the forwarding worker or a trusted proxy"""
+    if request.remote_addr == '127.0.0.1' and is_forwarded():
+        return request.headers.get('X-Forwarded-For', request.remote_addr)
+    if request.remote_addr in TRUSTED_PROXIES:
+        # The nearest hop not added by one of our own proxies
+        hops = [hop.strip() for hop in request.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+        for hop in reversed(hops):
+            if hop not in TRUSTED_PROXIES:
+                return hop
+    return request.remote_addr
+
+def throttle(session_id=None, cost=1):
+    """Take command tokens for the caller; returns seconds to wait if over its rate, else 0
+
+    Requests of a known session are limited per session only, so a class
+    behind one NAT address does not share a budget; anything else (no or an
+    unknown session id) is limited per client address.
+    """
+    if session_id and session_id in active_sessions:
+        keys = {'session': session_id}
+    else:
+        keys = {'ip': client_address()}
+    wait = command_limiter.acquire(cost, **keys)
+    if wait:
+        g.retry_after = math.ceil(wait)
+    return wait
+
+@app.after_request
+def add_retry_after(response):
+    """Tell throttled or rejected clients when to come back"""
+    if response.status_code in (429, 503) and 'Retry-After' not in response.headers:
+        response.headers['Retry-After'] = str(g.get('retry_after') or executor.retry_after())
+    return response
+
+def send_cached(cached, cache_control='no-cache'):
+    """Serve a CachedBody with its strong ETag, compressed as the client accepts"""
+    if request.if_none_match.contains(cached.etag):
+        response = Response(status=304)
+    else:
+        data, encoding = cached.encoded(choose_encoding(request.headers.get('Accept-Encoding')))
+        response = Response(data, mimetype=cached.mimetype)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(cached.etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def cached_response(key, build):
+    """Serve a JSON body cached under `key`; revalidated every time, so an unchanged one costs a 304"""
+    response = send_cached(response_cache.get(key, lambda: app.json.dumps(build()).encode()))
+    if response.status_code == 304:
+        response_cache.not_modified()
+    return response
+
+def send_asset(path):
+    asset = static_assets.get(path)
+    if asset is None:
+        return "File not found", 404
+    return send_cached(asset.cached, asset.cache_control)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text exposition of this process's metrics"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/')
 def index():
-    return send_from_directory(FRONTEND_DIR, 'index.html')
+    return send_asset('index.html')
 
 @app.route('/admin')
 def admin():
-    return send_from_directory(FRONTEND_DIR, 'admin.html')
+    return send_asset('admin.html')
 
 @app.route('/<path:path>')
 def serve_static(path):
-    if os.path.exists(os.path.join(FRONTEND_DIR, path)):
-        return send_from_directory(FRONTEND_DIR, path)
-    return "File not found", 404
+    return send_asset(path)
 
 @app.route('/labs/<lab_name>/<path:path>')
 def serve_lab_content(lab_name, path):
@@ -52,99 +584,124 @@ def serve_question_file(question_id, path):
 
 @app.route('/api/questions')
 def get_questions():
+    """Questions matching q/tag/difficulty, one page at a time
+
+    The body stays a plain list; X-Total-Count carries the number of
+    matches and, when there are more, X-Next-Cursor and a rel="next" Link
+    header carry the cursor for the following page. Without limit or
+    cursor every match is returned, as before paging existed.
+    """
     try:
-        questions = []
         # Check if questions directory exists
-        if not os.path.exists(QUESTIONS_DIR):
+        if not os.path.exists(QUESTIONS_DIR) and not content_bundle.available:
             return jsonify({"error": "Questions directory not found"}), 404
-            
-        # List all question directories
-        for question_id in os.listdir(QUESTIONS_DIR):
-            question_dir = os.path.join(QUESTIONS_DIR, question_id)
-            if os.path.isdir(question_dir):
-                # Load metadata if exists
-                metadata_path = os.path.join(question_dir, 'metadata.json')
-                if os.path.exists(metadata_path):
-                    with open(metadata_path, 'r') as f:
-                        metadata = json.load(f)
-                        questions.append({
-                            'id': question_id,
-                            'title': metadata.get('title', question_id),
-                            'description': metadata.get('description', '')
-                        })
-                else:
-                    # Add question without metadata
-                    questions.append({
-                        'id': question_id,
-                        'title': question_id,
-                        'description': ''
-                    })
-                    
-        return jsonify(questions)
+
+        q = request.args.get('q', '').strip()
+        tags = [t.strip() for value in request.args.getlist('tag') for t in value.split(',') if t.strip()]
+        difficulty = request.args.get('difficulty', '').strip() or None
+        sort = request.args.get('sort') or None
+        cursor = request.args.get('cursor') or None
+        if 'limit' in request.args or cursor:
+            try:
+                limit = int(request.args.get('limit', QUESTIONS_PAGE_SIZE))
+            except ValueError:
+                return jsonify({"error": "limit must be an integer"}), 400
+            limit = max(1, min(limit, QUESTIONS_PAGE_MAX))
+        else:
+            limit = None
+
+        # Searched in the in-memory index rather than by walking the catalog
+        try:
+            ids, next_cursor, total = question_index.search(q, tags, difficulty, sort, limit, cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        def build():
+            questions = []
+            for question_id in ids:
+                entry = question_catalog.get(question_id)
+                if entry is None:
+                    continue
+                metadata = entry['metadata']
+                question = {
+                    'id': entry['id'],
+                    'title': metadata.get('title', entry['id']),
+                    'description': metadata.get('description', '')
+                }
+                for field in ('tags', 'difficulty'):
+                    if field in metadata:
+                        question[field] = metadata[field]
+                questions.append(question)
+            return questions
+
+        key = ('questions', question_index.generation, q, tuple(tags), difficulty, sort, limit, cursor)
+        response = cached_response(key, build)
+        response.headers['X-Total-Count'] = str(total)
+        if next_cursor is not None:
+            args = request.args.to_dict(flat=False)
+            args['cursor'] = [next_cursor]
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{request.base_url}?{urlencode(args, doseq=True)}>; rel="next"'
+        return response
     except Exception as e:
         return jsonify({"error": f"Failed to load questions: {str(e)}"}), 500
 
+@app.route('/api/questions/facets')
+def get_question_facets():
+    """Tags and difficulties usable as /api/questions filters, with counts"""
+    return jsonify(question_index.facets())
+
 @app.route('/api/questions/<question_id>')
 def get_question(question_id):
-    question_dir = os.path.join(QUESTIONS_DIR, question_id)
-    
-    if not os.path.exists(question_dir):
-        return jsonify({"error": "Question not found"}), 404
-    
     try:
-        # Load metadata
-        metadata_path = os.path.join(question_dir, 'metadata.json')
-        if os.path.exists(metadata_path):
-            with open(metadata_path, 'r') as f:
-                metadata = json.load(f)
-        else:
-            metadata = {'title': question_id, 'description': ''}
-        
-        # Load steps
-        steps = []
-        steps_dir = os.path.join(question_dir, 'steps')
-        if os.path.exists(steps_dir):
-            step_files = sorted([f for f in os.listdir(steps_dir) if f.endswith('.md')], 
-                               key=lambda x: int(x.split('.')[0]))
-            
-            for step_file in step_files:
-                with open(os.path.join(steps_dir, step_file), 'r') as f:
-                    step_content = f.read()
-                    step_number = step_file.split('.')[0]
-                    steps.append({
-                        'id': step_number,
-                        'content': step_content
-                    })
+        started = time.monotonic()
+        entry = question_catalog.get(question_id)
+        question_load_seconds.observe(time.monotonic() - started)
+        if entry is None:
+            return jsonify({"error": "Question not found"}), 404
         
-        # Combine data
-        question_data = {
-            'id': question_id,
-            'title': metadata.get('title', question_id),
-            'description': metadata.get('description', ''),
-            'steps': steps
-        }
-        
-        return jsonify(question_data)
+        return cached_response(('question', question_id, entry['revision']), lambda: question_payload(entry))
     except Exception as e:
         return jsonify({"error": f"Error loading question: {str(e)}"}), 500
 
+def question_payload(entry):
+    """Question as sent to the browser; steps carry their Markdown and the rendered HTML"""
+    metadata = entry['metadata']
+    return {
+        'id': entry['id'],
+        'title': metadata.get('title', entry['id']),
+        'description': metadata.get('description', ''),
+        'tags': metadata.get('tags', []),
+        'difficulty': metadata.get('difficulty', ''),
+        # Bumped by every admin edit; send it back to make edits conditional
+        'version': metadata.get('version', 0),
+        'steps': [
+            {'id': step['id'], 'content': step['content'], 'html': step_renderer.render(step['content'])}
+            for step in entry['steps']
+        ]
+    }
+
 @app.route('/api/validate', methods=['POST'])
 def validate():
     data = request.json
     if not data:
         return jsonify({"error": "No data provided"}), 400
     
+    if throttle(data.get('sessionId')):
+        return jsonify({"error": f"Too many checks, try again in {g.retry_after}s"}), 429
+    
     lab = data.get('lab')
     question_id = data.get('question_id')
     step = str(data.get('step'))
     
     # Check if this is a lab validation or a question validation
-    if lab:
-        return validate_lab(lab, step)
-    elif question_id:
-        return validate_question(question_id, step)
-    else:
-        return jsonify({"error": "Missing lab or question_id parameter"}), 400
+    with audit_scope(question_id=lab or question_id, step=step, **session_audit_fields(data.get('sessionId'))):
+        if lab:
+            return validate_lab(lab, step)
+        elif question_id:
+            return validate_question(question_id, step)
+        else:
+            return jsonify({"error": "Missing lab or question_id parameter"}), 400
 
 def validate_lab(lab, step):
     if not lab or step is None:
@@ -152,21 +709,21 @@ def validate_lab(lab, step):
     
     # Load the validation commands
     try:
-        validate_path = os.path.join(LAB_DIR, lab, 'validate.json')
-        with open(validate_path, 'r') as f:
-            validation_commands = json.load(f)
+        validation_commands = lab_catalog.validation(lab)
     except FileNotFoundError:
         return jsonify({"error": f"Lab '{lab}' not found"}), 404
     except json.JSONDecodeError:
         return jsonify({"error": "Invalid validation file format"}), 500
     
     # Get the validation command for this step
-    command = validation_commands.get(step)
-    if not command:
+    entry = validation_commands.get(step)
+    if not entry:
         return jsonify({"error": f"Step {step} not found for lab '{lab}'"}), 404
     
     # Run the command
-    return run_validation_command(command)
+    body, status = validator.run(entry)
+    record_validation(lab, body)
+    return jsonify(body), status
 
 def validate_question(question_id, step):
     if not question_id or step is None:
@@ -174,87 +731,171 @@ def validate_question(question_id, step):
     
     # Load the validation commands
     try:
-        validate_path = os.path.join(QUESTIONS_DIR, question_id, 'validation.json')
-        with open(validate_path, 'r') as f:
-            validation_commands = json.load(f)
+        validation_commands = question_catalog.validation(question_id)
     except FileNotFoundError:
         return jsonify({"error": f"Question '{question_id}' validation not found"}), 404
     except json.JSONDecodeError:
         return jsonify({"error": "Invalid validation file format"}), 500
     
     # Get the validation command for this step
-    command = validation_commands.get(step)
-    if not command:
+    entry = validation_commands.get(step)
+    if not entry:
         return jsonify({"error": f"Step {step} not found for question '{question_id}'"}), 404
     
     # Replace any environment variables
     namespace = request.json.get('namespace', '')
     if namespace:
-        command = command.replace('${NAMESPACE}', namespace)
+        entry = substitute_namespace(entry, namespace)
     
     # Run the command
-    return run_validation_command(command)
+    body, status = validator.run(entry, namespace)
+    record_validation(question_id, body)
+    return jsonify(body), status
 
-def run_validation_command(command):
+@app.route('/api/validate/batch', methods=['POST'])
+def validate_batch():
+    """Validate every step of a question or lab concurrently"""
+    data = request.json
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    if throttle(data.get('sessionId')):
+        return jsonify({"error": f"Too many checks, try again in {g.retry_after}s"}), 429
+    
+    lab = data.get('lab')
+    question_id = data.get('question_id')
+    namespace = data.get('namespace', '')
+    early_exit = bool(data.get('early_exit', False))
+    
+    # Load the validation commands
     try:
-        result = subprocess.run(
-            command,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=10  # Timeout after 10 seconds
-        )
-        
-        passed = result.returncode == 0
-        output = result.stdout.strip() if passed else result.stderr.strip()
-        
-        return jsonify({
+        if lab:
+            validation_commands = lab_catalog.validation(lab)
+        elif question_id:
+            validation_commands = question_catalog.validation(question_id)
+        else:
+            return jsonify({"error": "Missing lab or question_id parameter"}), 400
+    except FileNotFoundError:
+        return jsonify({"error": f"'{lab or question_id}' validation not found"}), 404
+    except json.JSONDecodeError:
+        return jsonify({"error": "Invalid validation file format"}), 500
+    
+    entries = validation_commands
+    if question_id and namespace:
+        entries = substitute_namespace(entries, namespace)
+    
+    started = time.monotonic()
+    with audit_scope(question_id=lab or question_id, **session_audit_fields(data.get('sessionId'))):
+        steps = validator.run_batch(entries, namespace, early_exit=early_exit)
+    for step in steps:
+        if step['status'] != 'skipped':
+            validations_total.inc(question=lab or question_id, result=step['status'])
+    
+    return jsonify({
+        "lab": lab,
+        "question_id": question_id,
+        "namespace": namespace,
+        "passed": bool(steps) and all(step['passed'] for step in steps),
+        "steps": steps,
+        "duration_ms": round((time.monotonic() - started) * 1000, 1)
+    })
+
+@app.route('/api/admin/grade', methods=['POST'])
+def admin_grade():
+    """Grade a question across many student namespaces, streamed as NDJSON"""
+    data = request.json
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    question_id = data.get('question_id')
+    if not question_id:
+        return jsonify({"error": "No question ID provided"}), 400
+    
+    try:
+        validation_commands = question_catalog.validation(question_id)
+    except FileNotFoundError:
+        return jsonify({"error": f"Question '{question_id}' validation not found"}), 404
+    except json.JSONDecodeError:
+        return jsonify({"error": "Invalid validation file format"}), 500
+    
+    namespaces = data.get('namespaces') or []
+    pattern = data.get('pattern')
+    if pattern:
+        try:
+            namespaces = sorted(set(namespaces) | set(validator.list_namespaces(pattern)))
+        except Exception as e:
+            return jsonify({"error": f"Failed to list namespaces: {str(e)}"}), 502
+    if not namespaces:
+        return jsonify({"error": "No namespaces provided"}), 400
+    
+    try:
+        concurrency = int(data.get('concurrency', GRADE_MAX_CONCURRENCY))
+    except (TypeError, ValueError):
+        return jsonify({"error": "concurrency must be an integer"}), 400
+    
+    def generate():
+        started = time.monotonic()
+        passed = 0
+        for result in validator.grade(question_id, validation_commands, namespaces, concurrency):
+            passed += result['passed']
+            yield json.dumps(result) + "\n"
+        yield json.dumps({"summary": {
+            "question_id": question_id,
+            "namespaces": len(namespaces),
             "passed": passed,
-            "output": output or "Command executed successfully"
-        })
-    except subprocess.TimeoutExpired:
-        return jsonify({
-            "passed": False,
-            "output": "Command timed out after 10 seconds"
-        })
-    except Exception as e:
-        return jsonify({
-            "passed": False,
-            "output": f"Error executing command: {str(e)}"
-        }), 500
+            "duration_ms": round((time.monotonic() - started) * 1000, 1)
+        }}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/api/create-namespace', methods=['POST'])
 def create_namespace():
     data = request.json
-    if not data:
+    if data is None:
         return jsonify({"error": "No data provided"}), 400
     
     namespace = data.get('namespace')
     if not namespace:
-        return jsonify({"error": "No namespace provided"}), 400
+        if namespace_pool is None:
+            return jsonify({"error": "No namespace provided"}), 400
+        
+        # Hand out a clean namespace from the warm pool
+        namespace = namespace_pool.acquire()
+        if namespace is None:
+            return jsonify({
+                "success": False,
+                "message": "No namespace available, try again shortly"
+            }), 503
+        return jsonify({
+            "success": True,
+            "namespace": namespace,
+            "pooled": True,
+            "message": f"Namespace '{namespace}' created successfully"
+        })
     
     try:
-        # Delete namespace if it exists
-        subprocess.run(
-            f"oc delete namespace {namespace} --ignore-not-found",
-            shell=True,
-            capture_output=True,
-            text=True,
+        # Delete namespace if it exists and give the cluster a moment to
+        # finish terminating it, otherwise the create below fails; if it
+        # takes longer the client retries instead of holding this thread
+        run_namespace_command(
+            f"oc delete namespace {shlex.quote(namespace)} --ignore-not-found --wait=false",
             timeout=10
         )
+        if not wait_for_deletion(run_namespace_command, namespace, NAMESPACE_CREATE_WAIT):
+            response = jsonify({
+                "success": False,
+                "message": f"Namespace '{namespace}' is still terminating, try again shortly"
+            })
+            response.headers['Retry-After'] = str(NAMESPACE_RETRY_AFTER)
+            return response, 409
         
         # Create namespace
-        result = subprocess.run(
-            f"oc create namespace {namespace}",
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
+        result = run_namespace_command(f"oc create namespace {shlex.quote(namespace)}", timeout=10)
         
         if result.returncode == 0:
             return jsonify({
                 "success": True,
+                "namespace": namespace,
                 "message": f"Namespace '{namespace}' created successfully"
             })
         else:
@@ -262,12 +903,42 @@ def create_namespace():
                 "success": False,
                 "message": result.stderr.strip() or "Failed to create namespace"
             })
+    except QueueFull as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 503
     except Exception as e:
         return jsonify({
             "success": False,
             "message": str(e)
         }), 500
 
+@app.route('/api/release-namespace', methods=['POST'])
+def release_namespace():
+    """Return a pooled namespace so it is recycled in the background"""
+    data = request.json
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    namespace = data.get('namespace')
+    if not namespace:
+        return jsonify({"error": "No namespace provided"}), 400
+    
+    # Leases of sibling workers are recognised by the namespace's pool label
+    released = namespace_pool is not None and namespace_pool.release(namespace)
+    if not released:
+        return jsonify({"error": f"Namespace '{namespace}' is not leased from the pool"}), 404
+    
+    return jsonify({"success": True, "message": f"Namespace '{namespace}' released"})
+
+@app.route('/api/admin/namespace-pool', methods=['GET'])
+def admin_namespace_pool_stats():
+    """Hits, misses and recycle latency of the namespace pool"""
+    if namespace_pool is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(namespace_pool.stats(), enabled=True))
+
 @app.route('/api/admin/questions', methods=['GET'])
 def admin_get_questions():
     """Get all questions for admin panel"""
@@ -285,7 +956,7 @@ def admin_create_question():
         return jsonify({"error": "No question ID provided"}), 400
     
     # Validate question ID format
-    if not question_id.replace('-', '').isalnum():
+    if not valid_question_id(question_id):
         return jsonify({"error": "Question ID must contain only letters, numbers, and hyphens"}), 400
     
     question_dir = os.path.join(QUESTIONS_DIR, question_id)
@@ -293,95 +964,162 @@ def admin_create_question():
         return jsonify({"error": f"Question '{question_id}' already exists"}), 409
     
     try:
-        # Create question directory structure
-        os.makedirs(question_dir, exist_ok=True)
-        os.makedirs(os.path.join(question_dir, 'steps'), exist_ok=True)
-        
-        # Create metadata.json
         metadata = {
             'title': data.get('title', 'New Question'),
             'description': data.get('description', '')
         }
-        with open(os.path.join(question_dir, 'metadata.json'), 'w') as f:
-            json.dump(metadata, f, indent=2)
-        
-        # Create empty validation.json
-        with open(os.path.join(question_dir, 'validation.json'), 'w') as f:
-            json.dump({}, f, indent=2)
-        
-        # Create first step
-        with open(os.path.join(question_dir, 'steps', '1.md'), 'w') as f:
-            f.write("# Step 1: Create your namespace\n\n"
-                   "Enter a name for your namespace in the field above and click \"Create Namespace\" button.\n\n"
-                   "**Note:** If the namespace already exists, it will be deleted and recreated.\n\n"
-                   "After you've created your namespace, click the \"Check\" button to verify and proceed to the next step.")
+        metadata.update(filter_fields(data))
+        # Start with an empty validation map and a first step
+        first_step = ("# Step 1: Create your namespace\n\n"
+                      "Enter a name for your namespace in the field above and click \"Create Namespace\" button.\n\n"
+                      "**Note:** If the namespace already exists, it will be deleted and recreated.\n\n"
+                      "After you've created your namespace, click the \"Check\" button to verify and proceed to the next step.")
+        version = question_files.create(question_id, metadata, {}, {'1': first_step})
         
-        return jsonify({"success": True, "id": question_id}), 201
+        question_changed(question_id)
+        return jsonify({"success": True, "id": question_id, "version": version}), 201
     except Exception as e:
         return jsonify({"error": f"Failed to create question: {str(e)}"}), 500
 
 @app.route('/api/admin/questions/<question_id>', methods=['GET'])
 def admin_get_question(question_id):
-    """Get a question for admin editing"""
-    return get_question(question_id)
+    """Get a question for admin editing; the ETag is its version, to be sent back in If-Match"""
+    response = get_question(question_id)
+    entry = question_catalog.get(question_id)
+    if isinstance(response, Response) and entry is not None:
+        response.set_etag(version_etag(entry['metadata'].get('version', 0)), weak=True)
+        response.headers['Cache-Control'] = 'no-store'
+    return response
 
 @app.route('/api/admin/questions/<question_id>', methods=['PUT'])
 def admin_update_question(question_id):
-    """Update a question"""
+    """Update a question, writing only the files that changed"""
     data = request.json
     if not data:
         return jsonify({"error": "No data provided"}), 400
     
-    question_dir = os.path.join(QUESTIONS_DIR, question_id)
-    if not os.path.exists(question_dir):
-        return jsonify({"error": f"Question '{question_id}' not found"}), 404
+    steps = {}
+    for step in data.get('steps', []):
+        step_id = str(step.get('id'))
+        if not valid_step_id(step_id):
+            return jsonify({"error": f"Invalid step id '{step_id}'"}), 400
+        steps[step_id] = step.get('content', '')
     
-    try:
-        # Update metadata
-        metadata = {
+    return update_question_files(
+        question_id,
+        data,
+        metadata=dict({
             'title': data.get('title', ''),
             'description': data.get('description', '')
-        }
-        with open(os.path.join(question_dir, 'metadata.json'), 'w') as f:
-            json.dump(metadata, f, indent=2)
-        
-        # Update steps
-        steps_dir = os.path.join(question_dir, 'steps')
-        os.makedirs(steps_dir, exist_ok=True)
-        
-        # Remove existing steps
-        for file in os.listdir(steps_dir):
-            if file.endswith('.md'):
-                os.remove(os.path.join(steps_dir, file))
-        
-        # Add new steps
-        steps = data.get('steps', [])
-        for step in steps:
-            step_id = step.get('id')
-            content = step.get('content', '')
-            with open(os.path.join(steps_dir, f"{step_id}.md"), 'w') as f:
-                f.write(content)
-        
-        # Update validations
-        validations = data.get('validations', {})
-        with open(os.path.join(question_dir, 'validation.json'), 'w') as f:
-            json.dump(validations, f, indent=2)
-        
-        return jsonify({"success": True, "id": question_id})
+        }, **filter_fields(data)),
+        steps=steps,
+        replace_steps=True,
+        validation=data.get('validations', {}),
+        replace_validation=True
+    )
+
+@app.route('/api/admin/questions/<question_id>', methods=['PATCH'])
+def admin_patch_question(question_id):
+    """Change a question's title, description, tags and/or difficulty"""
+    data = request.json
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    metadata = {name: data[name] for name in ('title', 'description') if name in data}
+    metadata.update(filter_fields(data))
+    return update_question_files(question_id, data, metadata=metadata)
+
+@app.route('/api/admin/questions/<question_id>/steps/<step_id>', methods=['PATCH'])
+def admin_patch_step(question_id, step_id):
+    """Write one step's Markdown ("content": null deletes the step)"""
+    data = request.json
+    if not data or 'content' not in data:
+        return jsonify({"error": "No content provided"}), 400
+    if not valid_step_id(step_id):
+        return jsonify({"error": f"Invalid step id '{step_id}'"}), 400
+    
+    return update_question_files(question_id, data, steps={step_id: data['content']})
+
+@app.route('/api/admin/questions/<question_id>/validations/<step_id>', methods=['PATCH'])
+def admin_patch_validation(question_id, step_id):
+    """Set one step's check ("validation": null removes it)"""
+    data = request.json
+    if not data or 'validation' not in data:
+        return jsonify({"error": "No validation provided"}), 400
+    if not valid_step_id(step_id):
+        return jsonify({"error": f"Invalid step id '{step_id}'"}), 400
+    
+    return update_question_files(question_id, data, validation={step_id: data['validation']})
+
+def filter_fields(data):
+    """The search filter fields (tags, difficulty) given in an edit, normalized"""
+    fields = {}
+    if 'tags' in data:
+        tags = data['tags'] or []
+        if isinstance(tags, str):
+            tags = tags.split(',')
+        fields['tags'] = [str(tag).strip() for tag in tags if str(tag).strip()]
+    if 'difficulty' in data:
+        fields['difficulty'] = str(data['difficulty'] or '').strip()
+    return fields
+
+def version_etag(version):
+    return f'v{version}'
+
+def expected_version(data):
+    """Version the editor last read, from If-Match or the body's "version" (None if not given)
+
+    If-Match takes the admin GET's ETag (W/"v4") or a bare version ("4").
+    Raises ValueError for anything else.
+    """
+    for tag in request.if_match.as_set(include_weak=True):
+        tag = tag[1:] if tag.startswith('v') else tag
+        if not tag.isdigit():
+            raise ValueError(tag)
+        return int(tag)
+    version = data.get('version')
+    if version is None:
+        return None
+    if isinstance(version, bool) or not isinstance(version, (int, str)) or not str(version).isdigit():
+        raise ValueError(version)
+    return int(version)
+
+def update_question_files(question_id, data, **changes):
+    """Apply an admin edit atomically and report the question's new version"""
+    if not valid_question_id(question_id):
+        return jsonify({"error": f"Question '{question_id}' not found"}), 404
+    
+    try:
+        expected = expected_version(data)
+    except ValueError:
+        return jsonify({"error": "version must be a number"}), 400
+    
+    try:
+        version, changed = question_files.update(question_id, expected_version=expected, **changes)
+        if changed:
+            question_changed(question_id)
+        response = jsonify({"success": True, "id": question_id, "version": version, "changed": changed})
+        response.set_etag(version_etag(version), weak=True)
+        return response
+    except VersionConflict as e:
+        return jsonify({"error": str(e), "version": e.current}), 412
+    except FileNotFoundError:
+        return jsonify({"error": f"Question '{question_id}' not found"}), 404
     except Exception as e:
         return jsonify({"error": f"Failed to update question: {str(e)}"}), 500
 
 @app.route('/api/admin/questions/<question_id>', methods=['DELETE'])
 def admin_delete_question(question_id):
     """Delete a question"""
-    question_dir = os.path.join(QUESTIONS_DIR, question_id)
-    if not os.path.exists(question_dir):
+    if not valid_question_id(question_id):
         return jsonify({"error": f"Question '{question_id}' not found"}), 404
     
     try:
-        import shutil
-        shutil.rmtree(question_dir)
+        question_files.delete(question_id)
+        question_changed(question_id)
         return jsonify({"success": True})
+    except FileNotFoundError:
+        return jsonify({"error": f"Question '{question_id}' not found"}), 404
     except Exception as e:
         return jsonify({"error": f"Failed to delete question: {str(e)}"}), 500
 
@@ -399,27 +1137,35 @@ def create_session():
     # Create a unique session ID
     session_id = str(uuid.uuid4())
     
-    # Create session directory
-    session_dir = os.path.join(WORKSPACE_DIR, 'namespace', namespace, session_id)
-    os.makedirs(session_dir, exist_ok=True)
-    
-    # Create a new terminal session
+    # Create a new terminal session; its shell starts in the workspace right away
+    session_dir = workspaces.path(namespace, session_id)
     try:
+        workspaces.ensure(session_dir)
+        env = os.environ.copy()
+        env['KUBECONFIG'] = workspaces.kubeconfig(session_dir)
+        cgroup = resource_limits.cgroup(session_id)
         process = subprocess.Popen(
-            ['bash'],
+            resource_limits.wrapper(cgroup, cpu=False) + ['bash'],
             cwd=session_dir,
+            env=env,
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True
+            bufsize=0
         )
+        # Into the session's cgroup before it reads its first command
+        resource_limits.started(process, cgroup)
         
-        # Store the process and session info
-        active_sessions[session_id] = {
-            'process': process,
-            'namespace': namespace,
-            'workspace': session_dir
-        }
+        # Store the process and session info; output is read by background threads
+        session_info = Session(
+            session_id,
+            session_dir,
+            namespace=namespace,
+            process=process,
+            output=SessionOutput(process, max_bytes=SESSION_BUFFER_BYTES)
+        )
+        session_info.cgroup = cgroup
+        active_sessions.add(session_info)
         
         return jsonify({
             "success": True,
@@ -435,21 +1181,14 @@ def create_session():
 @app.route('/api/sessions/<session_id>', methods=['DELETE'])
 def delete_session(session_id):
     """Delete a terminal session"""
-    session_info = active_sessions.get(session_id)
-    if not session_info:
+    if session_id not in active_sessions:
         return jsonify({"error": f"Session '{session_id}' not found"}), 404
     
     try:
-        # Terminate the process
-        session_info['process'].terminate()
-        
-        # Wait for the process to terminate
-        session_info['process'].wait(timeout=5)
+        # Remove the session, then terminate and reap its process
+        active_sessions.end(session_id)
     except Exception as e:
         return jsonify({"error": f"Failed to terminate session: {str(e)}"}), 500
-    finally:
-        # Remove the session from active sessions
-        active_sessions.pop(session_id, None)
     
     return jsonify({"success": True, "message": f"Session '{session_id}' deleted successfully"})
 
@@ -457,7 +1196,7 @@ def delete_session(session_id):
 def execute_command(session_id):
     """Execute a command in the terminal session"""
     session_info = active_sessions.get(session_id)
-    if not session_info:
+    if session_info is None or session_info.process is None:
         return jsonify({"error": f"Session '{session_id}' not found"}), 404
     
     data = request.json
@@ -465,10 +1204,22 @@ def execute_command(session_id):
     if not command:
         return jsonify({"error": "No command provided"}), 400
     
+    if throttle(session_id):
+        return jsonify({"error": f"Too many commands, try again in {g.retry_after}s"}), 429
+    
+    # The same cached check as /api/terminal/execute
+    if workspaces.over_quota(session_info.workspace) and not is_cleanup_command(command):
+        return jsonify({"error": quota_message()}), 507
+    
     try:
-        # Execute the command
-        session_info['process'].stdin.write(command + '\n')
-        session_info['process'].stdin.flush()
+        # Execute the command, with CPU seconds counted from here rather than from the shell's start
+        resource_limits.limit_command(session_info.process)
+        session_info.process.stdin.write((command + '\n').encode())
+        session_info.process.stdin.flush()
+        # It runs in the background, so measure once it has had time to write
+        workspaces.measure_later(session_info.workspace, delay=WORKSPACE_QUOTA_INTERVAL)
+        # Runs in the background shell: its output goes to the session buffer, not the audit log
+        audit('terminal', session_id=session_id, namespace=session_info.namespace, command=command)
         
         return jsonify({"success": True, "message": f"Command executed: {command}"})
     except Exception as e:
@@ -478,22 +1229,88 @@ def execute_command(session_id):
 def get_session_output(session_id):
     """Get the output of the terminal session"""
     session_info = active_sessions.get(session_id)
-    if not session_info:
+    if session_info is None or session_info.process is None:
         return jsonify({"error": f"Session '{session_id}' not found"}), 404
     
     try:
-        # Read the output and error streams
-        stdout = session_info['process'].stdout.readline()
-        stderr = session_info['process'].stderr.readline()
+        # Return whatever was buffered after the client's cursor, without blocking
+        since = request.args.get('since', 0, type=int)
+        chunks, truncated = session_info.output.read_since(since)
+        stdout = ''.join(text for _, stream, text in chunks if stream == 'stdout')
+        stderr = ''.join(text for _, stream, text in chunks if stream == 'stderr')
         
         return jsonify({
             "success": True,
             "output": stdout.strip(),
-            "error": stderr.strip()
+            "error": stderr.strip(),
+            "cursor": chunks[-1][0] if chunks else since,
+            "truncated": truncated,
+            "exited": session_info.output.closed
         })
     except Exception as e:
         return jsonify({"error": f"Failed to get session output: {str(e)}"}), 500
 
+@app.route('/api/sessions/<session_id>/stream', methods=['GET'])
+def stream_session_output(session_id):
+    """Stream the terminal session output as Server-Sent Events
+
+    Reconnecting clients send Last-Event-ID (or ?since=) and get the buffered
+    output they missed replayed first.
+    """
+    session_info = active_sessions.get(session_id)
+    if session_info is None or session_info.process is None:
+        return jsonify({"error": f"Session '{session_id}' not found"}), 404
+    
+    output = session_info.output
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', 0, type=int)
+    
+    def generate():
+        cursor = since
+        while True:
+            chunks, truncated = output.read_since(cursor)
+            if truncated:
+                yield "event: truncated\ndata: {}\n\n"
+            for seq, stream, text in chunks:
+                yield f"id: {seq}\nevent: {stream}\ndata: {json.dumps(text)}\n\n"
+                cursor = seq
+            if output.closed and not output.read_since(cursor)[0]:
+                yield f"event: exit\ndata: {json.dumps({'returnCode': output.returncode})}\n\n"
+                return
+            # An open stream counts as activity for the idle reaper
+            active_sessions.get(session_id)
+            if not output.wait(cursor, timeout=STREAM_HEARTBEAT):
+                # Keep proxies from closing an idle connection
+                yield ": heartbeat\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def open_question_session(question_id, resume_id=None):
+    """Create a session for a student working on a question
+
+    The workspace directory is only created (or restored from its archive)
+    when the first command runs. `resume_id` reuses an ended session's id,
+    and so its workspace, if that still exists and is not in use.
+    """
+    session_id = None
+    if (resume_id and len(resume_id) == 8 and all(c in '0123456789abcdef' for c in resume_id)
+            and resume_id not in active_sessions and workspaces.exists(workspaces.path(resume_id))):
+        session_id = resume_id
+    if session_id is None:
+        # Create a unique session ID
+        session_id = str(uuid.uuid4())[:8]  # Use shortened UUID for readability
+    session_dir = workspaces.path(session_id)
+    
+    # Store session information
+    session_info = Session(session_id, session_dir, question_id=question_id)
+    active_sessions.add(session_info)
+    return session_info
+
 @app.route('/api/session/create', methods=['POST'])
 def session_create():
     """Create a new workspace session for a question"""
@@ -505,29 +1322,82 @@ def session_create():
     if not question_id:
         return jsonify({"error": "No question ID provided"}), 400
     
-    # Create a unique session ID
-    session_id = str(uuid.uuid4())[:8]  # Use shortened UUID for readability
+    try:
+        session_info = open_question_session(question_id, resume_id=data.get('resumeSessionId'))
+        return jsonify({
+            "success": True,
+            "sessionId": session_info.id,
+            "workspacePath": session_info.workspace
+        })
+    except Exception as e:
+        return jsonify({"error": f"Failed to create session: {str(e)}"}), 500
+
+@app.route('/api/bootstrap', methods=['POST'])
+def bootstrap():
+    """Open a question in one round trip: its content, a new session and the initial probes"""
+    started = time.monotonic()
+    data = request.json
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    question_id = data.get('questionId')
+    if not question_id:
+        return jsonify({"error": "No question ID provided"}), 400
+    
+    probes = data.get('probes', BOOTSTRAP_PROBES)
+    if (not isinstance(probes, list) or len(probes) > BOOTSTRAP_MAX_PROBES
+            or not all(isinstance(command, str) and command.strip() for command in probes)):
+        return jsonify({"error": f"probes must be a list of at most {BOOTSTRAP_MAX_PROBES} commands"}), 400
+    
+    entry = question_catalog.get(question_id)
+    if entry is None:
+        return jsonify({"error": "Question not found"}), 404
+    
+    if throttle(cost=len(probes) + (1 if SESSION_INIT_SCRIPT else 0)):
+        return jsonify({"error": f"Too many commands, try again in {g.retry_after}s"}), 429
     
     try:
-        # Create session directory
-        session_dir = os.path.join(WORKSPACE_DIR, 'namespace', session_id)
-        os.makedirs(session_dir, exist_ok=True)
+        session_info = open_question_session(question_id, resume_id=data.get('resumeSessionId'))
+        env = os.environ.copy()
         
-        # Store session information
-        active_sessions[session_id] = {
-            'question_id': question_id,
-            'workspace': session_dir,
-            'namespace': None,
-            'created_at': os.path.getctime(session_dir)
-        }
+        # The init script runs in the session's shell; probes run as their
+        # own processes so they do not wait for it
+        commands = []
+        if SESSION_INIT_SCRIPT:
+            commands.append((f"source {shlex.quote(SESSION_INIT_SCRIPT)}", session_info))
+        commands.extend((command, None) for command in probes)
+        
+        jobs = []
+        with audit_scope(session_id=session_info.id, namespace=session_info.namespace, question_id=question_id):
+            for command, shell_session in commands:
+                try:
+                    jobs.append((command, submit_terminal_command(shell_session, command, session_info.workspace, env)))
+                except QueueFull as e:
+                    jobs.append((command, e))
+        
+        # Rendered while the commands run
+        question = question_payload(entry)
+        
+        results = []
+        for command, submitted in jobs:
+            if isinstance(submitted, QueueFull):
+                results.append({"command": command, "success": False, "output": str(submitted)})
+                continue
+            job, check_limits = submitted
+            result = job.result(timeout=EXEC_QUEUE_TIMEOUT + TERMINAL_TIMEOUT)
+            results.append(dict(terminal_result(result, check_limits(result)), command=command))
         
         return jsonify({
             "success": True,
-            "sessionId": session_id,
-            "workspacePath": session_dir
+            "question": question,
+            "sessionId": session_info.id,
+            "workspacePath": session_info.workspace,
+            "init": results[0] if SESSION_INIT_SCRIPT else None,
+            "probes": results[1:] if SESSION_INIT_SCRIPT else results,
+            "durationMs": round((time.monotonic() - started) * 1000, 2)
         })
     except Exception as e:
-        return jsonify({"error": f"Failed to create session: {str(e)}"}), 500
+        return jsonify({"error": f"Failed to bootstrap session: {str(e)}"}), 500
 
 @app.route('/api/session/end', methods=['POST'])
 def session_end():
@@ -541,18 +1411,9 @@ def session_end():
         return jsonify({"error": "Invalid session ID"}), 404
     
     try:
-        # Get session info
-        session_info = active_sessions[session_id]
-        workspace_dir = session_info.get('workspace')
-        
-        # Clean up session resources
-        if workspace_dir and os.path.exists(workspace_dir):
-            # Optional: You could delete the workspace or keep it for history
-            # shutil.rmtree(workspace_dir)
-            pass
-        
-        # Remove session from active sessions
-        active_sessions.pop(session_id, None)
+        # Remove session from active sessions and stop its shell; the
+        # workspace is archived in the background and restored if resumed
+        active_sessions.end(session_id)
         
         return jsonify({
             "success": True,
@@ -575,59 +1436,355 @@ def terminal_execute():
     session_id = data.get('sessionId')
     namespace = data.get('namespace')
     
+    if throttle(session_id):
+        return jsonify({
+            "success": False,
+            "error": f"Too many commands, try again in {g.retry_after}s"
+        }), 429
+    
     # If we have a session, use its workspace
     cwd = None
     env = os.environ.copy()
+    session_info = None
     
-    if session_id and session_id in active_sessions:
-        session_info = active_sessions[session_id]
-        cwd = session_info.get('workspace')
+    if session_id:
+        session_info = active_sessions.get(session_id)
+    
+    if session_info is not None:
+        cwd = session_info.workspace
         
         # Update namespace if provided
-        if namespace and not session_info.get('namespace'):
-            session_info['namespace'] = namespace
+        if namespace and not session_info.namespace:
+            session_info.namespace = namespace
+            active_sessions.save(session_info)
         
         # Use the session's namespace if available
-        if session_info.get('namespace'):
-            env['NAMESPACE'] = session_info['namespace']
+        if session_info.namespace:
+            env['NAMESPACE'] = session_info.namespace
+    
+    if cwd is not None and workspaces.over_quota(cwd) and not is_cleanup_command(command):
+        return jsonify({"success": False, "output": quota_message()}), 507
+    
+    stream = bool(data.get('stream')) or 'application/x-ndjson' in request.headers.get('Accept', '')
+    
+    # Commands are queued inside the scope, so their audit records carry it
+    scope = dict(session_audit_fields(session_id), namespace=namespace)
+    if session_info is not None:
+        scope.update(session_id=session_info.id, namespace=session_info.namespace or namespace,
+                     question_id=session_info.question_id)
     
     try:
-        # Execute the command
-        result = subprocess.run(
-            command,
-            shell=True,
-            cwd=cwd,
-            env=env,
-            capture_output=True,
-            text=True,
-            timeout=30  # Allow longer timeout for user commands
-        )
-        
-        # Combine output and error
-        output = result.stdout
-        if result.stderr:
-            if output:
-                output += "\n" + result.stderr
-            else:
-                output = result.stderr
+        with audit_scope(**scope):
+            if stream:
+                return Response(
+                    stream_with_context(stream_terminal_command(session_info, command, cwd, env)),
+                    content_type='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+                )
+            
+            job, check_limits = submit_terminal_command(session_info, command, cwd, env)
+        result = job.result(timeout=EXEC_QUEUE_TIMEOUT + TERMINAL_TIMEOUT)
+        limits_exceeded = check_limits(result)
         
-        return jsonify({
-            "success": result.returncode == 0,
-            "output": output,
-            "returnCode": result.returncode
-        })
-    except subprocess.TimeoutExpired:
+        return jsonify(terminal_result(result, limits_exceeded))
+    except QueueFull as e:
         return jsonify({
             "success": False,
-            "output": "Command timed out after 30 seconds"
-        })
+            "output": str(e)
+        }), 503
     except Exception as e:
         return jsonify({
             "success": False,
             "output": f"Error executing command: {str(e)}"
         }), 500
 
+def submit_terminal_command(session_info, command, cwd, env, on_output=None):
+    """Queue a terminal command on the worker pool under the resource limits
+
+    Commands of a session run in its long-lived shell so cd/export persist;
+    either way they count against the pool's concurrency limit. Returns the
+    Job and a function that lists the limits its result ran into.
+    """
+    if cwd is not None:
+        # The first command in a workspace creates (or restores) it
+        workspaces.ensure(cwd)
+        env = dict(env, KUBECONFIG=workspaces.kubeconfig(cwd))
+    
+    if session_info is None:
+        job = executor.submit(
+            command,
+            timeout=TERMINAL_TIMEOUT,
+            cwd=cwd,
+            env=env,
+            kind='terminal',
+            client=client_address(),
+            on_output=on_output,
+            wrapper=resource_limits.wrapper()
+        )
+        return job, with_quota_check(resource_limits.check, cwd)
+    
+    if session_info.cgroup is None:
+        session_info.cgroup = resource_limits.cgroup(session_info.id)
+    cgroup = session_info.cgroup
+    events_before = cgroup.events() if cgroup is not None else None
+    
+    shell = session_info.shell
+    if shell is None:
+        shell = session_info.shell = PersistentShell(
+            cwd=cwd,
+            env=env,
+            max_output=OUTPUT_MAX_BYTES,
+            wrapper=resource_limits.wrapper(cgroup, cpu=False),
+            on_start=lambda process: resource_limits.started(process, cgroup),
+            on_command=resource_limits.limit_command
+        )
+    
+    # The namespace may be set after the shell started
+    namespace = session_info.namespace
+    if namespace and shell.env.get('NAMESPACE') != namespace:
+        shell.env['NAMESPACE'] = namespace
+        if shell.alive:
+            shell.run(f"export NAMESPACE={shlex.quote(namespace)}", timeout=TERMINAL_TIMEOUT)
+    
+    # Cancelling the job (e.g. the client went away) kills the command and restarts the shell
+    cancel = threading.Event()
+    job = executor.submit(
+        command,
+        timeout=TERMINAL_TIMEOUT,
+        kind='terminal',
+        client=session_info.id,
+        fn=lambda: shell.run(command, timeout=TERMINAL_TIMEOUT, on_output=on_output, cancel=cancel),
+        on_cancel=cancel.set
+    )
+    return job, with_quota_check(lambda result: resource_limits.check(result, cgroup, events_before), cwd)
+
+def with_quota_check(check_limits, cwd):
+    """Extend a limit check with the workspace's disk quota ('disk')
+
+    The workspace is only queued for measuring; 'disk' reflects the last
+    measurement, so it can lag a command by up to WORKSPACE_QUOTA_INTERVAL.
+    """
+    def check(result):
+        limits_exceeded = check_limits(result)
+        if cwd is not None:
+            workspaces.measure_later(cwd)
+            if workspaces.over_quota(cwd):
+                limits_exceeded.append('disk')
+        return limits_exceeded
+    return check
+
+def quota_message():
+    return f"Workspace is over its {WORKSPACE_QUOTA_MB} MB disk quota; remove files to run other commands"
+
+def terminal_result(result, limits_exceeded):
+    """JSON body for a finished terminal command"""
+    if result.timed_out:
+        return {
+            "success": False,
+            "output": f"Command timed out after {TERMINAL_TIMEOUT} seconds"
+        }
+    
+    # Combine output and error
+    output = result.stdout
+    if result.stderr:
+        if output:
+            output += "\n" + result.stderr
+        else:
+            output = result.stderr
+    output += limit_notice(limits_exceeded)
+    
+    return {
+        "success": result.returncode == 0,
+        "output": output,
+        "stdout": result.stdout,
+        "stderr": result.stderr,
+        "returnCode": result.returncode,
+        "truncated": result.truncated,
+        "limitsExceeded": limits_exceeded,
+        "durationMs": round(result.duration * 1000, 2)
+    }
+
+def limit_notice(limits_exceeded):
+    """Line appended to terminal output when a command hit a resource limit"""
+    notice = ''
+    names = [name for name in limits_exceeded if name not in ('output', 'disk')]
+    if names:
+        notice += f"\n[Stopped by resource limit: {', '.join(names)}]"
+    if 'disk' in limits_exceeded:
+        notice += f"\n[{quota_message()}]"
+    return notice
+
+def stream_terminal_command(session_info, command, cwd, env):
+    """Start a terminal command and return a generator of its output as NDJSON lines
+
+    Chunks pass through a small bounded queue, so a slow client slows the
+    command down instead of growing server memory. The last line carries
+    the exit status.
+    """
+    chunks = queue.Queue(maxsize=STREAM_QUEUE_CHUNKS)
+    finished = threading.Event()
+    
+    def on_output(name, data):
+        while not finished.is_set():
+            try:
+                chunks.put((name, data), timeout=1)
+                return
+            except queue.Full:
+                continue
+    
+    # Submitted up front so a full queue is still reported as 503
+    job, check_limits = submit_terminal_command(session_info, command, cwd, env, on_output=on_output)
+    decoders = {name: codecs.getincrementaldecoder('utf-8')(errors='replace') for name in ('stdout', 'stderr')}
+    
+    def line(name, data, final=False):
+        text = decoders[name].decode(data, final=final)
+        return json.dumps({"stream": name, "data": text}) + "\n" if text else ''
+    
+    def generate():
+        try:
+            while not (job.future.done() and chunks.empty()):
+                try:
+                    name, data = chunks.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                yield line(name, data)
+            for name in decoders:
+                yield line(name, b'', final=True)
+            
+            result = job.result(timeout=0)
+            yield json.dumps({
+                "done": True,
+                "success": result.returncode == 0 and not result.timed_out,
+                "returnCode": result.returncode,
+                "timedOut": result.timed_out,
+                "limitsExceeded": check_limits(result),
+                "durationMs": round(result.duration * 1000, 2)
+            }) + "\n"
+        finally:
+            finished.set()
+            if not job.future.done():
+                job.cancel()
+    
+    return generate()
+
+@app.route('/api/admin/sessions', methods=['GET'])
+def admin_session_stats():
+    """Live sessions and processes, and how many were reclaimed"""
+    return jsonify(active_sessions.stats())
+
+@app.route('/api/admin/limits', methods=['GET'])
+def admin_limit_stats():
+    """Configured resource limits and how often commands ran into them"""
+    return jsonify(resource_limits.stats())
+
+@app.route('/api/admin/bundle', methods=['GET'])
+def admin_bundle_stats():
+    """Size and contents of the compiled bundle and background rebuilds"""
+    return jsonify(dict(content_bundle.stats(), rebuilds=bundle_builder.stats()))
+
+@app.route('/api/admin/bundle', methods=['POST'])
+def admin_build_bundle():
+    """Compile the question and lab trees into the bundle now"""
+    try:
+        started = time.monotonic()
+        count = build_bundle(LAB_BUNDLE, BUNDLE_TREES)
+        content_bundle.reload()
+        question_catalog.bundle_built()
+        lab_catalog.bundle_built()
+        return jsonify({"success": True, "questions": count, "seconds": round(time.monotonic() - started, 3)})
+    except Exception as e:
+        return jsonify({"error": f"Failed to build bundle: {str(e)}"}), 500
+
+@app.route('/api/admin/response-cache', methods=['GET'])
+def admin_response_cache_stats():
+    """Rendered step and cached question response counters"""
+    return jsonify(dict(response_cache.stats(), renderer=step_renderer.stats()))
+
+@app.route('/api/admin/search', methods=['GET'])
+def admin_search_stats():
+    """Size of the question search index and its query counters"""
+    return jsonify(question_index.stats())
+
+@app.route('/api/admin/audit', methods=['GET'])
+def admin_audit():
+    """Audit records by session, question, namespace, kind, step and/or time range, newest first"""
+    if audit_log is None:
+        return jsonify({"error": "Audit log is disabled"}), 404
+    
+    args = request.args
+    try:
+        since = parse_time(args.get('since'))
+        until = parse_time(args.get('until'))
+        before = int(args['before']) if args.get('before') else None
+        limit = max(1, min(int(args.get('limit', 100)), AUDIT_QUERY_MAX))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
+    
+    records = audit_log.query(
+        since=since,
+        until=until,
+        before=before,
+        limit=limit,
+        session_id=args.get('session'),
+        claimed_session_id=args.get('claimed_session'),
+        question_id=args.get('question'),
+        namespace=args.get('namespace'),
+        kind=args.get('kind'),
+        step=args.get('step')
+    )
+    return jsonify({
+        "records": records,
+        # Pass as `before` for the next (older) page
+        "next": records[-1]['id'] if len(records) == limit else None
+    })
+
+def parse_time(value):
+    """Seconds since the epoch from a number or an ISO 8601 timestamp (None stays None)"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        timestamp = datetime.fromisoformat(value)
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.timestamp()
+
+@app.route('/api/admin/audit/stats', methods=['GET'])
+def admin_audit_stats():
+    """Audit records queued, written in batches and dropped"""
+    if audit_log is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(audit_log.stats(), enabled=True))
+
+@app.route('/api/admin/workspaces', methods=['GET'])
+def admin_workspace_stats():
+    """Workspaces created, archived and restored, and quota hits"""
+    return jsonify(workspaces.stats())
+
+@app.route('/api/admin/static', methods=['GET'])
+def admin_static_stats():
+    """Frontend files held in memory and their fingerprinted names"""
+    return jsonify(dict(static_assets.stats(), fingerprints=static_assets.fingerprints))
+
+@app.route('/api/admin/executor', methods=['GET'])
+def admin_executor_stats():
+    """Queue depth, wait times and rate limiting of the command scheduler"""
+    return jsonify(dict(executor.stats(), rate_limits=command_limiter.stats()))
+
+@app.route('/api/admin/validation-cache', methods=['GET'])
+def admin_validation_cache_stats():
+    """Hit/miss counters of the validation result cache"""
+    return jsonify(validation_cache.stats())
+
+@app.route('/api/admin/resource-cache', methods=['GET'])
+def admin_resource_cache_stats():
+    """Sync state and object counts of the cluster resource cache"""
+    if resource_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(resource_cache.stats(), enabled=True))
+
 if __name__ == '__main__':
     # Ensure questions directory exists
     os.makedirs(QUESTIONS_DIR, exist_ok=True)
-    app.run(host='0.0.0.0', port=80, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', '80')), debug=False)
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""Frontend assets held in memory with content-hashed names and precompressed forms.
+
+Every file under the frontend directory is read once, given a fingerprinted
+alias (``main.js`` -> ``main.3f2a9c1b7d04.js``) and compressed ahead of time
+for each supported encoding. HTML pages are rewritten to reference the
+fingerprinted names, so those can be cached by browsers forever while the
+pages themselves are revalidated by ETag. The directory is rescanned at most
+once per ``check_interval`` seconds to pick up edits.
+"""
+import os
+import re
+import time
+import hashlib
+import mimetypes
+import threading
+
+from http_cache import CachedBody, available_encodings
+
+# Types worth compressing; images and fonts are already compressed
+COMPRESSIBLE = re.compile(r'^(text/|application/(javascript|json|xml)|image/svg)')
+ASSET_REFERENCE = re.compile(r'''(\b(?:src|href)=["'])([^"'#?]+)(["'])''')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+
+def fingerprinted_name(path, digest):
+    base, ext = os.path.splitext(path)
+    return f'{base}.{digest[:12]}{ext}'
+
+
+def precompressed(body, mimetype):
+    """CachedBody with every supported encoding computed up front"""
+    cached = CachedBody(body, mimetype)
+    if COMPRESSIBLE.match(mimetype):
+        for encoding in available_encodings():
+            cached.encoded(encoding)
+    return cached
+
+
+class Asset:
+    """A served body and the Cache-Control it is sent with"""
+
+    def __init__(self, cached, cache_control):
+        self.cached = cached
+        self.cache_control = cache_control
+
+
+class StaticAssets:
+    """In-memory copy of a static directory keyed by URL path"""
+
+    def __init__(self, root_dir, check_interval=2):
+        self.root_dir = root_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._assets = {}
+        # Fingerprinted assets of the previous scan, for pages loaded just before an edit
+        self._previous = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self.fingerprints = {}
+        self.loads = 0
+
+    def _scan(self):
+        """(relative path, mtime) of every file, as a change signature"""
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.root_dir):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                try:
+                    files.append((os.path.relpath(path, self.root_dir).replace(os.sep, '/'),
+                                  os.stat(path).st_mtime_ns))
+                except FileNotFoundError:
+                    pass
+        return tuple(files)
+
+    def _load(self, signature):
+        sources = {}
+        for path, _ in signature:
+            try:
+                with open(os.path.join(self.root_dir, path), 'rb') as f:
+                    sources[path] = f.read()
+            except OSError:
+                pass
+
+        fingerprints = {
+            path: fingerprinted_name(path, hashlib.sha256(body).hexdigest())
+            for path, body in sources.items() if not path.endswith('.html')
+        }
+
+        def rewrite(page_dir, match):
+            reference = match.group(2)
+            if reference.startswith(('/', 'http:', 'https:', '//')):
+                target = reference.lstrip('/')
+            else:
+                target = os.path.normpath(os.path.join(page_dir, reference)).replace(os.sep, '/')
+            fingerprint = fingerprints.get(target)
+            if fingerprint is None:
+                return match.group(0)
+            return f'{match.group(1)}/{fingerprint}{match.group(3)}'
+
+        assets = {}
+        for path, body in sources.items():
+            mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            if path.endswith('.html'):
+                page_dir = os.path.dirname(path)
+                text = ASSET_REFERENCE.sub(lambda m: rewrite(page_dir, m), body.decode())
+                assets[path] = Asset(precompressed(text.encode(), mimetype), REVALIDATE)
+                continue
+            # The plain name stays available (revalidated) for anything not rewritten
+            cached = precompressed(body, mimetype)
+            assets[path] = Asset(cached, REVALIDATE)
+            assets[fingerprints[path]] = Asset(cached, IMMUTABLE)
+        return assets, fingerprints
+
+    def refresh(self, force=False):
+        """Rescan the directory if it is due (or forced) and reload on changes"""
+        now = time.monotonic()
+        if not force and self._signature is not None and (
+                self.check_interval < 0 or now - self._checked_at < self.check_interval):
+            return
+        with self._lock:
+            if not force and self._signature is not None and (
+                    self.check_interval < 0 or now - self._checked_at < self.check_interval):
+                return
+            self._checked_at = now
+            signature = self._scan()
+            if signature == self._signature:
+                return
+            assets, fingerprints = self._load(signature)
+            self._previous = {
+                name: asset for name, asset in self._assets.items()
+                if asset.cache_control == IMMUTABLE and name not in assets
+            }
+            self._assets = assets
+            self.fingerprints = fingerprints
+            self._signature = signature
+            self.loads += 1
+
+    def get(self, path):
+        """Asset served at `path`, or None"""
+        self.refresh()
+        assets = self._assets
+        return assets.get(path) or self._previous.get(path)
+
+    def stats(self):
+        assets = self._assets
+        return {
+            'files': len(self.fingerprints) + sum(1 for p in assets if p.endswith('.html')),
+            'bytes': sum(len(a.cached.body) for p, a in assets.items() if a.cache_control == REVALIDATE),
+            'encodings': available_encodings(),
+            'loads': self.loads
+        }
@@ -0,0 +1,200 @@
+"""Append-only audit log of terminal commands and validation results.
+
+Records are handed to ``record()``, which only puts them on a bounded
+in-memory queue, so request latency does not depend on the disk. A
+background thread drains the queue and inserts records in batches (one
+transaction each) into a SQLite database in WAL mode, which several server
+workers can append to at once. Records are indexed by session, question and
+time for the admin queries. If the writer falls behind and the queue fills
+up, new records are dropped and counted rather than blocking requests.
+Session ids a client sent that the server does not know are stored as
+``claimed_session_id``, so ``session_id`` only ever names a real session.
+"""
+import time
+import queue
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    session_id TEXT,
+    claimed_session_id TEXT,
+    namespace TEXT,
+    question_id TEXT,
+    step TEXT,
+    command TEXT,
+    exit_code INTEGER,
+    passed INTEGER,
+    duration_ms REAL,
+    output TEXT,
+    truncated INTEGER NOT NULL DEFAULT 0,
+    request_id TEXT
+);
+CREATE INDEX IF NOT EXISTS audit_ts ON audit (ts);
+CREATE INDEX IF NOT EXISTS audit_session ON audit (session_id, ts);
+CREATE INDEX IF NOT EXISTS audit_question ON audit (question_id, ts);
+"""
+
+COLUMNS = ('ts', 'kind', 'session_id', 'claimed_session_id', 'namespace', 'question_id', 'step',
+           'command', 'exit_code', 'passed', 'duration_ms', 'output', 'truncated', 'request_id')
+FILTERS = ('session_id', 'claimed_session_id', 'question_id', 'namespace', 'kind', 'step')
+
+
+class AuditLog:
+    """Batched, asynchronous writer (and reader) of the audit table at `path`"""
+
+    def __init__(self, path, max_output=4096, batch_size=200, flush_interval=1.0, max_queue=10000):
+        self.path = path
+        self.max_output = max_output
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._counts = {'recorded': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'errors': 0}
+        self._write_seconds = 0.0
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        # Databases created before a column existed
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(audit)')}
+        for column in COLUMNS:
+            if column not in existing:
+                conn.execute(f'ALTER TABLE audit ADD COLUMN {column} TEXT')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counts[name] += n
+
+    def record(self, kind, output=None, **fields):
+        """Queue one record; never blocks (returns False if it had to be dropped)"""
+        truncated = bool(fields.pop('truncated', False))
+        if output is not None and len(output) > self.max_output:
+            output = output[:self.max_output]
+            truncated = True
+        if isinstance(fields.get('passed'), bool):
+            fields['passed'] = int(fields['passed'])
+        fields.update(kind=kind, output=output, truncated=int(truncated))
+        fields.setdefault('ts', time.time())
+        try:
+            self._queue.put_nowait(tuple(fields.get(column) for column in COLUMNS))
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('recorded')
+        return True
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+        return self
+
+    def flush(self, timeout=10):
+        """Wait until everything queued so far is written; returns False on timeout"""
+        if self._thread is None:
+            while not self._queue.empty():
+                self._write(self._drain())
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _drain(self, first=None, wait=0):
+        """Up to batch_size queued items, starting with `first`, collected for at most `wait` seconds"""
+        batch = [] if first is None else [first]
+        deadline = time.monotonic() + wait
+        # A flush() marker ends the batch early
+        while len(batch) < self.batch_size and not (batch and isinstance(batch[-1], threading.Event)):
+            try:
+                batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            # Let records accumulate so they are written in one transaction
+            batch = self._drain(first, self.flush_interval)
+            self._write(batch)
+            # flush() markers: everything queued before them is written now
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _write(self, batch):
+        rows = [item for item in batch if isinstance(item, tuple)]
+        if not rows:
+            return
+        started = time.monotonic()
+        conn = self._conn()
+        try:
+            conn.execute('BEGIN')
+            conn.executemany(
+                f"INSERT INTO audit ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            self._count('errors')
+            return
+        with self._lock:
+            self._counts['written'] += len(rows)
+            self._counts['batches'] += 1
+            self._write_seconds += time.monotonic() - started
+
+    def query(self, since=None, until=None, before=None, limit=100, **filters):
+        """Records matching the filters, newest written first; pass the last id as `before` for the next page"""
+        clauses, params = [], []
+        for name in FILTERS:
+            value = filters.get(name)
+            if value is not None:
+                clauses.append(f'{name} = ?')
+                params.append(value)
+        if since is not None:
+            clauses.append('ts >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('ts < ?')
+            params.append(until)
+        if before is not None:
+            clauses.append('id < ?')
+            params.append(before)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._conn().execute(
+            f"SELECT id, {', '.join(COLUMNS)} FROM audit {where} ORDER BY id DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+        records = []
+        for row in rows:
+            record = dict(zip(('id',) + COLUMNS, row))
+            if record['passed'] is not None:
+                record['passed'] = bool(record['passed'])
+            record['truncated'] = bool(record['truncated'])
+            records.append(record)
+        return records
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._counts,
+                queued=self._queue.qsize(),
+                write_seconds=round(self._write_seconds, 6),
+                path=self.path
+            )
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""Compiled bundle of the question and lab trees in a single file.
+
+On network filesystems every question costs several small reads (metadata,
+each step, the validation map) plus a stat per file to notice edits. The
+bundle packs all of it into one file: step texts back to back in a data
+section, followed by a JSON index holding each question's metadata and
+validation map and the offset/length of every step. The server memory-maps
+the file, parses the index once, and slices step texts straight out of the
+map, so workers share one copy through the page cache.
+
+Layout: ``MAGIC | index offset (u64) | index length (u64) | data | index``.
+
+Build it with:
+    python3 backend/bundle.py build [--output PATH]
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import argparse
+import tempfile
+import threading
+
+MAGIC = b'LABBNDL1'
+HEADER = struct.Struct('<8sQQ')
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.path.join(BACKEND_DIR, 'content.bundle')
+DEFAULT_TREES = {
+    'questions': (os.path.join(BACKEND_DIR, 'questions'), 'validation.json'),
+    'labs': (os.path.join(BACKEND_DIR, 'labs'), 'validate.json')
+}
+
+
+class BundleError(Exception):
+    """Raised when a bundle file is missing, truncated or of another format"""
+
+
+def _step_files(steps_dir):
+    if not os.path.isdir(steps_dir):
+        return []
+    return sorted([f for f in os.listdir(steps_dir) if f.endswith('.md')],
+                  key=lambda x: int(x.split('.')[0]))
+
+
+def _read_question(question_dir, validation_file):
+    """(metadata, [(step id, bytes)], validation, validation error) from a question directory"""
+    question_id = os.path.basename(question_dir)
+    metadata_path = os.path.join(question_dir, 'metadata.json')
+    if os.path.exists(metadata_path):
+        with open(metadata_path, 'r') as f:
+            metadata = json.load(f)
+    else:
+        metadata = {'title': question_id, 'description': ''}
+
+    steps = []
+    steps_dir = os.path.join(question_dir, 'steps')
+    for step_file in _step_files(steps_dir):
+        with open(os.path.join(steps_dir, step_file), 'rb') as f:
+            steps.append((step_file.split('.')[0], f.read()))
+
+    validation = None
+    error = None
+    try:
+        with open(os.path.join(question_dir, validation_file), 'r') as f:
+            validation = json.load(f)
+    except FileNotFoundError as e:
+        error = {'type': 'FileNotFoundError', 'message': str(e)}
+    except json.JSONDecodeError as e:
+        error = {'type': 'JSONDecodeError', 'message': str(e)}
+    return metadata, steps, validation, error
+
+
+def _write_bundle(out, trees, previous, changed):
+    index = {'version': 1, 'built_at': time.time(), 'trees': {}}
+    out.write(HEADER.pack(MAGIC, 0, 0))
+    offset = HEADER.size
+    count = 0
+
+    for tree, (root_dir, validation_file) in trees.items():
+        questions = index['trees'][tree] = {}
+        if not os.path.isdir(root_dir):
+            continue
+        for question_id in os.listdir(root_dir):
+            question_dir = os.path.join(root_dir, question_id)
+            if not os.path.isdir(question_dir):
+                continue
+
+            copied = None
+            if previous is not None and changed is not None and (tree, question_id) not in changed:
+                copied = previous.raw(tree, question_id)
+            if copied is not None:
+                record, steps = copied
+                metadata, validation, error = record['metadata'], record['validation'], record['validation_error']
+            else:
+                metadata, steps, validation, error = _read_question(question_dir, validation_file)
+
+            step_index = []
+            for step_id, content in steps:
+                out.write(content)
+                step_index.append({'id': step_id, 'offset': offset, 'length': len(content)})
+                offset += len(content)
+            questions[question_id] = {
+                'metadata': metadata,
+                'steps': step_index,
+                'validation': validation,
+                'validation_error': error
+            }
+            count += 1
+
+    index_bytes = json.dumps(index, separators=(',', ':')).encode()
+    out.write(index_bytes)
+    out.seek(0)
+    out.write(HEADER.pack(MAGIC, offset, len(index_bytes)))
+    return count
+
+
+def build_bundle(path=DEFAULT_PATH, trees=None, previous=None, changed=None):
+    """Write a bundle of every question in `trees` ({name: (root dir, validation file)})
+
+    With a `previous` QuestionBundle, only questions listed in `changed`
+    ({(tree, id)}) are read from disk; the rest are copied from it. The file
+    is replaced atomically. Returns the number of questions written.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            count = _write_bundle(out, trees or DEFAULT_TREES, previous, changed)
+            out.flush()
+            os.fsync(out.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return count
+
+
+class QuestionBundle:
+    """Read side of a bundle file, remapped when the file is replaced"""
+
+    def __init__(self, path=DEFAULT_PATH, check_interval=2):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # (stat identity, mmap, index) of the mapped file, or None
+        self._state = None
+        self._checked_at = 0.0
+        self.loads = 0
+
+    def _open(self):
+        with open(self.path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if st.st_size < HEADER.size:
+                raise BundleError(f"{self.path} is truncated")
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset, index_length = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or index_offset + index_length > len(data):
+            raise BundleError(f"{self.path} is not a question bundle")
+        index = json.loads(data[index_offset:index_offset + index_length])
+        return (st.st_ino, st.st_mtime_ns, st.st_size), data, index
+
+    def _fresh(self, now):
+        if self._checked_at == 0.0:
+            return False
+        # A negative interval means only reload() picks up a new file
+        return self.check_interval < 0 or now - self._checked_at < self.check_interval
+
+    def _current(self):
+        """The mapped state, reopening the file if it changed (checked at most every check_interval)"""
+        now = time.monotonic()
+        if self._fresh(now):
+            return self._state
+        with self._lock:
+            if self._fresh(now):
+                return self._state
+            self._checked_at = now
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._state = None
+                return None
+            identity = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if self._state is None or self._state[0] != identity:
+                try:
+                    # The old map stays valid for readers still holding it
+                    self._state = self._open()
+                    self.loads += 1
+                except (OSError, ValueError, BundleError):
+                    self._state = None
+            return self._state
+
+    def reload(self):
+        """Pick up a rebuilt file now instead of at the next check"""
+        with self._lock:
+            self._checked_at = 0.0
+        return self._current() is not None
+
+    @property
+    def available(self):
+        return self._current() is not None
+
+    def question_ids(self, tree):
+        state = self._current()
+        if state is None:
+            return None
+        return list(state[2]['trees'].get(tree, {}))
+
+    def get(self, tree, question_id):
+        """Entry in the same shape as QuestionCatalog.get, or None if not in the bundle"""
+        state = self._current()
+        if state is None:
+            return None
+        identity, data, index = state
+        record = index['trees'].get(tree, {}).get(question_id)
+        if record is None:
+            return None
+        error = record['validation_error']
+        if error is not None:
+            if error['type'] == 'JSONDecodeError':
+                error = json.JSONDecodeError(error['message'], '', 0)
+            else:
+                error = FileNotFoundError(error['message'])
+        return {
+            'id': question_id,
+            'metadata': record['metadata'],
+            'steps': [
+                {'id': step['id'], 'content': data[step['offset']:step['offset'] + step['length']].decode()}
+                for step in record['steps']
+            ],
+            'validation': record['validation'],
+            'validation_error': error,
+            'revision': ('bundle',) + identity
+        }
+
+    def revision(self, tree, question_id):
+        """Revision a get() of this question would carry, without decoding its steps"""
+        state = self._current()
+        if state is None or question_id not in state[2]['trees'].get(tree, {}):
+            return None
+        return ('bundle',) + state[0]
+
+    def raw(self, tree, question_id):
+        """(index record, [(step id, bytes)]) for copying a question into a new bundle"""
+        state = self._current()
+        if state is None:
+            return None
+        _, data, index = state
+        record = index['trees'].get(tree, {}).get(question_id)
+        if record is None:
+            return None
+        steps = [(step['id'], data[step['offset']:step['offset'] + step['length']]) for step in record['steps']]
+        return record, steps
+
+    def stats(self):
+        state = self._current()
+        if state is None:
+            return {'available': False, 'path': self.path}
+        identity, data, index = state
+        return {
+            'available': True,
+            'path': self.path,
+            'bytes': len(data),
+            'built_at': index.get('built_at'),
+            'questions': {tree: len(questions) for tree, questions in index['trees'].items()},
+            'loads': self.loads
+        }
+
+
+class BundleBuilder:
+    """Rebuilds the bundle in the background after admin edits, coalescing bursts"""
+
+    def __init__(self, bundle, trees=None, delay=1.0, on_built=None):
+        self.bundle = bundle
+        self.trees = trees or DEFAULT_TREES
+        self.delay = delay
+        # on_built(changed) runs after the new file is mapped
+        self.on_built = on_built
+        self._lock = threading.Lock()
+        self._changed = set()
+        self._timer = None
+        self.builds = 0
+        self.last_error = None
+
+    def schedule(self, tree, question_id):
+        with self._lock:
+            self._changed.add((tree, question_id))
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self._build)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _build(self):
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            self._timer = None
+        try:
+            build_bundle(self.bundle.path, self.trees, previous=self.bundle, changed=changed)
+            self.bundle.reload()
+            self.builds += 1
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            with self._lock:
+                # Keep serving the edits from the directories until a build succeeds
+                self._changed |= changed
+            return
+        with self._lock:
+            # Questions edited again while building are not in the new file yet
+            done = changed - self._changed
+        if self.on_built is not None:
+            self.on_built(done)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._changed),
+                'builds': self.builds,
+                'last_error': self.last_error
+            }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compile the question and lab trees into one bundle file')
+    parser.add_argument('command', choices=['build', 'info'])
+    parser.add_argument('-o', '--output', default=os.environ.get('LAB_BUNDLE', DEFAULT_PATH))
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        started = time.monotonic()
+        count = build_bundle(args.output)
+        print(f"Wrote {count} questions/labs to {args.output} "
+              f"({os.path.getsize(args.output)} bytes, {time.monotonic() - started:.2f}s)")
+    else:
+        print(json.dumps(QuestionBundle(args.output).stats(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Incremental, size-bounded capture of command output.
+
+Commands like ``oc get events -A -o yaml`` can print far more than anyone
+reads in a browser terminal. Output is read from the pipes as it arrives and
+only the first and last ``max_bytes / 2`` bytes of each stream are kept;
+whatever fell in between is replaced by a marker saying how much was
+dropped. An optional callback sees every chunk as it is read, for streaming
+it to a client.
+"""
+import os
+import time
+import selectors
+
+DEFAULT_MAX_BYTES = 1024 * 1024
+READ_SIZE = 65536
+
+
+class OutputCapture:
+    """Head and tail of a byte stream, with a count of what was dropped"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        # None or <= 0 keeps everything
+        self.max_bytes = max_bytes if max_bytes and max_bytes > 0 else None
+        self.head_limit = self.max_bytes // 2 if self.max_bytes else None
+        self.tail_limit = self.max_bytes - self.head_limit if self.max_bytes else None
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def write(self, data):
+        self.total += len(data)
+        if self.max_bytes is None:
+            self.head += data
+            return
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            if len(self.tail) > self.tail_limit:
+                del self.tail[:len(self.tail) - self.tail_limit]
+
+    @property
+    def omitted(self):
+        return self.total - len(self.head) - len(self.tail)
+
+    @property
+    def truncated(self):
+        return self.omitted > 0
+
+    def getvalue(self):
+        if not self.truncated:
+            return bytes(self.head + self.tail)
+        marker = f"\n... [{self.omitted} bytes truncated] ...\n".encode()
+        return bytes(self.head) + marker + bytes(self.tail)
+
+    def text(self):
+        return self.getvalue().decode(errors='replace')
+
+
+def read_output(process, timeout, max_bytes=DEFAULT_MAX_BYTES, on_output=None):
+    """Read a process's stdout and stderr until both close or `timeout` passes
+
+    Returns (stdout, stderr, timed_out) where the first two are
+    OutputCaptures. on_output(name, data) is called with each chunk read.
+    The process is not killed on timeout; that is up to the caller.
+    """
+    captures = {}
+    deadline = time.monotonic() + timeout
+    with selectors.DefaultSelector() as selector:
+        for name, pipe in (('stdout', process.stdout), ('stderr', process.stderr)):
+            capture = captures[name] = OutputCapture(max_bytes)
+            if pipe is not None:
+                selector.register(pipe.fileno(), selectors.EVENT_READ, (name, capture))
+
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return captures['stdout'], captures['stderr'], True
+            for key, _ in selector.select(remaining):
+                name, capture = key.data
+                data = os.read(key.fd, READ_SIZE)
+                if not data:
+                    selector.unregister(key.fd)
+                    continue
+                capture.write(data)
+                if on_output is not None:
+                    on_output(name, data)
+
+    return captures['stdout'], captures['stderr'], False
@@ -0,0 +1,232 @@
+"""In-memory cache of the question/lab tree on disk.
+
+Each question directory is parsed once (metadata, ordered steps and the
+validation map) and kept in memory. Entries are re-checked against the file
+mtimes at most once per ``check_interval`` seconds, and the admin endpoints
+call ``refresh()`` after writing so their changes show up immediately.
+
+When a compiled bundle (see bundle.py) is available, entries are served from
+it instead and the directories are only read for questions that were edited
+since the bundle was built, until a rebuild picks them up.
+"""
+import os
+import json
+import time
+import threading
+
+# How often (seconds) a cached entry is re-checked against the filesystem.
+# A negative value disables polling so only explicit refreshes reload entries.
+CHECK_INTERVAL = float(os.environ.get('CATALOG_CHECK_INTERVAL', '2'))
+
+
+class QuestionCatalog:
+    """Process-wide cache of parsed question directories"""
+
+    def __init__(self, root_dir, validation_file='validation.json', check_interval=CHECK_INTERVAL,
+                 bundle=None, tree=None):
+        self.root_dir = root_dir
+        self.validation_file = validation_file
+        self.check_interval = check_interval
+        # QuestionBundle and the name of this tree in it
+        self.bundle = bundle
+        self.tree = tree
+        # Ids edited since the bundle was built; read from the directories
+        self._overrides = set()
+        self._bundle_lookups = 0
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._ids = None
+        self._ids_mtime = None
+        self._ids_checked_at = 0.0
+        self._lookups = 0
+        self._loads = 0
+        self._file_reads = 0
+        self._load_seconds = 0.0
+
+    def _due(self, checked_at):
+        if self.check_interval < 0:
+            return False
+        return time.monotonic() - checked_at >= self.check_interval
+
+    def _question_dir(self, question_id):
+        if not question_id or question_id in ('.', '..') or os.sep in question_id:
+            return None
+        return os.path.join(self.root_dir, question_id)
+
+    def _signature(self, question_dir):
+        """mtimes of every file an entry is built from"""
+        paths = [
+            question_dir,
+            os.path.join(question_dir, 'metadata.json'),
+            os.path.join(question_dir, self.validation_file),
+        ]
+        steps_dir = os.path.join(question_dir, 'steps')
+        paths.append(steps_dir)
+        if os.path.isdir(steps_dir):
+            paths.extend(os.path.join(steps_dir, f) for f in sorted(os.listdir(steps_dir)))
+
+        signature = []
+        for path in paths:
+            try:
+                signature.append((path, os.stat(path).st_mtime_ns))
+            except FileNotFoundError:
+                signature.append((path, None))
+        return tuple(signature)
+
+    def _load(self, question_id, question_dir):
+        started = time.monotonic()
+        reads = 0
+        signature = self._signature(question_dir)
+
+        # Load metadata
+        metadata_path = os.path.join(question_dir, 'metadata.json')
+        if os.path.exists(metadata_path):
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
+            reads += 1
+        else:
+            metadata = {'title': question_id, 'description': ''}
+
+        # Load steps
+        steps = []
+        steps_dir = os.path.join(question_dir, 'steps')
+        if os.path.exists(steps_dir):
+            step_files = sorted([f for f in os.listdir(steps_dir) if f.endswith('.md')],
+                                key=lambda x: int(x.split('.')[0]))
+            for step_file in step_files:
+                with open(os.path.join(steps_dir, step_file), 'r') as f:
+                    steps.append({
+                        'id': step_file.split('.')[0],
+                        'content': f.read()
+                    })
+                reads += 1
+
+        # Load validation map; remember the error so lookups can report it
+        validation = None
+        validation_error = None
+        try:
+            with open(os.path.join(question_dir, self.validation_file), 'r') as f:
+                reads += 1
+                validation = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            validation_error = e
+
+        self._loads += 1
+        self._file_reads += reads
+        self._load_seconds += time.monotonic() - started
+
+        return {
+            'id': question_id,
+            'metadata': metadata,
+            'steps': steps,
+            'validation': validation,
+            'validation_error': validation_error,
+            'signature': signature,
+            # Changes whenever the entry is rebuilt from different files
+            'revision': signature,
+            'checked_at': time.monotonic()
+        }
+
+    def question_ids(self):
+        """Question directory names, in directory listing order"""
+        bundled = self.bundle.question_ids(self.tree) if self.bundle is not None else None
+        if bundled is not None:
+            with self._lock:
+                overrides = [i for i in sorted(self._overrides) if i not in bundled]
+            return bundled + overrides
+
+        with self._lock:
+            if self._ids is None or self._due(self._ids_checked_at):
+                mtime = os.stat(self.root_dir).st_mtime_ns
+                if self._ids is None or mtime != self._ids_mtime:
+                    self._ids = [
+                        name for name in os.listdir(self.root_dir)
+                        if os.path.isdir(os.path.join(self.root_dir, name))
+                    ]
+                    self._ids_mtime = mtime
+                self._ids_checked_at = time.monotonic()
+            return list(self._ids)
+
+    def get(self, question_id):
+        """Return the cached entry for a question, or None if it does not exist"""
+        question_dir = self._question_dir(question_id)
+        if question_dir is None:
+            return None
+
+        if self.bundle is not None and question_id not in self._overrides:
+            entry = self.bundle.get(self.tree, question_id)
+            if entry is not None:
+                with self._lock:
+                    self._lookups += 1
+                    self._bundle_lookups += 1
+                return entry
+
+        with self._lock:
+            self._lookups += 1
+            entry = self._entries.get(question_id)
+            if entry is not None and not self._due(entry['checked_at']):
+                return entry
+
+            if not os.path.isdir(question_dir):
+                self._entries.pop(question_id, None)
+                return None
+
+            if entry is not None and entry['signature'] == self._signature(question_dir):
+                entry['checked_at'] = time.monotonic()
+                return entry
+
+            entry = self._load(question_id, question_dir)
+            self._entries[question_id] = entry
+            return entry
+
+    def revision(self, question_id):
+        """Current revision of a question (None if it does not exist), cheaper than get() for bundled ones"""
+        if self.bundle is not None and question_id not in self._overrides:
+            revision = self.bundle.revision(self.tree, question_id)
+            if revision is not None:
+                return revision
+        entry = self.get(question_id)
+        return entry['revision'] if entry is not None else None
+
+    def validation(self, question_id):
+        """Return the validation map, raising the same errors as reading the file would"""
+        entry = self.get(question_id)
+        if entry is None:
+            raise FileNotFoundError(os.path.join(self.root_dir, question_id or '', self.validation_file))
+        if entry['validation_error'] is not None:
+            raise entry['validation_error'].with_traceback(None)
+        return entry['validation']
+
+    def refresh(self, question_id):
+        """Reload a question from disk now (or drop it if it was deleted)"""
+        with self._lock:
+            self._entries.pop(question_id, None)
+            self._ids = None
+            if self.bundle is not None:
+                self._overrides.add(question_id)
+        return self.get(question_id)
+
+    def bundle_built(self, question_ids=None):
+        """Serve these questions (default: all) from the bundle again after a rebuild included them"""
+        with self._lock:
+            if question_ids is None:
+                self._overrides.clear()
+            else:
+                self._overrides.difference_update(question_ids)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'lookups': self._lookups,
+                'loads': self._loads,
+                'file_reads': self._file_reads,
+                'load_seconds': round(self._load_seconds, 6),
+                'bundle_lookups': self._bundle_lookups,
+                'overrides': len(self._overrides)
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._ids = None
@@ -0,0 +1,166 @@
+"""Declarative validation checks evaluated against one fetched object.
+
+A validation.json step can describe what to look at instead of a shell
+pipeline:
+
+    {
+      "check": {
+        "kind": "configmap",
+        "name": "app-config",
+        "namespace": "${NAMESPACE}",
+        "assert": [
+          {"path": "{.data.environment}", "equals": "production"},
+          {"path": "{.data.config\\.json}", "regex": "cache"},
+          {"path": "{.data}", "exists": true},
+          {"path": "{.data}", "count": 3}
+        ]
+      }
+    }
+
+The object is fetched once (from the resource cache or with
+``oc get -o json``) and every assertion runs against it in-process.
+"""
+import re
+import shlex
+
+ASSERTIONS = ('exists', 'equals', 'regex', 'count')
+
+
+class CheckError(ValueError):
+    """Raised for a malformed check definition"""
+
+
+def _parse_path(path):
+    """Split a JSONPath like ``{.spec.containers[0].name}`` into keys and indexes"""
+    path = path.strip()
+    if path.startswith('{') and path.endswith('}'):
+        path = path[1:-1]
+    if path in ('', '.', '$'):
+        return []
+    if path.startswith('$'):
+        path = path[1:]
+
+    parts = []
+    i = 0
+    while i < len(path):
+        c = path[i]
+        if c == '.':
+            i += 1
+            key = []
+            while i < len(path) and path[i] not in '.[':
+                if path[i] == '\\' and i + 1 < len(path):
+                    i += 1
+                key.append(path[i])
+                i += 1
+            if not key:
+                raise CheckError(f"Invalid path '{path}'")
+            parts.append(''.join(key))
+        elif c == '[':
+            end = path.find(']', i)
+            if end < 0:
+                raise CheckError(f"Invalid path '{path}'")
+            token = path[i + 1:end].strip()
+            i = end + 1
+            if token == '*':
+                parts.append(('*',))
+            elif token[:1] in ('"', "'"):
+                parts.append(token[1:-1])
+            else:
+                try:
+                    parts.append(int(token))
+                except ValueError:
+                    raise CheckError(f"Invalid index '{token}' in path '{path}'")
+        else:
+            raise CheckError(f"Invalid path '{path}'")
+    return parts
+
+
+def jsonpath(obj, path):
+    """Return every value matched by a (simple) JSONPath expression"""
+    matches = [obj]
+    for part in _parse_path(path):
+        found = []
+        for value in matches:
+            if isinstance(part, tuple):
+                if isinstance(value, list):
+                    found.extend(value)
+                elif isinstance(value, dict):
+                    found.extend(value.values())
+            elif isinstance(part, int):
+                if isinstance(value, list) and -len(value) <= part < len(value):
+                    found.append(value[part])
+            elif isinstance(value, dict) and part in value:
+                found.append(value[part])
+        matches = found
+    return matches
+
+
+def _equals(value, expected):
+    if value == expected:
+        return True
+    # Annotations and configmap data are strings; allow comparing as text
+    return isinstance(value, (str, int, float, bool)) and str(value) == str(expected)
+
+
+def evaluate(obj, assertions):
+    """Run assertions against obj (None when it does not exist)
+
+    Returns (passed, lines) where lines describe each assertion result.
+    """
+    passed = True
+    lines = []
+    for assertion in assertions:
+        path = assertion.get('path', '{}')
+        ops = [op for op in ASSERTIONS if op in assertion]
+        if len(ops) != 1:
+            raise CheckError(f"Assertion on '{path}' needs exactly one of: {', '.join(ASSERTIONS)}")
+        op = ops[0]
+        expected = assertion[op]
+
+        matches = jsonpath(obj, path) if obj is not None else []
+        if op == 'exists':
+            ok = bool(matches) == bool(expected)
+        elif op == 'equals':
+            ok = any(_equals(value, expected) for value in matches)
+        elif op == 'regex':
+            try:
+                pattern = re.compile(expected)
+            except re.error as e:
+                raise CheckError(f"Invalid regex '{expected}': {e}")
+            ok = any(pattern.search(value if isinstance(value, str) else str(value)) for value in matches)
+        else:
+            if len(matches) == 1 and isinstance(matches[0], (list, dict)):
+                actual = len(matches[0])
+            else:
+                actual = len(matches)
+            ok = actual == expected
+
+        if ok:
+            lines.append(f"OK   {path} {op} {expected!r}")
+        else:
+            actual_text = ', '.join(repr(value) for value in matches[:3]) or 'nothing'
+            lines.append(f"FAIL {path} {op} {expected!r} (found {actual_text})")
+            passed = False
+    return passed, lines
+
+
+def normalize(check):
+    """Validate a check definition and return (kind, name, namespace, assertions)"""
+    if not isinstance(check, dict):
+        raise CheckError("Check must be an object")
+    kind = check.get('kind')
+    name = check.get('name')
+    if not kind or not name:
+        raise CheckError("Check needs a kind and a name")
+    assertions = check.get('assert', [{'path': '{}', 'exists': True}])
+    if not isinstance(assertions, list):
+        raise CheckError("Check 'assert' must be a list")
+    return kind, name, check.get('namespace') or None, assertions
+
+
+def fetch_command(kind, name, namespace=None):
+    """The oc command that fetches the object a check runs against"""
+    command = f"oc get {shlex.quote(kind)} {shlex.quote(name)}"
+    if namespace:
+        command += f" -n {shlex.quote(namespace)}"
+    return command + " -o json"
@@ -0,0 +1,291 @@
+"""Bounded worker pool that runs shell commands off the request threads.
+
+Request handlers submit a command and wait on the returned job instead of
+owning a subprocess themselves. The pool has a fixed number of workers and a
+bounded queue; every job carries its own timeout and can be cancelled while
+queued or running.
+
+Queued jobs are scheduled by priority class first (validations ahead of
+terminal commands) and round-robin between clients within a class, so one
+client with a long backlog cannot starve the others.
+"""
+import os
+import math
+import time
+import signal
+import threading
+import subprocess
+import contextvars
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, CancelledError, TimeoutError as FutureTimeout
+
+from capture import DEFAULT_MAX_BYTES, read_output
+
+# Result of one command; ``timed_out``/``cancelled`` are set instead of raising.
+# ``truncated`` is set when the middle of stdout or stderr was dropped.
+CommandResult = namedtuple('CommandResult', [
+    'returncode', 'stdout', 'stderr', 'timed_out', 'cancelled', 'duration', 'truncated'
+], defaults=(False,))
+
+
+# Lower runs first; kinds not listed get DEFAULT_PRIORITY
+PRIORITIES = {'validation': 0, 'namespace': 1, 'terminal': 2}
+DEFAULT_PRIORITY = 1
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Job:
+    """A queued command; wait on it with ``result()``"""
+
+    def __init__(self, command, timeout, cwd=None, env=None, kind='command', client=None, fn=None,
+                 on_output=None, wrapper=None, on_cancel=None):
+        self.command = command
+        self.timeout = timeout
+        self.cwd = cwd
+        self.env = env
+        self.kind = kind
+        self.client = client
+        # Called with (stream name, bytes) for each chunk of output as it is read
+        self.on_output = on_output
+        # argv prefix the shell running the command is started under, e.g. prlimit
+        self.wrapper = wrapper or []
+        # A callable run in place of a subprocess (e.g. a command for a session shell)
+        self.fn = fn
+        # Called on cancel() to stop a running fn, which has no process here to kill
+        self.on_cancel = on_cancel
+        self.future = Future()
+        self.process = None
+        self.submitted_at = time.monotonic()
+        # The submitter's context variables (e.g. request id), visible while the job runs
+        self.context = contextvars.copy_context()
+        self._lock = threading.Lock()
+        self._cancelled = False
+
+    def cancel(self):
+        """Cancel the job, killing its process if it already started"""
+        with self._lock:
+            self._cancelled = True
+            process = self.process
+        if process is not None:
+            _kill(process)
+        if self.on_cancel is not None:
+            self.on_cancel()
+        self.future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def result(self, timeout=None):
+        """Wait for the job; on wait timeout the job is cancelled"""
+        try:
+            return self.future.result(timeout=timeout)
+        except CancelledError:
+            return CommandResult(None, '', '', False, True, 0.0)
+        except FutureTimeout:
+            self.cancel()
+            return CommandResult(None, '', '', True, True, time.monotonic() - self.submitted_at)
+
+
+def _kill(process):
+    """Kill a command and everything it spawned"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class CommandExecutor:
+    """Fixed-size pool of worker threads fed from a bounded fair-share queue"""
+
+    def __init__(self, max_workers=8, max_queue=64, max_output=DEFAULT_MAX_BYTES):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        # Bytes of stdout and of stderr kept per command (head and tail)
+        self.max_output = max_output
+        # Called as on_complete(job, result) after each job that ran
+        self.on_complete = None
+        self._lock = threading.Condition()
+        # priority -> OrderedDict(client -> deque of jobs), served round-robin
+        self._queues = {}
+        self._depth = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._timed_out = 0
+        self._cancelled = 0
+        self._rejected = 0
+        self._truncated = 0
+        self._wait_total = {}
+        self._wait_max = {}
+        self._started = {}
+        self._run_total = 0.0
+        self._workers = []
+        for i in range(max_workers):
+            worker = threading.Thread(target=self._work, name=f'executor-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, command, timeout, cwd=None, env=None, kind='command', client=None, fn=None,
+               on_output=None, wrapper=None, on_cancel=None):
+        """Queue a command and return its Job without waiting"""
+        job = Job(command, timeout, cwd=cwd, env=env, kind=kind, client=client, fn=fn,
+                  on_output=on_output, wrapper=wrapper, on_cancel=on_cancel)
+        priority = PRIORITIES.get(kind, DEFAULT_PRIORITY)
+        with self._lock:
+            if self._depth >= self.max_queue:
+                self._rejected += 1
+                raise QueueFull(f"Command queue is full ({self.max_queue} jobs waiting)",
+                                retry_after=self._retry_after())
+            clients = self._queues.setdefault(priority, OrderedDict())
+            clients.setdefault(client, deque()).append(job)
+            self._depth += 1
+            self._lock.notify()
+        return job
+
+    def run(self, command, timeout, cwd=None, env=None, kind='command', queue_timeout=None, client=None):
+        """Submit a command and wait for its result"""
+        job = self.submit(command, timeout, cwd=cwd, env=env, kind=kind, client=client)
+        wait = None if queue_timeout is None else queue_timeout + timeout
+        return job.result(timeout=wait)
+
+    def retry_after(self):
+        """Seconds a rejected client should wait before retrying"""
+        with self._lock:
+            return self._retry_after()
+
+    def _retry_after(self):
+        # Time for the workers to drain the current backlog at the average job length
+        average = self._run_total / self._completed if self._completed else 1.0
+        return max(1, math.ceil(average * (self._depth + self._in_flight) / self.max_workers))
+
+    def stats(self):
+        with self._lock:
+            by_kind = {}
+            for kind, started in self._started.items():
+                by_kind[kind] = {
+                    'started': started,
+                    'wait_avg_ms': round(self._wait_total[kind] / started * 1000, 2),
+                    'wait_max_ms': round(self._wait_max[kind] * 1000, 2)
+                }
+            return {
+                'workers': self.max_workers,
+                'queue_capacity': self.max_queue,
+                'queue_depth': self._depth,
+                'queued_by_priority': {
+                    priority: sum(len(jobs) for jobs in clients.values())
+                    for priority, clients in sorted(self._queues.items())
+                },
+                'queued_clients': sum(len(clients) for clients in self._queues.values()),
+                'in_flight': self._in_flight,
+                'completed': self._completed,
+                'timed_out': self._timed_out,
+                'cancelled': self._cancelled,
+                'rejected': self._rejected,
+                'truncated': self._truncated,
+                'retry_after': self._retry_after(),
+                'by_kind': by_kind
+            }
+
+    def _next_job(self):
+        """Pop the next job: lowest priority class, then the client served longest ago"""
+        with self._lock:
+            while self._depth == 0:
+                self._lock.wait()
+            for priority in sorted(self._queues):
+                clients = self._queues[priority]
+                if not clients:
+                    continue
+                client, jobs = next(iter(clients.items()))
+                job = jobs.popleft()
+                del clients[client]
+                if jobs:
+                    # Back of the line for this client's next job
+                    clients[client] = jobs
+                self._depth -= 1
+                return job
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job.cancelled or not job.future.set_running_or_notify_cancel():
+                with self._lock:
+                    self._cancelled += 1
+                continue
+            waited = time.monotonic() - job.submitted_at
+            with self._lock:
+                self._in_flight += 1
+                self._started[job.kind] = self._started.get(job.kind, 0) + 1
+                self._wait_total[job.kind] = self._wait_total.get(job.kind, 0.0) + waited
+                self._wait_max[job.kind] = max(self._wait_max.get(job.kind, 0.0), waited)
+            started = time.monotonic()
+            try:
+                result = job.context.run(self._run_job, job)
+            except Exception as e:
+                job.future.set_exception(e)
+            else:
+                job.future.set_result(result)
+                with self._lock:
+                    if result.timed_out:
+                        self._timed_out += 1
+                    if result.cancelled:
+                        self._cancelled += 1
+                    if result.truncated:
+                        self._truncated += 1
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                    self._completed += 1
+                    self._run_total += time.monotonic() - started
+
+    def _run_job(self, job):
+        result = job.fn() if job.fn is not None else self._execute(job)
+        if self.on_complete is not None:
+            try:
+                self.on_complete(job, result)
+            except Exception:
+                # Instrumentation must never fail a command
+                pass
+        return result
+
+    def _execute(self, job):
+        started = time.monotonic()
+        process = subprocess.Popen(
+            job.wrapper + ['/bin/sh', '-c', job.command],
+            cwd=job.cwd,
+            env=job.env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True
+        )
+        with job._lock:
+            job.process = process
+            cancelled = job._cancelled
+        if cancelled:
+            _kill(process)
+
+        try:
+            stdout, stderr, timed_out = read_output(process, job.timeout, self.max_output, job.on_output)
+            if timed_out:
+                _kill(process)
+            try:
+                # Output is closed, but the command itself may linger
+                process.wait(timeout=max(0.0, started + job.timeout - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                timed_out = True
+                _kill(process)
+                process.wait()
+        finally:
+            process.stdout.close()
+            process.stderr.close()
+
+        return CommandResult(
+            process.returncode, stdout.text(), stderr.text(), timed_out, job.cancelled,
+            time.monotonic() - started, stdout.truncated or stderr.truncated
+        )
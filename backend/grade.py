@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Grade one question across many student namespaces from the command line.
+
+Examples:
+    python3 backend/grade.py 7 --pattern 'student-*'
+    python3 backend/grade.py 7 -n alice -n bob --concurrency 8 --format table
+
+Results are printed as NDJSON lines as each namespace finishes. Nothing of
+the web app is started: the question catalog and a command executor are
+built here, and checks are not written to the audit log.
+"""
+import os
+import sys
+import json
+import argparse
+
+from bundle import QuestionBundle
+from catalog import QuestionCatalog
+from executor import CommandExecutor
+from result_cache import SingleFlightCache
+from validation import Validator
+
+QUESTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'questions')
+LAB_BUNDLE = os.environ.get('LAB_BUNDLE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'content.bundle'))
+GRADE_MAX_CONCURRENCY = int(os.environ.get('GRADE_MAX_CONCURRENCY', '16'))
+VALIDATION_TIMEOUT = 10
+
+
+def build_validator(concurrency):
+    executor = CommandExecutor(max_workers=concurrency, max_queue=max(64, concurrency))
+    # Only concurrent identical commands are shared; one grading run needs no result cache
+    cache = SingleFlightCache(ttl=0)
+    return Validator(executor, cache, timeout=VALIDATION_TIMEOUT, max_concurrency=GRADE_MAX_CONCURRENCY)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Grade a question across student namespaces')
+    parser.add_argument('question_id', help='question to grade')
+    parser.add_argument('-n', '--namespace', action='append', default=[],
+                        help='namespace to grade (repeatable)')
+    parser.add_argument('-p', '--pattern', help="glob of namespaces to grade, e.g. 'student-*'")
+    parser.add_argument('-c', '--concurrency', type=int, default=GRADE_MAX_CONCURRENCY,
+                        help=f'namespaces graded at once (max {GRADE_MAX_CONCURRENCY})')
+    parser.add_argument('--format', choices=['ndjson', 'table'], default='ndjson')
+    args = parser.parse_args(argv)
+
+    catalog = QuestionCatalog(QUESTIONS_DIR, bundle=QuestionBundle(LAB_BUNDLE), tree='questions')
+    try:
+        validation_commands = catalog.validation(args.question_id)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        parser.error(f'cannot load validation of question {args.question_id}: {e}')
+
+    concurrency = max(1, min(args.concurrency, GRADE_MAX_CONCURRENCY))
+    validator = build_validator(concurrency)
+    namespaces = set(args.namespace)
+    if args.pattern:
+        namespaces.update(validator.list_namespaces(args.pattern))
+    if not namespaces:
+        parser.error('no namespaces given (use --namespace or --pattern)')
+
+    passed = 0
+    for result in validator.grade(args.question_id, validation_commands, sorted(namespaces), concurrency):
+        passed += result['passed']
+        if args.format == 'ndjson':
+            print(json.dumps(result), flush=True)
+        else:
+            done = len(result.get('completed_steps', []))
+            total = result.get('total_steps', 0)
+            status = 'PASS' if result['passed'] else 'FAIL'
+            print(f"{status}  {result['namespace']:<32} {done}/{total}  {result.get('error', '')}", flush=True)
+
+    print(f"{passed}/{len(namespaces)} namespaces completed question {args.question_id}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Cached response bodies with strong ETags and precompressed variants.
+
+A body is serialized once per version of what it was built from, hashed for
+its ETag, and compressed at most once per encoding; later requests get the
+stored bytes, or ``304 Not Modified`` when the client already has them.
+Brotli is used when the ``brotli`` package is installed, gzip otherwise.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent as they are
+COMPRESS_MIN_BYTES = 256
+
+
+def available_encodings():
+    """Supported content codings, most preferred first"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def choose_encoding(accept_encoding, encodings=None):
+    """Best coding from an Accept-Encoding header, or None for identity"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    for encoding in encodings or available_encodings():
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def etag_for(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+class CachedBody:
+    """One response body, its ETag and its compressed forms"""
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag_for(body)
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        """(bytes, encoding actually used) for a negotiated encoding"""
+        if encoding is None or len(self.body) < COMPRESS_MIN_BYTES:
+            return self.body, None
+        with self._lock:
+            data = self._variants.get(encoding)
+            if data is None:
+                data = self._variants[encoding] = compress(self.body, encoding)
+        return data, encoding
+
+
+class ResponseCache:
+    """CachedBody per key (e.g. question id and revision), least recently used evicted"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._not_modified = 0
+
+    def get(self, key, build, mimetype='application/json'):
+        """Cached body for `key`, calling build() -> bytes on a miss"""
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return cached
+            self._misses += 1
+
+        cached = CachedBody(build(), mimetype)
+        with self._lock:
+            self._entries[key] = cached
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return cached
+
+    def not_modified(self):
+        with self._lock:
+            self._not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'not_modified': self._not_modified,
+                'encodings': available_encodings()
+            }
@@ -0,0 +1,240 @@
+"""Resource limits for commands run on behalf of students.
+
+Every terminal process (session shells, interactive sessions and one-off
+terminal commands) is started through ``prlimit`` with rlimits on address
+space and written file size, so nothing runs between fork and exec in this
+threaded server. One-off commands get their CPU seconds the same way; the
+long-lived shells instead have their RLIMIT_CPU moved before each command
+(``limit_command``), since the kernel counts a process's CPU time over its
+whole life. Where a delegated cgroup v2 directory is
+configured, each session additionally gets its own child cgroup with
+``memory.max`` (real RSS), ``pids.max`` and ``cpu.max``, so a fork loop or
+memory hog is contained to that session; the server moves the session's
+process into it by writing its pid to ``cgroup.procs``.
+
+Without a cgroup the process count can only be capped with RLIMIT_NPROC,
+which counts every process of the server's user (other students' shells and
+the server's own threads included), so it is off unless ``nproc_rlimit`` is
+set explicitly.
+
+After a command finishes, ``check`` works out which limits it ran into from
+its exit status, its stderr and the cgroup's event counters, and counts them.
+"""
+import os
+import re
+import math
+import shutil
+import resource
+import signal
+import threading
+
+# Exit signals that mean a limit was enforced
+LIMIT_SIGNALS = {signal.SIGXCPU: 'cpu', signal.SIGXFSZ: 'file_size'}
+
+# What commands print when an allocation or fork is refused
+MEMORY_ERRORS = re.compile(r'Cannot allocate memory|MemoryError|out of memory|bad_alloc', re.I)
+PROCESS_ERRORS = re.compile(r'fork: (retry: )?Resource temporarily unavailable|Cannot fork', re.I)
+# How the shell reports a pipeline member killed by a limit signal
+SIGNAL_ERRORS = {'cpu': 'CPU time limit exceeded', 'file_size': 'File size limit exceeded'}
+
+MB = 1024 * 1024
+
+
+def _cpu_seconds(pid):
+    """CPU time a process has used itself (user + system), from /proc"""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def _exit_signal(returncode):
+    """Signal that ended a command, from Popen (-N) or from a shell (128+N)"""
+    if returncode is None:
+        return None
+    if returncode < 0:
+        return -returncode
+    if returncode > 128:
+        return returncode - 128
+    return None
+
+
+class SessionCgroup:
+    """A cgroup v2 directory holding one session's processes"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def create(self, memory_bytes=0, max_processes=0, cpu_quota=0):
+        os.makedirs(self.path, exist_ok=True)
+        if memory_bytes:
+            self._write('memory.max', str(memory_bytes))
+        if max_processes:
+            self._write('pids.max', str(max_processes))
+        if cpu_quota:
+            # Share of one CPU per 100ms period
+            self._write('cpu.max', f"{int(cpu_quota * 100000)} 100000")
+        return self
+
+    def _write(self, name, value):
+        try:
+            with open(os.path.join(self.path, name), 'w') as f:
+                f.write(value)
+        except OSError:
+            # Controller not enabled for this subtree
+            pass
+
+    def events(self):
+        """Counters of limit hits: memory OOM kills and refused forks"""
+        counts = {'memory': 0, 'processes': 0}
+        for name, key, label in (('memory.events', 'oom_kill', 'memory'), ('pids.events', 'max', 'processes')):
+            try:
+                with open(os.path.join(self.path, name)) as f:
+                    for line in f:
+                        field, _, value = line.partition(' ')
+                        if field == key:
+                            counts[label] = int(value)
+            except (OSError, ValueError):
+                pass
+        return counts
+
+    def add(self, pid):
+        """Move a process (and the children it starts from now on) into the cgroup"""
+        self._write('cgroup.procs', str(pid))
+
+    def remove(self):
+        """Kill anything left in the cgroup and delete it"""
+        try:
+            self._write('cgroup.kill', '1')
+            os.rmdir(self.path)
+        except OSError:
+            pass
+
+
+class ResourceLimits:
+    """Limits applied to student processes, with counters of limit hits"""
+
+    def __init__(self, cpu_seconds=0, memory_mb=0, max_processes=0, file_mb=0,
+                 cgroup_root=None, cpu_quota=0, nproc_rlimit=0):
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = int(memory_mb * MB)
+        # pids.max of a session's cgroup
+        self.max_processes = max_processes
+        # RLIMIT_NPROC for processes without a cgroup (per user, see above)
+        self.nproc_rlimit = nproc_rlimit
+        self.file_bytes = int(file_mb * MB)
+        self.cpu_quota = cpu_quota
+        self.cgroup_root = cgroup_root if cgroup_root and os.access(cgroup_root, os.W_OK) else None
+        self.prlimit = shutil.which('prlimit')
+        self._lock = threading.Lock()
+        self._hits = {'cpu': 0, 'memory': 0, 'processes': 0, 'file_size': 0, 'output': 0}
+        self._checked = 0
+
+    @property
+    def enabled(self):
+        return bool(self.cpu_seconds or self.memory_bytes or self.nproc_rlimit or self.file_bytes
+                    or self.cgroup_root)
+
+    def cgroup(self, session_id):
+        """Create the session's cgroup, or return None when cgroups are not configured"""
+        if self.cgroup_root is None:
+            return None
+        try:
+            return SessionCgroup(os.path.join(self.cgroup_root, f'session-{session_id}')).create(
+                memory_bytes=self.memory_bytes,
+                max_processes=self.max_processes,
+                cpu_quota=self.cpu_quota
+            )
+        except OSError:
+            return None
+
+    def wrapper(self, cgroup=None, cpu=True):
+        """argv prefix that starts a command under the rlimits (empty if there are none)
+
+        Long-lived shells pass cpu=False and get their CPU limit from
+        limit_command() before each command instead.
+        """
+        options = []
+        if self.cpu_seconds and cpu:
+            # SIGXCPU at the soft limit, SIGKILL one second later
+            options.append(f'--cpu={self.cpu_seconds}:{self.cpu_seconds + 1}')
+        if self.memory_bytes and cgroup is None:
+            # Address space stands in for RSS when there is no memory cgroup
+            options.append(f'--as={self.memory_bytes}')
+        if self.nproc_rlimit and cgroup is None:
+            options.append(f'--nproc={self.nproc_rlimit}')
+        if self.file_bytes:
+            options.append(f'--fsize={self.file_bytes}')
+        if not options or self.prlimit is None:
+            return []
+        return [self.prlimit] + options + ['--']
+
+    def started(self, process, cgroup=None):
+        """Called with a freshly started session process, before it is given any command"""
+        if cgroup is not None:
+            cgroup.add(process.pid)
+
+    def limit_command(self, process):
+        """Give the next command of a long-lived shell cpu_seconds of CPU time
+
+        The shell's soft RLIMIT_CPU is set to the time it has used so far
+        plus cpu_seconds, so it only runs out within a single command. The
+        processes the command starts inherit the limit and count from zero.
+        The hard limit is left alone, since raising it again for the next
+        command would need privileges.
+        """
+        if not self.cpu_seconds:
+            return
+        try:
+            _, hard = resource.prlimit(process.pid, resource.RLIMIT_CPU)
+            soft = math.ceil(_cpu_seconds(process.pid)) + self.cpu_seconds
+            if hard != resource.RLIM_INFINITY:
+                soft = min(soft, hard)
+            resource.prlimit(process.pid, resource.RLIMIT_CPU, (soft, hard))
+        except (OSError, ValueError):
+            # The shell already exited; its next start is limited again
+            pass
+
+    def check(self, result, cgroup=None, events_before=None):
+        """Names of the limits a finished command ran into; counted in stats()"""
+        hits = []
+        sig = _exit_signal(result.returncode)
+        if sig in LIMIT_SIGNALS:
+            hits.append(LIMIT_SIGNALS[sig])
+
+        stderr = result.stderr or ''
+        for name, message in SIGNAL_ERRORS.items():
+            if name not in hits and message in stderr:
+                hits.append(name)
+        if cgroup is not None and events_before is not None:
+            events = cgroup.events()
+            for name in ('memory', 'processes'):
+                if events[name] > events_before.get(name, 0):
+                    hits.append(name)
+        else:
+            if self.memory_bytes and MEMORY_ERRORS.search(stderr):
+                hits.append('memory')
+            if self.nproc_rlimit and PROCESS_ERRORS.search(stderr):
+                hits.append('processes')
+        if result.truncated:
+            hits.append('output')
+
+        with self._lock:
+            self._checked += 1
+            for name in hits:
+                self._hits[name] += 1
+        return hits
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'cpu_seconds': self.cpu_seconds,
+                'memory_mb': self.memory_bytes // MB,
+                'max_processes': self.max_processes,
+                'nproc_rlimit': self.nproc_rlimit,
+                'prlimit': self.prlimit is not None,
+                'file_mb': self.file_bytes // MB,
+                'cgroups': self.cgroup_root is not None,
+                'commands_checked': self._checked,
+                'hits': dict(self._hits)
+            }
@@ -0,0 +1,132 @@
+"""Minimal in-process metrics registry rendered in the Prometheus text format.
+
+Counters and histograms are updated on the hot path with a single lock
+acquisition. Values that already live elsewhere (queue depths, session
+counts, cache counters) are registered as callbacks and read only when
+``/metrics`` is scraped.
+"""
+import math
+import threading
+
+# Latency buckets in seconds, from a cached page load to a slow oc call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Metric:
+    """A named metric family; samples are keyed by their sorted label pairs"""
+
+    type = 'untyped'
+
+    def __init__(self, name, help, fn=None):
+        self.name = name
+        self.help = help
+        # fn() -> number, or list of (labels dict, number)
+        self.fn = fn
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def samples(self):
+        if self.fn is not None:
+            value = self.fn()
+            if isinstance(value, (list, tuple)):
+                return [(self.name, tuple(sorted(labels.items())), v) for labels, v in value]
+            return [(self.name, (), value)]
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for name, labels, value in self.samples():
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((f'{self.name}_bucket', labels + (('le', _format_value(bound)),), cumulative))
+                samples.append((f'{self.name}_sum', labels, total))
+                samples.append((f'{self.name}_count', labels, count))
+        return samples
+
+
+class Registry:
+    """All metrics of this process, in registration order"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, fn=None):
+        return self._add(Counter(name, help, fn))
+
+    def gauge(self, name, help, fn=None):
+        return self._add(Gauge(name, help, fn))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, buckets))
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
@@ -0,0 +1,282 @@
+"""Pool of pre-created, clean namespaces handed out on request.
+
+Creating a namespace right after deleting one often stalls or fails because
+deletion finishes asynchronously in the cluster. The pool keeps ``size``
+fresh namespaces warm, hands one out instantly, and recycles returned ones in
+the background: it deletes them, waits until the API server no longer knows
+them, and creates replacements to get back to the target size.
+
+Each pooled namespace carries a ``lab-platform/pool`` label saying whether it
+is ``available`` or ``leased``, so leases survive a restart, and a
+``lab-platform/pool-owner`` label naming the process that created it. The
+sweep only recycles namespaces that were never handed out and whose owner
+process is gone, so it is safe while sibling workers keep their own pools.
+"""
+import os
+import json
+import time
+import uuid
+import shlex
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+POOL_LABEL = 'lab-platform/pool'
+OWNER_LABEL = 'lab-platform/pool-owner'
+AVAILABLE = 'available'
+LEASED = 'leased'
+HOST = socket.gethostname()[:40]
+
+
+def owner_alive(owner):
+    """Whether the process named by an owner label may still hold its namespaces
+
+    Processes on other hosts can't be checked and count as alive.
+    """
+    host, _, pid = (owner or '').rpartition('.')
+    if host != HOST:
+        return bool(host)
+    try:
+        os.kill(int(pid), 0)
+    except ValueError:
+        return False
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def wait_for_deletion(run, namespace, timeout, poll=1.0):
+    """Poll until a namespace is gone (not merely Terminating); returns True if it is"""
+    deadline = time.monotonic() + timeout
+    command = f"oc get namespace {shlex.quote(namespace)} -o name"
+    while True:
+        result = run(command, timeout=10)
+        if result.returncode != 0 and 'NotFound' in (result.stderr or ''):
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(poll)
+
+
+class NamespacePool:
+    """Warm namespaces for instant hand-out, refilled in the background"""
+
+    def __init__(self, run, size, prefix='lab', delete_timeout=120, recyclers=4, sweep_interval=300):
+        # run(command, timeout) -> CommandResult
+        self.run = run
+        self.size = size
+        self.prefix = prefix
+        self.delete_timeout = delete_timeout
+        self.sweep_interval = sweep_interval
+        # Owner label value of this process's namespaces
+        self.owner = f'{HOST}.{os.getpid()}'
+        self._lock = threading.Condition()
+        self._available = []
+        self._leased = set()
+        self._creating = 0
+        self._recycling = 0
+        self._hits = 0
+        self._misses = 0
+        self._failures = 0
+        self._recycled = 0
+        self._recycle_total = 0.0
+        self._recycle_max = 0.0
+        self._recyclers = ThreadPoolExecutor(max_workers=recyclers, thread_name_prefix='ns-recycle')
+        self._stop = threading.Event()
+        self._filler = None
+
+    def owns(self, namespace):
+        return namespace.startswith(f'{self.prefix}-')
+
+    def start(self, sweeper=None):
+        """Keep the pool filled in the background, sweeping unleased leftovers first and every sweep_interval
+
+        With sibling processes sharing the prefix, pass `sweeper()` saying
+        whether this one is elected to sweep.
+        """
+        self._filler = threading.Thread(target=self._fill_loop, args=(sweeper,), name='ns-pool-fill', daemon=True)
+        self._filler.start()
+        return self
+
+    def sweep(self):
+        """Recycle available (never handed out) pool namespaces whose owner is gone; returns how many"""
+        result = self.run(f"oc get namespaces -l {POOL_LABEL}={AVAILABLE} -o json", timeout=30)
+        if result.returncode != 0:
+            return 0
+        try:
+            items = json.loads(result.stdout).get('items') or []
+        except ValueError:
+            return 0
+        swept = 0
+        for item in items:
+            metadata = item.get('metadata') or {}
+            name = metadata.get('name', '')
+            owner = (metadata.get('labels') or {}).get(OWNER_LABEL)
+            if not self.owns(name) or owner == self.owner or owner_alive(owner):
+                continue
+            self._schedule_recycle(name)
+            swept += 1
+        return swept
+
+    def state(self, namespace):
+        """The namespace's pool label (available/leased), or None if it has none or is gone"""
+        result = self.run(f"oc get namespace {shlex.quote(namespace)} -o json", timeout=10)
+        if result.returncode != 0:
+            return None
+        try:
+            labels = json.loads(result.stdout).get('metadata', {}).get('labels') or {}
+        except ValueError:
+            return None
+        return labels.get(POOL_LABEL)
+
+    def _label(self, namespace, state):
+        try:
+            result = self.run(f"oc label namespace {shlex.quote(namespace)} {POOL_LABEL}={state} "
+                              f"{OWNER_LABEL}={shlex.quote(self.owner)} --overwrite", timeout=30)
+            return result.returncode == 0
+        except Exception:
+            return False
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            self._lock.notify_all()
+        self._recyclers.shutdown(wait=False)
+
+    def acquire(self):
+        """Take a clean namespace from the pool
+
+        On a miss a namespace is created on the spot; returns None only if
+        that fails too.
+        """
+        while True:
+            with self._lock:
+                if not self._available:
+                    self._misses += 1
+                    self._lock.notify_all()
+                    break
+                namespace = self._available.pop()
+                self._lock.notify_all()
+            # The lease is recorded on the namespace before it is handed out
+            if self._label(namespace, LEASED):
+                with self._lock:
+                    self._leased.add(namespace)
+                    self._hits += 1
+                return namespace
+            self._schedule_recycle(namespace)
+
+        namespace = self._create(LEASED)
+        if namespace is not None:
+            with self._lock:
+                self._leased.add(namespace)
+        return namespace
+
+    def release(self, namespace):
+        """Give a namespace back; it is deleted and replaced in the background
+
+        A lease from before a restart, or one taken by a sibling worker, is
+        recognised by its label; namespaces still waiting in a pool are not
+        leased and are left alone.
+        """
+        with self._lock:
+            leased = namespace in self._leased
+            self._leased.discard(namespace)
+        if not leased and not (self.owns(namespace) and self.state(namespace) == LEASED):
+            return False
+        self._schedule_recycle(namespace)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'target_size': self.size,
+                'owner': self.owner,
+                'available': len(self._available),
+                'leased': len(self._leased),
+                'creating': self._creating,
+                'recycling': self._recycling,
+                'hits': self._hits,
+                'misses': self._misses,
+                'failures': self._failures,
+                'recycled': self._recycled,
+                'recycle_avg_seconds': round(self._recycle_total / self._recycled, 3) if self._recycled else None,
+                'recycle_max_seconds': round(self._recycle_max, 3)
+            }
+
+    def _schedule_recycle(self, namespace):
+        with self._lock:
+            self._recycling += 1
+        self._recyclers.submit(self._recycle, namespace)
+
+    def _recycle(self, namespace):
+        started = time.monotonic()
+        try:
+            self.run(f"oc delete namespace {shlex.quote(namespace)} --ignore-not-found --wait=false",
+                     timeout=30)
+            gone = wait_for_deletion(self.run, namespace, self.delete_timeout)
+        except Exception:
+            gone = False
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._recycling -= 1
+            if gone:
+                self._recycled += 1
+                self._recycle_total += elapsed
+                self._recycle_max = max(self._recycle_max, elapsed)
+            else:
+                self._failures += 1
+            self._lock.notify_all()
+
+    def _maybe_sweep(self, sweeper):
+        try:
+            if sweeper is None or sweeper():
+                self.sweep()
+        except Exception:
+            pass
+
+    def _fill_loop(self, sweeper):
+        self._maybe_sweep(sweeper)
+        next_sweep = time.monotonic() + self.sweep_interval
+        while not self._stop.is_set():
+            with self._lock:
+                while (len(self._available) + self._creating >= self.size
+                       and not self._stop.is_set()):
+                    self._lock.wait(timeout=30)
+                    if time.monotonic() >= next_sweep:
+                        break
+                if self._stop.is_set():
+                    return
+                full = len(self._available) + self._creating >= self.size
+                if not full:
+                    self._creating += 1
+            if time.monotonic() >= next_sweep:
+                next_sweep = time.monotonic() + self.sweep_interval
+                self._maybe_sweep(sweeper)
+            if full:
+                continue
+
+            namespace = self._create(AVAILABLE)
+            with self._lock:
+                self._creating -= 1
+                if namespace is not None:
+                    self._available.append(namespace)
+            if namespace is None:
+                # Back off instead of hammering an unhealthy API server
+                self._stop.wait(5)
+
+    def _create(self, state):
+        namespace = f'{self.prefix}-{uuid.uuid4().hex[:8]}'
+        try:
+            result = self.run(f"oc create namespace {shlex.quote(namespace)}", timeout=30)
+            if result.returncode == 0:
+                if self._label(namespace, state):
+                    return namespace
+                # Without its label it could not be told apart after a restart
+                self._schedule_recycle(namespace)
+        except Exception:
+            pass
+        with self._lock:
+            self._failures += 1
+        return None
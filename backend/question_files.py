@@ -0,0 +1,189 @@
+"""Atomic, versioned edits of question directories.
+
+Every file is written to a temporary file in the same directory and renamed
+over the old one, so readers see either the old or the new content and
+never a partial file. Edits of one question are serialized with an
+``flock`` on its directory (which also covers other worker processes), and
+each one that changes something bumps the ``version`` stored in
+``metadata.json``. Callers can pass
+the version they last read; if the question changed since, the edit is
+refused with VersionConflict instead of overwriting someone else's work.
+"""
+import os
+import json
+import fcntl
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+class VersionConflict(Exception):
+    """The question was changed since the version the caller last read"""
+
+    def __init__(self, current):
+        super().__init__(f"Question was changed by someone else (now at version {current})")
+        self.current = current
+
+
+def atomic_write(path, text):
+    """Replace `path` with `text` in one rename"""
+    directory = os.path.dirname(path)
+    # Dot-prefixed and not *.md, so step listings never pick it up
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path, data):
+    atomic_write(path, json.dumps(data, indent=2))
+
+
+def valid_question_id(question_id):
+    """Letters, digits and hyphens only, so an id can never name a path outside the tree"""
+    return isinstance(question_id, str) and question_id.replace('-', '').isalnum()
+
+
+def valid_step_id(step_id):
+    return isinstance(step_id, str) and step_id.isdigit()
+
+
+class QuestionFiles:
+    """Writer for the question directories under `root_dir`"""
+
+    def __init__(self, root_dir, validation_file='validation.json'):
+        self.root_dir = root_dir
+        self.validation_file = validation_file
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def question_dir(self, question_id):
+        return os.path.join(self.root_dir, question_id)
+
+    @contextmanager
+    def locked(self, question_id):
+        """Hold the question's thread lock and directory flock"""
+        with self._lock:
+            lock = self._locks.setdefault(question_id, threading.Lock())
+        with lock:
+            fd = os.open(self.question_dir(question_id), os.O_RDONLY)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)
+
+    def _read_json(self, path, default):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+
+    def metadata(self, question_id):
+        return self._read_json(os.path.join(self.question_dir(question_id), 'metadata.json'),
+                               {'title': question_id, 'description': ''})
+
+    def version(self, question_id):
+        return self.metadata(question_id).get('version', 0)
+
+    def create(self, question_id, metadata, validation, steps):
+        """Write a new question directory at version 1"""
+        question_dir = self.question_dir(question_id)
+        steps_dir = os.path.join(question_dir, 'steps')
+        os.makedirs(steps_dir, exist_ok=True)
+        with self.locked(question_id):
+            for step_id, content in steps.items():
+                atomic_write(os.path.join(steps_dir, f'{step_id}.md'), content)
+            atomic_write_json(os.path.join(question_dir, self.validation_file), validation)
+            # Metadata last: it carries the version
+            atomic_write_json(os.path.join(question_dir, 'metadata.json'), dict(metadata, version=1))
+        return 1
+
+    def delete(self, question_id):
+        """Remove a question directory, waiting for edits in progress to finish"""
+        question_dir = self.question_dir(question_id)
+        if not os.path.isdir(question_dir):
+            raise FileNotFoundError(question_dir)
+        with self.locked(question_id):
+            shutil.rmtree(question_dir)
+
+    def update(self, question_id, expected_version=None, metadata=None, steps=None, replace_steps=False,
+               validation=None, replace_validation=False):
+        """Apply an edit and return (version, whether anything changed)
+
+        `metadata` fields are merged into metadata.json. `steps` maps step
+        ids to Markdown (None deletes a step); with replace_steps, steps not
+        listed are deleted too. `validation` maps step ids to checks (None
+        removes one), or replaces the whole map with replace_validation.
+        Files whose content would not change are left alone, and an edit
+        that changes nothing keeps the version.
+        """
+        question_dir = self.question_dir(question_id)
+        if not os.path.isdir(question_dir):
+            raise FileNotFoundError(question_dir)
+
+        with self.locked(question_id):
+            # Deleted while we waited for the lock
+            if not os.path.isdir(question_dir):
+                raise FileNotFoundError(question_dir)
+            current = self.metadata(question_id)
+            version = current.get('version', 0)
+            if expected_version is not None and expected_version != version:
+                raise VersionConflict(version)
+            changed = False
+
+            steps_dir = os.path.join(question_dir, 'steps')
+            if steps is not None or replace_steps:
+                os.makedirs(steps_dir, exist_ok=True)
+                existing = {f[:-3] for f in os.listdir(steps_dir) if f.endswith('.md')}
+                steps = dict(steps or {})
+                if replace_steps:
+                    steps.update({step_id: None for step_id in existing if step_id not in steps})
+                for step_id, content in steps.items():
+                    path = os.path.join(steps_dir, f'{step_id}.md')
+                    if content is None:
+                        if step_id in existing:
+                            os.remove(path)
+                            changed = True
+                        continue
+                    if step_id in existing:
+                        with open(path, 'r') as f:
+                            if f.read() == content:
+                                continue
+                    atomic_write(path, content)
+                    changed = True
+
+            if validation is not None:
+                validation_path = os.path.join(question_dir, self.validation_file)
+                old = self._read_json(validation_path, {})
+                if replace_validation:
+                    new = dict(validation)
+                else:
+                    new = dict(old)
+                    for step_id, check in validation.items():
+                        if check is None:
+                            new.pop(step_id, None)
+                        else:
+                            new[step_id] = check
+                if new != old or not os.path.exists(validation_path):
+                    atomic_write_json(validation_path, new)
+                    changed = True
+
+            updated = dict(current, **(metadata or {}))
+            if not changed and updated == current:
+                return version, False
+            updated['version'] = version + 1
+            atomic_write_json(os.path.join(question_dir, 'metadata.json'), updated)
+            return version + 1, True
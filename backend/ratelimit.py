@@ -0,0 +1,101 @@
+"""Token-bucket rate limits for command requests, per session and per client IP.
+
+A command costs one token from every bucket it is keyed on; the app keys
+requests of a known session on the session and others on the client IP.
+Buckets refill continuously at ``rate`` tokens per second up to ``burst``; a
+caller with an empty bucket is told how long to wait instead of being queued.
+Idle buckets are full by definition, so only the most recently used
+``max_keys`` buckets per scope are kept.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """Tokens refilled at `rate` per second, holding at most `burst`"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost=1):
+        """Seconds until `cost` tokens are available (0 if they are now)"""
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Keyed token buckets for several scopes, checked together"""
+
+    def __init__(self, limits, max_keys=10000):
+        # limits: {scope: (rate, burst)}; a rate <= 0 disables that scope
+        self.limits = {scope: limit for scope, limit in limits.items() if limit[0] > 0}
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {scope: OrderedDict() for scope in self.limits}
+        self._allowed = 0
+        self._limited = {scope: 0 for scope in self.limits}
+
+    def acquire(self, cost=1, **keys):
+        """Take `cost` tokens from every keyed bucket, or none of them
+
+        Returns 0 when the request may run, otherwise the seconds until it
+        could.
+        """
+        now = time.monotonic()
+        with self._lock:
+            buckets = []
+            for scope, key in keys.items():
+                if key is None or scope not in self.limits:
+                    continue
+                bucket = self._bucket(scope, key)
+                bucket.refill(now)
+                buckets.append((scope, bucket))
+
+            waits = [(bucket.wait_time(cost), scope) for scope, bucket in buckets]
+            wait, scope = max(waits, default=(0.0, None))
+            if wait > 0:
+                self._limited[scope] += 1
+                return wait
+
+            for _, bucket in buckets:
+                bucket.tokens -= cost
+            self._allowed += 1
+            return 0
+
+    def _bucket(self, scope, key):
+        buckets = self._buckets[scope]
+        bucket = buckets.get(key)
+        if bucket is None:
+            rate, burst = self.limits[scope]
+            bucket = buckets[key] = TokenBucket(rate, burst)
+            if len(buckets) > self.max_keys:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(key)
+        return bucket
+
+    def stats(self):
+        with self._lock:
+            return {
+                'allowed': self._allowed,
+                'limits': {
+                    scope: {
+                        'rate': rate,
+                        'burst': burst,
+                        'tracked': len(self._buckets[scope]),
+                        'limited': self._limited[scope]
+                    }
+                    for scope, (rate, burst) in self.limits.items()
+                }
+            }
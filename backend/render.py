@@ -0,0 +1,136 @@
+"""Server-side rendering of step Markdown to sanitized HTML.
+
+Steps are rendered once with ``markdown`` and the HTML is cached under the
+SHA-256 of the source, so an unchanged step is never rendered twice no matter
+how often its question is reloaded or rebuilt. Raw HTML in the source is
+passed through an allowlist: unknown tags are dropped (their text is kept),
+``script``/``style`` are dropped with their contents, and only a few
+attributes survive, with ``javascript:`` style URLs removed.
+"""
+import re
+import hashlib
+import threading
+from html import escape
+from html.parser import HTMLParser
+from collections import OrderedDict
+
+import markdown
+
+EXTENSIONS = ['fenced_code', 'tables', 'sane_lists']
+
+ALLOWED_TAGS = {
+    'a', 'abbr', 'b', 'blockquote', 'br', 'code', 'dd', 'del', 'div', 'dl', 'dt', 'em',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'i', 'img', 'kbd', 'li', 'ol', 'p', 'pre',
+    'span', 'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'th', 'thead', 'tr', 'ul'
+}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'img': {'src', 'alt', 'title'},
+    'code': {'class'},
+    'th': {'align'},
+    'td': {'align'}
+}
+VOID_TAGS = {'br', 'hr', 'img'}
+# Dropped together with everything inside them
+DROP_CONTENT_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'template'}
+SAFE_URL = re.compile(r'^(https?:|mailto:|/|#|\.|[^:]*$)', re.I)
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.open_tags = []
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+        allowed = ALLOWED_ATTRIBUTES.get(tag, ())
+        parts = [tag]
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in ('href', 'src') and not SAFE_URL.match(value.strip()):
+                continue
+            parts.append(f'{name}="{escape(value)}"')
+        self.out.append(f"<{' '.join(parts)}>")
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.open_tags and self.open_tags[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping or tag not in self.open_tags:
+            return
+        # Close anything left open inside this tag too
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.out.append(f'</{open_tag}>')
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.out.append(escape(data, quote=False))
+
+    def result(self):
+        self.close()
+        return ''.join(self.out) + ''.join(f'</{tag}>' for tag in reversed(self.open_tags))
+
+
+def sanitize_html(html):
+    """Keep only allowlisted tags and attributes of `html`"""
+    sanitizer = _Sanitizer()
+    sanitizer.feed(html)
+    return sanitizer.result()
+
+
+def render_markdown(source):
+    return sanitize_html(markdown.markdown(source, extensions=EXTENSIONS))
+
+
+def content_hash(source):
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+class StepRenderer:
+    """Rendered step HTML keyed by the hash of its Markdown, least recently used evicted"""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._html = OrderedDict()
+        self._hits = 0
+        self._renders = 0
+
+    def render(self, source):
+        key = content_hash(source)
+        with self._lock:
+            html = self._html.get(key)
+            if html is not None:
+                self._html.move_to_end(key)
+                self._hits += 1
+                return html
+
+        # Rendering is pure, so a concurrent duplicate is harmless
+        html = render_markdown(source)
+        with self._lock:
+            self._renders += 1
+            self._html[key] = html
+            while len(self._html) > self.max_entries:
+                self._html.popitem(last=False)
+        return html
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._html), 'hits': self._hits, 'renders': self._renders}
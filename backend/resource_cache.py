@@ -0,0 +1,320 @@
+"""In-process cache of cluster objects fed by list+watch.
+
+One background thread per resource kind lists every object from the
+Kubernetes API, then follows the watch stream so the index stays current.
+Objects are indexed by kind, namespace and name, which lets simple read-only
+validations (``oc get <kind> <name> -n <ns>``) be answered without spawning
+``oc`` or making an API round trip.
+
+The cache talks plain HTTP(S) to the API server, so it works the same against
+a real cluster and against a local stub that serves list/watch responses.
+It is configured from the environment:
+
+    RESOURCE_CACHE_API_URL     API server URL; the cache is disabled when unset
+    RESOURCE_CACHE_TOKEN       bearer token (or RESOURCE_CACHE_TOKEN_FILE)
+    RESOURCE_CACHE_CA_FILE     CA bundle for TLS verification
+    RESOURCE_CACHE_INSECURE    set to 1 to skip TLS verification
+    RESOURCE_CACHE_KINDS       comma separated kinds to watch
+"""
+import os
+import ssl
+import json
+import shlex
+import time
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# kind -> (API group path, plural, namespaced)
+RESOURCES = {
+    'namespaces': ('/api/v1', 'namespaces', False),
+    'configmaps': ('/api/v1', 'configmaps', True),
+    'pods': ('/api/v1', 'pods', True),
+    'services': ('/api/v1', 'services', True),
+    'secrets': ('/api/v1', 'secrets', True),
+    'serviceaccounts': ('/api/v1', 'serviceaccounts', True),
+    'persistentvolumeclaims': ('/api/v1', 'persistentvolumeclaims', True),
+    'deployments': ('/apis/apps/v1', 'deployments', True),
+    'statefulsets': ('/apis/apps/v1', 'statefulsets', True),
+    'daemonsets': ('/apis/apps/v1', 'daemonsets', True),
+    'replicasets': ('/apis/apps/v1', 'replicasets', True),
+    'routes': ('/apis/route.openshift.io/v1', 'routes', True),
+}
+
+# Names accepted by `oc get` for each kind
+ALIASES = {
+    'ns': 'namespaces', 'namespace': 'namespaces', 'project': 'namespaces', 'projects': 'namespaces',
+    'cm': 'configmaps', 'configmap': 'configmaps',
+    'po': 'pods', 'pod': 'pods',
+    'svc': 'services', 'service': 'services',
+    'secret': 'secrets',
+    'sa': 'serviceaccounts', 'serviceaccount': 'serviceaccounts',
+    'pvc': 'persistentvolumeclaims', 'persistentvolumeclaim': 'persistentvolumeclaims',
+    'deploy': 'deployments', 'deployment': 'deployments',
+    'sts': 'statefulsets', 'statefulset': 'statefulsets',
+    'ds': 'daemonsets', 'daemonset': 'daemonsets',
+    'rs': 'replicasets', 'replicaset': 'replicasets',
+    'route': 'routes',
+}
+
+DEFAULT_KINDS = 'namespaces,configmaps,pods,services,deployments'
+
+# Seconds the API server keeps one watch request open before we re-watch
+WATCH_TIMEOUT = 300
+
+
+def canonical_kind(kind):
+    """Map an `oc get` resource name to the plural kind used as index key"""
+    if not kind:
+        return None
+    kind = kind.lower().split('.')[0]
+    if kind in RESOURCES:
+        return kind
+    return ALIASES.get(kind)
+
+
+def parse_get_command(command):
+    """Parse ``oc|kubectl get <kind> <name> [-n <ns>]`` into (kind, name, namespace)
+
+    Returns None for anything more complex (pipes, output flags, selectors),
+    so those commands keep running through the shell.
+    """
+    try:
+        tokens = shlex.split(command)
+    except ValueError:
+        return None
+    if len(tokens) < 3 or tokens[0] not in ('oc', 'kubectl') or tokens[1] != 'get':
+        return None
+
+    namespace = None
+    positional = []
+    args = iter(tokens[2:])
+    for token in args:
+        if token in ('-n', '--namespace'):
+            namespace = next(args, None)
+            if namespace is None:
+                return None
+        elif token.startswith('--namespace='):
+            namespace = token.split('=', 1)[1]
+        elif token.startswith('-'):
+            return None
+        else:
+            positional.append(token)
+
+    if len(positional) == 1 and '/' in positional[0]:
+        positional = positional[0].split('/', 1)
+    if len(positional) != 2:
+        return None
+
+    kind = canonical_kind(positional[0])
+    if kind is None:
+        return None
+    return kind, positional[1], namespace
+
+
+class NotSynced(Exception):
+    """Raised when a kind is not watched or has not finished its initial list"""
+
+
+class _Expired(Exception):
+    """The watch resourceVersion is too old; a fresh list is needed"""
+
+
+class ResourceCache:
+    """Objects from the API server indexed by kind, namespace and name"""
+
+    def __init__(self, api_url, token=None, ca_file=None, insecure=False, kinds=None):
+        self.api_url = api_url.rstrip('/')
+        self.token = token
+        self.kinds = [k for k in (kinds or DEFAULT_KINDS.split(',')) if k in RESOURCES]
+        if api_url.startswith('https'):
+            if insecure:
+                self._ssl = ssl._create_unverified_context()
+            else:
+                self._ssl = ssl.create_default_context(cafile=ca_file)
+        else:
+            self._ssl = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._index = {kind: {} for kind in self.kinds}
+        self._synced = {kind: False for kind in self.kinds}
+        self._errors = {}
+        self._events = 0
+        self._relists = 0
+        self._hits = 0
+        self._misses = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache from RESOURCE_CACHE_* variables, or None if not configured"""
+        api_url = os.environ.get('RESOURCE_CACHE_API_URL')
+        if not api_url:
+            return None
+        token = os.environ.get('RESOURCE_CACHE_TOKEN')
+        token_file = os.environ.get('RESOURCE_CACHE_TOKEN_FILE')
+        if not token and token_file:
+            with open(token_file, 'r') as f:
+                token = f.read().strip()
+        kinds = [canonical_kind(k.strip()) for k in
+                 os.environ.get('RESOURCE_CACHE_KINDS', DEFAULT_KINDS).split(',') if k.strip()]
+        return cls(
+            api_url,
+            token=token,
+            ca_file=os.environ.get('RESOURCE_CACHE_CA_FILE'),
+            insecure=os.environ.get('RESOURCE_CACHE_INSECURE') == '1',
+            kinds=kinds
+        )
+
+    def start(self):
+        for kind in self.kinds:
+            thread = threading.Thread(target=self._run, args=(kind,), name=f'watch-{kind}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def wait_synced(self, timeout=None):
+        """Block until every kind finished its initial list"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not all(self._synced.values()):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            self._stop.wait(0.05)
+        return True
+
+    def get(self, kind, name, namespace=None):
+        """Return the cached object or None; raises NotSynced if the kind is not available"""
+        kind = canonical_kind(kind)
+        if kind not in self._synced or not self._synced[kind]:
+            raise NotSynced(kind)
+        if not RESOURCES[kind][2]:
+            namespace = ''
+        with self._lock:
+            obj = self._index[kind].get((namespace or '', name))
+            if obj is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+            return obj
+
+    def list(self, kind, namespace=None):
+        """All cached objects of a kind, optionally limited to one namespace"""
+        kind = canonical_kind(kind)
+        if kind not in self._synced or not self._synced[kind]:
+            raise NotSynced(kind)
+        with self._lock:
+            return [obj for (ns, _), obj in self._index[kind].items()
+                    if namespace is None or ns == namespace]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'kinds': {
+                    kind: {
+                        'synced': self._synced[kind],
+                        'objects': len(self._index[kind]),
+                        'error': self._errors.get(kind)
+                    }
+                    for kind in self.kinds
+                },
+                'events': self._events,
+                'relists': self._relists,
+                'hits': self._hits,
+                'misses': self._misses
+            }
+
+    def _url(self, kind, **params):
+        group, plural, _ = RESOURCES[kind]
+        url = f'{self.api_url}{group}/{plural}'
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        return url
+
+    def _open(self, url, timeout):
+        req = urllib.request.Request(url, headers={'Accept': 'application/json'})
+        if self.token:
+            req.add_header('Authorization', f'Bearer {self.token}')
+        return urllib.request.urlopen(req, timeout=timeout, context=self._ssl)
+
+    @staticmethod
+    def _key(obj):
+        meta = obj.get('metadata', {})
+        return meta.get('namespace', ''), meta.get('name')
+
+    @staticmethod
+    def _compact(obj):
+        # managedFields is large and never needed for validation
+        obj.get('metadata', {}).pop('managedFields', None)
+        return obj
+
+    def _run(self, kind):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                version = self._list(kind)
+                backoff = 1
+                while not self._stop.is_set():
+                    version = self._watch(kind, version)
+            except _Expired:
+                continue
+            except Exception as e:
+                with self._lock:
+                    self._synced[kind] = False
+                    self._errors[kind] = str(e)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def _list(self, kind):
+        with self._open(self._url(kind), timeout=30) as resp:
+            body = json.load(resp)
+        index = {}
+        for item in body.get('items', []):
+            item = self._compact(item)
+            index[self._key(item)] = item
+        with self._lock:
+            self._index[kind] = index
+            self._synced[kind] = True
+            self._errors.pop(kind, None)
+            self._relists += 1
+        return body.get('metadata', {}).get('resourceVersion', '')
+
+    def _watch(self, kind, version):
+        url = self._url(kind, watch='1', resourceVersion=version,
+                        allowWatchBookmarks='true', timeoutSeconds=WATCH_TIMEOUT)
+        try:
+            resp = self._open(url, timeout=WATCH_TIMEOUT + 30)
+        except urllib.error.HTTPError as e:
+            # Some API servers refuse an expired version outright instead of in the stream
+            if e.code == 410:
+                raise _Expired()
+            raise
+        with resp:
+            for line in resp:
+                if self._stop.is_set():
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                event = json.loads(line)
+                event_type = event.get('type')
+                obj = event.get('object') or {}
+                if event_type == 'ERROR':
+                    if obj.get('code') == 410:
+                        raise _Expired()
+                    raise RuntimeError(obj.get('message', 'watch error'))
+
+                version = obj.get('metadata', {}).get('resourceVersion', version)
+                if event_type == 'BOOKMARK':
+                    continue
+                key = self._key(obj)
+                with self._lock:
+                    self._events += 1
+                    if event_type == 'DELETED':
+                        self._index[kind].pop(key, None)
+                    else:
+                        self._index[kind][key] = self._compact(obj)
+        return version
@@ -0,0 +1,101 @@
+"""Single-flight coalescing with a short-lived LRU result cache.
+
+Callers asking for the same key while a computation is running wait for that
+computation instead of starting their own. Finished results are kept for
+``ttl`` seconds (bounded to ``max_entries`` keys, least recently used first
+out) so near-simultaneous repeats are answered without running anything.
+Results the ``failed`` predicate rejects are kept for ``failure_ttl`` instead
+(by default not at all), so a check that failed is re-run as soon as the
+caller has fixed the problem.
+"""
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class SingleFlightCache:
+    """Coalesce concurrent calls per key and cache results briefly"""
+
+    def __init__(self, ttl=3.0, max_entries=1024, cacheable=None, failed=None, failure_ttl=0.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Predicate deciding whether a result may be cached (e.g. skip timeouts)
+        self.cacheable = cacheable or (lambda result: True)
+        # Predicate marking failed results, which are cached for failure_ttl only
+        self.failed = failed or (lambda result: False)
+        self.failure_ttl = failure_ttl
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self._in_flight = {}
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+
+    def get_or_run(self, key, fn):
+        """Return the cached result for key, or run fn() once for all concurrent callers"""
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                expires_at, result = cached
+                if expires_at > time.monotonic():
+                    self._results.move_to_end(key)
+                    self._hits += 1
+                    return result
+                del self._results[key]
+
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._coalesced += 1
+                leader = False
+            else:
+                self._misses += 1
+                future = Future()
+                self._in_flight[key] = future
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        ttl = self.failure_ttl if self.failed(result) else self.ttl
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if ttl > 0 and self.cacheable(result):
+                self._results[key] = (time.monotonic() + ttl, result)
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+                    self._evictions += 1
+        future.set_result(result)
+        return result
+
+    def invalidate(self, key=None):
+        """Drop one cached key, or everything"""
+        with self._lock:
+            if key is None:
+                self._results.clear()
+            else:
+                self._results.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ttl': self.ttl,
+                'failure_ttl': self.failure_ttl,
+                'capacity': self.max_entries,
+                'size': len(self._results),
+                'in_flight': len(self._in_flight),
+                'hits': self._hits,
+                'misses': self._misses,
+                'coalesced': self._coalesced,
+                'evictions': self._evictions
+            }
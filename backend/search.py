@@ -0,0 +1,285 @@
+"""In-memory search index over the question catalog.
+
+Titles, descriptions and step texts are tokenized into an inverted index
+(term -> question ids), and tags and difficulty from ``metadata.json`` into
+their own postings, so a query only touches the questions that match. Every
+query term must match; the last one also matches as a prefix so results
+update while typing. Results are ordered by relevance (title hits weigh
+most), title or id, always with the id as tie-breaker, and paged with an
+opaque cursor holding the last sort key, so pages stay stable while the
+catalog changes between requests. Queries only read the index: a background
+thread re-scans the catalog for changed questions every ``check_interval``
+seconds, without holding the index lock while it reads the files.
+"""
+import re
+import json
+import time
+import base64
+import bisect
+import threading
+from collections import Counter
+
+TOKEN = re.compile(r'[a-z0-9]+')
+FIELD_WEIGHTS = {'title': 3, 'description': 2, 'steps': 1}
+SORTS = ('relevance', 'title', 'id')
+MAX_PREFIX_TERMS = 256
+
+
+def tokenize(text):
+    return TOKEN.findall((text or '').lower())
+
+
+def encode_cursor(sort, key):
+    return base64.urlsafe_b64encode(json.dumps([sort] + list(key)).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """Sort key from a cursor made for `sort`; raises ValueError if it is malformed or for another sort"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        cursor_sort, key = value[0], tuple(value[1:])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort:
+        raise ValueError(f"Cursor was issued for sort={cursor_sort}, not sort={sort}")
+    expected = {'id': 1, 'title': 2, 'relevance': 3}[sort]
+    if len(key) != expected or not all(isinstance(part, (str, int)) for part in key):
+        raise ValueError("Invalid cursor")
+    return key
+
+
+class QuestionIndex:
+    """Inverted index of one catalog tree, kept in step with it"""
+
+    def __init__(self, catalog, check_interval=2):
+        self.catalog = catalog
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        # One catalog scan at a time; queries never wait for it
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # id -> {'title', 'description', 'tags', 'difficulty', 'terms': Counter of weighted terms, 'revision'}
+        self._docs = {}
+        self._postings = {}
+        self._terms = []
+        self._tags = {}
+        self._difficulty = {}
+        self._by_title = []
+        # (id,) tuples, the sort keys of sort=id
+        self._by_id = []
+        self._synced_at = None
+        # Bumped on every change; usable as a cache key
+        self.generation = 0
+        self._queries = 0
+        self._query_seconds = 0.0
+
+    def _title_key(self, doc, question_id):
+        return (doc['title'].lower(), question_id)
+
+    def _add(self, question_id, entry):
+        metadata = entry['metadata']
+        tags = metadata.get('tags') or []
+        if isinstance(tags, str):
+            tags = [tags]
+        doc = {
+            'title': str(metadata.get('title', question_id)),
+            'description': str(metadata.get('description', '')),
+            'tags': sorted({str(tag).lower() for tag in tags}),
+            'difficulty': str(metadata['difficulty']).lower() if metadata.get('difficulty') else None,
+            'revision': entry.get('revision')
+        }
+        terms = Counter()
+        for token in tokenize(doc['title']):
+            terms[token] += FIELD_WEIGHTS['title']
+        for token in tokenize(doc['description']):
+            terms[token] += FIELD_WEIGHTS['description']
+        for step in entry['steps']:
+            for token in tokenize(step['content']):
+                terms[token] += FIELD_WEIGHTS['steps']
+        doc['terms'] = terms
+
+        self._docs[question_id] = doc
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = set()
+                bisect.insort(self._terms, term)
+            postings.add(question_id)
+        for tag in doc['tags']:
+            self._tags.setdefault(tag, set()).add(question_id)
+        if doc['difficulty']:
+            self._difficulty.setdefault(doc['difficulty'], set()).add(question_id)
+        bisect.insort(self._by_title, self._title_key(doc, question_id))
+        bisect.insort(self._by_id, (question_id,))
+
+    def _remove(self, question_id):
+        doc = self._docs.pop(question_id, None)
+        if doc is None:
+            return
+        for term in doc['terms']:
+            postings = self._postings[term]
+            postings.discard(question_id)
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+        for tag in doc['tags']:
+            self._tags[tag].discard(question_id)
+        if doc['difficulty']:
+            self._difficulty[doc['difficulty']].discard(question_id)
+        key = self._title_key(doc, question_id)
+        del self._by_title[bisect.bisect_left(self._by_title, key)]
+        del self._by_id[bisect.bisect_left(self._by_id, (question_id,))]
+
+    def update(self, question_id):
+        """Re-index one question from the catalog (or drop it if it is gone)"""
+        entry = self.catalog.get(question_id)
+        with self._lock:
+            self._remove(question_id)
+            if entry is not None:
+                self._add(question_id, entry)
+            self.generation += 1
+
+    def sync(self):
+        """Pick up questions changed behind the index's back
+
+        The catalog is read without holding the index lock; the changes are
+        then applied in one short critical section. A question updated
+        through update() while the scan ran keeps that newer state.
+        """
+        with self._sync_lock:
+            ids = set(self.catalog.question_ids())
+            with self._lock:
+                known = {question_id: doc['revision'] for question_id, doc in self._docs.items()}
+            changes = {question_id: None for question_id in known if question_id not in ids}
+            for question_id in ids:
+                if question_id in known and known[question_id] == self.catalog.revision(question_id):
+                    continue
+                changes[question_id] = self.catalog.get(question_id)
+
+            with self._lock:
+                changed = False
+                for question_id, entry in changes.items():
+                    doc = self._docs.get(question_id)
+                    if (doc['revision'] if doc is not None else None) != known.get(question_id):
+                        continue
+                    self._remove(question_id)
+                    if entry is not None:
+                        self._add(question_id, entry)
+                    changed = True
+                if changed:
+                    self.generation += 1
+                self._synced_at = time.monotonic()
+
+    def start(self):
+        """Index the catalog now, then re-scan it every check_interval in the background"""
+        self.sync()
+        if self.check_interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._sync_loop, name='search-sync', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _sync_loop(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.sync()
+            except Exception:
+                pass
+
+    def _matching(self, terms):
+        """Ids containing every term (the last one as a prefix), or None for no terms"""
+        candidates = None
+        for i, term in enumerate(terms):
+            if i == len(terms) - 1:
+                start = bisect.bisect_left(self._terms, term)
+                postings = set()
+                for prefixed in self._terms[start:start + MAX_PREFIX_TERMS]:
+                    if not prefixed.startswith(term):
+                        break
+                    postings |= self._postings[prefixed]
+            else:
+                postings = self._postings.get(term, set())
+            candidates = set(postings) if candidates is None else candidates & postings
+            if not candidates:
+                break
+        return candidates
+
+    def _score(self, question_id, terms):
+        doc_terms = self._docs[question_id]['terms']
+        score = sum(doc_terms.get(term, 0) for term in terms[:-1])
+        last = terms[-1]
+        score += doc_terms.get(last, 0) or max(
+            (count for term, count in doc_terms.items() if term.startswith(last)), default=0)
+        return score
+
+    def _sort_key(self, question_id, sort, terms):
+        doc = self._docs[question_id]
+        if sort == 'id':
+            return (question_id,)
+        if sort == 'title':
+            return self._title_key(doc, question_id)
+        return (-self._score(question_id, terms),) + self._title_key(doc, question_id)
+
+    def search(self, q=None, tags=(), difficulty=None, sort=None, limit=50, cursor=None):
+        """One page of matches: (ids, next cursor or None, total matches); limit=None returns them all"""
+        started = time.monotonic()
+        terms = tokenize(q)
+        sort = sort or ('relevance' if terms else 'title')
+        if sort not in SORTS:
+            raise ValueError(f"sort must be one of {', '.join(SORTS)}")
+        if sort == 'relevance' and not terms:
+            sort = 'title'
+        after = decode_cursor(cursor, sort) if cursor else None
+
+        with self._lock:
+            candidates = self._matching(terms)
+            for tag in tags:
+                postings = self._tags.get(tag.lower(), set())
+                candidates = set(postings) if candidates is None else candidates & postings
+            if difficulty:
+                postings = self._difficulty.get(difficulty.lower(), set())
+                candidates = set(postings) if candidates is None else candidates & postings
+
+            if candidates is None:
+                # Unfiltered: walk the presorted list from the cursor
+                keys = self._by_id if sort == 'id' else self._by_title
+                start = bisect.bisect_right(keys, after) if after is not None else 0
+                end = len(keys) if limit is None else start + limit
+                page_keys = keys[start:end]
+                total = len(keys)
+                has_more = end < total
+            else:
+                keys = sorted(self._sort_key(question_id, sort, terms) for question_id in candidates)
+                start = bisect.bisect_right(keys, after) if after is not None else 0
+                end = len(keys) if limit is None else start + limit
+                page_keys = keys[start:end]
+                total = len(candidates)
+                has_more = end < len(keys)
+
+            page = [key[-1] for key in page_keys]
+            next_cursor = encode_cursor(sort, page_keys[-1]) if has_more and page_keys else None
+            self._queries += 1
+            self._query_seconds += time.monotonic() - started
+        return page, next_cursor, total
+
+    def facets(self):
+        """Known tags and difficulties with their question counts"""
+        with self._lock:
+            return {
+                'tags': {tag: len(ids) for tag, ids in sorted(self._tags.items()) if ids},
+                'difficulty': {level: len(ids) for level, ids in sorted(self._difficulty.items()) if ids}
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'questions': len(self._docs),
+                'terms': len(self._postings),
+                'generation': self.generation,
+                'queries': self._queries,
+                'query_seconds': round(self._query_seconds, 6)
+            }
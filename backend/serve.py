@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Run the platform under gunicorn with several worker processes.
+
+Examples:
+    python3 backend/serve.py
+    python3 backend/serve.py --workers 4 --threads 16 --bind 0.0.0.0:8080
+
+Each worker imports app.py on its own, keeps the processes of the sessions it
+created, and shares the session records through a SQLite database. A request
+for a session that lives in another worker is forwarded to that worker, so
+clients need no sticky load balancing.
+"""
+import os
+import sys
+import secrets
+import argparse
+import multiprocessing
+
+from gunicorn.app.base import BaseApplication
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SESSION_DB = os.path.join(
+    os.environ.get('LAB_WORKSPACE_DIR', os.path.join(os.path.dirname(BACKEND_DIR), 'workspace')), 'sessions.db')
+
+
+class LabServer(BaseApplication):
+    """gunicorn application that loads app.py inside each worker"""
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import app
+        return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the lab platform with multiple workers')
+    parser.add_argument('-w', '--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='worker processes (default: CPU count)')
+    parser.add_argument('-t', '--threads', type=int, default=8,
+                        help='request threads per worker')
+    parser.add_argument('-b', '--bind', default='0.0.0.0:80')
+    parser.add_argument('--session-db', default=os.environ.get('LAB_SESSION_DB', DEFAULT_SESSION_DB),
+                        help='SQLite file shared by the workers')
+    args = parser.parse_args(argv)
+
+    # Read by app.py in every worker
+    os.makedirs(os.path.dirname(os.path.abspath(args.session_db)), exist_ok=True)
+    os.environ['LAB_MULTI_WORKER'] = '1'
+    os.environ['LAB_SESSION_DB'] = args.session_db
+    os.environ['LAB_WORKERS'] = str(args.workers)
+    # Shared by this boot's workers only; authenticates requests they forward to each other
+    os.environ['LAB_FORWARD_SECRET'] = secrets.token_hex(32)
+    sys.path.insert(0, BACKEND_DIR)
+
+    LabServer({
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        # app.py starts background threads, so it must be imported after fork
+        'preload_app': False,
+        # Session output streams and grading runs hold requests open
+        'timeout': 300,
+        'graceful_timeout': 30
+    }).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""SQLite (WAL mode) table of sessions shared by all server workers.
+
+Each worker keeps its own in-memory SessionManager for the processes it
+owns; this store makes the session records themselves visible to every
+worker, along with which worker owns the session's live processes.
+"""
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    question_id TEXT,
+    namespace TEXT,
+    workspace TEXT,
+    owner TEXT,
+    created_at REAL,
+    last_seen REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen);
+"""
+
+COLUMNS = ('id', 'question_id', 'namespace', 'workspace', 'owner', 'created_at', 'last_seen')
+
+
+class SessionStore:
+    """Session rows in a SQLite database, one connection per thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def put(self, record):
+        self._conn().execute(
+            f"INSERT OR REPLACE INTO sessions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+            tuple(record.get(column) for column in COLUMNS)
+        )
+
+    def get(self, session_id):
+        row = self._conn().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    def update(self, session_id, **fields):
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        self._conn().execute(
+            f"UPDATE sessions SET {assignments} WHERE id = ?",
+            tuple(fields.values()) + (session_id,)
+        )
+
+    def delete(self, session_id):
+        return self._conn().execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+
+    def expire(self, cutoff):
+        """Delete rows not seen since cutoff (wall clock); returns their ids"""
+        conn = self._conn()
+        ids = [row[0] for row in conn.execute("SELECT id FROM sessions WHERE last_seen < ?", (cutoff,))]
+        if ids:
+            conn.executemany("DELETE FROM sessions WHERE id = ?", [(i,) for i in ids])
+        return ids
+
+    def workspaces(self):
+        return [row[0] for row in self._conn().execute("SELECT DISTINCT workspace FROM sessions")]
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
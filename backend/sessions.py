@@ -0,0 +1,271 @@
+"""Registry of live sessions with idle expiry and process reaping.
+
+Sessions are created by ``/api/sessions`` (an interactive bash process) and
+``/api/session/create`` (a workspace whose commands run in a persistent
+shell). Browsers that go away never call the end endpoints, so a background
+reaper ends sessions that have been idle longer than ``idle_ttl`` and
+terminates and waits on whatever processes they still own.
+
+When several server workers run, an optional shared SessionStore makes the
+records visible to every worker and remembers which worker (``owner``) holds
+each session's processes, so requests can be routed back to it.
+"""
+import time
+import signal
+import threading
+import subprocess
+
+
+class Session:
+    """Compact record of one session"""
+
+    __slots__ = (
+        'id', 'question_id', 'namespace', 'workspace', 'owner', 'created_at', 'last_seen',
+        'stored_at', 'process', 'output', 'shell', 'cgroup'
+    )
+
+    def __init__(self, session_id, workspace, question_id=None, namespace=None,
+                 process=None, output=None):
+        self.id = session_id
+        self.question_id = question_id
+        self.namespace = namespace
+        self.workspace = workspace
+        self.owner = None
+        self.created_at = time.time()
+        self.last_seen = self.created_at
+        self.stored_at = 0.0
+        self.process = process
+        self.output = output
+        self.shell = None
+        self.cgroup = None
+
+    def record(self):
+        return {
+            'id': self.id,
+            'question_id': self.question_id,
+            'namespace': self.namespace,
+            'workspace': self.workspace,
+            'owner': self.owner,
+            'created_at': self.created_at,
+            'last_seen': self.last_seen
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        session = cls(record['id'], record['workspace'],
+                      question_id=record['question_id'], namespace=record['namespace'])
+        session.owner = record['owner']
+        session.created_at = record['created_at']
+        session.last_seen = record['last_seen']
+        return session
+
+    def live_processes(self):
+        count = 0
+        if self.process is not None and self.process.poll() is None:
+            count += 1
+        if self.shell is not None and self.shell.alive:
+            count += 1
+        return count
+
+
+def _terminate(process, timeout=5):
+    """Terminate a process, escalating to SIGKILL, and reap it"""
+    if process.poll() is None:
+        try:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        except ProcessLookupError:
+            pass
+    else:
+        process.wait()
+    for pipe in (process.stdin, process.stdout, process.stderr):
+        if pipe is not None:
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+
+class SessionManager:
+    """Thread-safe session table with a background reaper"""
+
+    # Seconds between last_seen write-backs to the shared store per session
+    STORE_TOUCH_INTERVAL = 5
+
+    def __init__(self, idle_ttl=3600, reap_interval=60, store=None, owner=None, on_release=None):
+        self.idle_ttl = idle_ttl
+        self.reap_interval = reap_interval
+        self.store = store
+        self.owner = owner
+        # on_release(session) runs after an ended or expired session's processes are gone
+        self.on_release = on_release
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._ended = 0
+        self._expired = 0
+        self._reaped_processes = 0
+        self._reaper = None
+        self._stop = threading.Event()
+
+    def start_reaper(self):
+        if self._reaper is None and self.reap_interval > 0:
+            self._reaper = threading.Thread(target=self._reap_loop, name='session-reaper', daemon=True)
+            self._reaper.start()
+        return self
+
+    def stop_reaper(self):
+        self._stop.set()
+
+    def add(self, session):
+        session.owner = self.owner
+        with self._lock:
+            self._sessions[session.id] = session
+        self.save(session)
+        return session
+
+    def save(self, session):
+        """Write a session's fields through to the shared store"""
+        if self.store is not None:
+            session.stored_at = time.time()
+            self.store.put(session.record())
+
+    def get(self, session_id):
+        """Look up a session and mark it as used
+
+        Sessions owned by another worker come back as detached records
+        without processes.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_seen = time.time()
+        if session is not None:
+            if self.store is not None and session.last_seen - session.stored_at > self.STORE_TOUCH_INTERVAL:
+                session.stored_at = session.last_seen
+                self.store.update(session_id, last_seen=session.last_seen)
+            return session
+
+        if self.store is not None:
+            record = self.store.get(session_id)
+            if record is not None:
+                return Session.from_record(record)
+        return None
+
+    def owner_of(self, session_id):
+        """Address of the worker holding the session's processes (None if unknown)"""
+        with self._lock:
+            if session_id in self._sessions:
+                return self.owner
+        if self.store is not None:
+            record = self.store.get(session_id)
+            if record is not None:
+                return record['owner']
+        return None
+
+    def adopt(self, session_id):
+        """Take over a session whose owning worker is gone"""
+        if self.store is None:
+            return None
+        record = self.store.get(session_id)
+        if record is None:
+            return None
+        session = Session.from_record(record)
+        session.owner = self.owner
+        with self._lock:
+            self._sessions[session_id] = session
+        self.save(session)
+        return session
+
+    def __contains__(self, session_id):
+        with self._lock:
+            if session_id in self._sessions:
+                return True
+        return self.store is not None and self.store.get(session_id) is not None
+
+    def workspaces(self):
+        """Workspace paths of every live session, including other workers' ones"""
+        with self._lock:
+            paths = {session.workspace for session in self._sessions.values()}
+        if self.store is not None:
+            paths.update(self.store.workspaces())
+        return paths
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def end(self, session_id):
+        """Remove a session and release its processes; returns the session or None"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._ended += 1
+        if self.store is not None:
+            record = self.store.get(session_id)
+            self.store.delete(session_id)
+            if session is None and record is not None:
+                session = Session.from_record(record)
+        if session is not None:
+            self._release(session)
+        return session
+
+    def _release(self, session):
+        released = 0
+        if session.process is not None:
+            if session.process.poll() is None:
+                released += 1
+            _terminate(session.process)
+        if session.shell is not None:
+            if session.shell.alive:
+                released += 1
+            session.shell.close()
+        if session.cgroup is not None:
+            session.cgroup.remove()
+        with self._lock:
+            self._reaped_processes += released
+        if self.on_release is not None:
+            self.on_release(session)
+
+    def reap(self):
+        """End every session idle for longer than idle_ttl; returns how many"""
+        cutoff = time.time() - self.idle_ttl
+        with self._lock:
+            expired = [s for s in self._sessions.values() if s.last_seen < cutoff]
+            for session in expired:
+                del self._sessions[session.id]
+            self._expired += len(expired)
+        for session in expired:
+            self._release(session)
+        if self.store is not None:
+            # Also drop records left behind by workers that went away
+            self.store.expire(cutoff)
+            for session in expired:
+                self.store.delete(session.id)
+        return len(expired)
+
+    def _reap_loop(self):
+        while not self._stop.wait(self.reap_interval):
+            try:
+                self.reap()
+            except Exception:
+                # Never let one bad session stop the reaper
+                pass
+
+    def stats(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            stats = {
+                'sessions': len(sessions),
+                'ended': self._ended,
+                'expired': self._expired,
+                'reaped_processes': self._reaped_processes,
+                'idle_ttl': self.idle_ttl
+            }
+        stats['processes'] = sum(session.live_processes() for session in sessions)
+        if self.store is not None:
+            stats['owner'] = self.owner
+            stats['shared_sessions'] = self.store.count()
+        return stats
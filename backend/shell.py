@@ -0,0 +1,200 @@
+"""Long-lived bash process per workspace session with framed commands.
+
+Instead of starting ``bash -c`` for every command, each session keeps one
+shell. Commands are written to its stdin wrapped in ``eval`` and followed by
+a per-command sentinel on stdout (carrying the exit code) and on stderr, so
+each command's stdout, stderr and exit code can be split out of the streams.
+Shell state such as ``cd`` and exported variables carries over between
+commands. A command cancelled while it runs (e.g. its client went away) is
+killed together with the shell, the same way a timeout is.
+"""
+import os
+import time
+import uuid
+import shlex
+import signal
+import selectors
+import threading
+import subprocess
+
+from capture import DEFAULT_MAX_BYTES, OutputCapture
+from executor import CommandResult
+
+READ_SIZE = 65536
+# Seconds between checks for cancellation while a command runs
+CANCEL_POLL = 0.1
+
+
+class PersistentShell:
+    """One bash process that runs framed commands one at a time"""
+
+    def __init__(self, cwd=None, env=None, max_output=DEFAULT_MAX_BYTES, wrapper=None, on_start=None,
+                 on_command=None):
+        self.cwd = cwd
+        self.env = env
+        self.max_output = max_output
+        # argv prefix bash is started under (e.g. prlimit), and a hook called with the new process
+        self.wrapper = wrapper or []
+        self.on_start = on_start
+        # Called with the shell process before each command (e.g. to set per-command limits)
+        self.on_command = on_command
+        self.process = None
+        self.commands = 0
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.wrapper + ['bash', '--noprofile', '--norc'],
+            cwd=self.cwd,
+            env=self.env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0,
+            start_new_session=True
+        )
+        if self.on_start is not None:
+            self.on_start(self.process)
+        os.set_blocking(self.process.stdout.fileno(), False)
+        os.set_blocking(self.process.stderr.fileno(), False)
+
+    def close(self):
+        """Kill the shell and everything it started"""
+        process = self.process
+        self.process = None
+        if process is None:
+            return
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        process.wait()
+        for pipe in (process.stdin, process.stdout, process.stderr):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    def run(self, command, timeout, on_output=None, cancel=None):
+        """Run one command in the shell and return its CommandResult
+
+        A command that exits the shell ends it; one that times out or whose
+        `cancel` Event is set kills it. Either way the next call starts a
+        fresh shell. on_output(name, data) sees the command's output as it
+        is read.
+        """
+        with self._lock:
+            if cancel is not None and cancel.is_set():
+                return CommandResult(None, '', '', False, True, 0.0)
+            if not self.alive:
+                self.close()
+                self.start()
+            self.commands += 1
+            if self.on_command is not None:
+                self.on_command(self.process)
+            return self._run(command, timeout, on_output, cancel)
+
+    def _run(self, command, timeout, on_output=None, cancel=None):
+        started = time.monotonic()
+        token = f"__LAB_{uuid.uuid4().hex}__".encode()
+        script = (
+            f"eval {shlex.quote(command)} </dev/null\n"
+            f"__lab_rc=$?\n"
+            f"printf '%s:%d\\n' {token.decode()} \"$__lab_rc\"\n"
+            f"printf '%s\\n' {token.decode()} >&2\n"
+        )
+
+        process = self.process
+        try:
+            process.stdin.write(script.encode())
+            process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.close()
+            return CommandResult(None, '', 'Shell is not running', False, False, 0.0)
+
+        stdout_fd = process.stdout.fileno()
+        stderr_fd = process.stderr.fileno()
+        names = {stdout_fd: 'stdout', stderr_fd: 'stderr'}
+        captures = {fd: OutputCapture(self.max_output) for fd in names}
+        # Bytes held back in case they are the start of a sentinel split across reads
+        pending = {fd: b'' for fd in names}
+        trailer = None
+        done = {stdout_fd: False, stderr_fd: False}
+        deadline = started + timeout
+
+        def emit(fd, data):
+            if data:
+                captures[fd].write(data)
+                if on_output is not None:
+                    on_output(names[fd], data)
+
+        def result(returncode, timed_out, cancelled=False):
+            for fd in names:
+                emit(fd, pending[fd])
+                pending[fd] = b''
+            stdout, stderr = captures[stdout_fd], captures[stderr_fd]
+            return CommandResult(
+                returncode, stdout.text(), stderr.text(), timed_out, cancelled,
+                time.monotonic() - started, stdout.truncated or stderr.truncated
+            )
+
+        with selectors.DefaultSelector() as selector:
+            for fd in names:
+                selector.register(fd, selectors.EVENT_READ)
+            while not all(done.values()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.close()
+                    return result(None, True)
+                if cancel is not None:
+                    if cancel.is_set():
+                        self.close()
+                        return result(None, False, cancelled=True)
+                    remaining = min(remaining, CANCEL_POLL)
+                for key, _ in selector.select(remaining):
+                    fd = key.fd
+                    try:
+                        data = os.read(fd, READ_SIZE)
+                    except BlockingIOError:
+                        continue
+                    if not data:
+                        # The command exited the shell
+                        done[fd] = True
+                        selector.unregister(fd)
+                        continue
+                    data = pending[fd] + data
+                    if token in data:
+                        before, _, after = data.partition(token)
+                        emit(fd, before)
+                        pending[fd] = b''
+                        if fd == stdout_fd:
+                            trailer = after
+                        done[fd] = True
+                        selector.unregister(fd)
+                    else:
+                        keep = len(token) - 1
+                        emit(fd, data[:-keep])
+                        pending[fd] = data[-keep:]
+
+        if trailer is not None:
+            # The exit code follows the stdout sentinel
+            while b'\n' not in trailer:
+                more = os.read(stdout_fd, READ_SIZE) if self._readable(stdout_fd, deadline) else b''
+                if not more:
+                    break
+                trailer += more
+            return result(int(trailer[1:].split(b'\n', 1)[0] or 0), False)
+
+        returncode = process.wait()
+        self.close()
+        return result(returncode, False)
+
+    @staticmethod
+    def _readable(fd, deadline):
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            return bool(selector.select(max(0.0, deadline - time.monotonic())))
@@ -0,0 +1,98 @@
+"""Non-blocking capture of a session process's stdout/stderr.
+
+A reader thread per pipe pushes chunks into a bounded ring buffer as soon as
+they arrive. Every chunk gets an increasing sequence number, so an HTTP
+client (polling or Server-Sent Events) can ask for everything after the last
+chunk it saw and a reconnecting client can replay whatever is still buffered.
+"""
+import os
+import codecs
+import threading
+from collections import deque
+
+DEFAULT_BUFFER_BYTES = 256 * 1024
+READ_SIZE = 4096
+
+
+class SessionOutput:
+    """Ring buffer of output chunks fed by reader threads"""
+
+    def __init__(self, process, max_bytes=DEFAULT_BUFFER_BYTES):
+        self.process = process
+        self.max_bytes = max_bytes
+        self.returncode = None
+        self._chunks = deque()
+        self._size = 0
+        self._seq = 0
+        self._open_streams = 0
+        self._cond = threading.Condition()
+
+        for name, pipe in (('stdout', process.stdout), ('stderr', process.stderr)):
+            if pipe is None:
+                continue
+            self._open_streams += 1
+            threading.Thread(target=self._read, args=(name, pipe),
+                             name=f'session-{name}-{process.pid}', daemon=True).start()
+
+    @property
+    def closed(self):
+        return self.returncode is not None
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def _read(self, name, pipe):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        fd = pipe.fileno()
+        try:
+            while True:
+                data = os.read(fd, READ_SIZE)
+                if not data:
+                    break
+                text = decoder.decode(data)
+                if text:
+                    self._append(name, text)
+        except OSError:
+            pass
+        finally:
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                self._append(name, tail)
+            self._stream_closed()
+
+    def _append(self, name, text):
+        with self._cond:
+            self._seq += 1
+            self._chunks.append((self._seq, name, text))
+            self._size += len(text)
+            # Drop the oldest chunks, but always keep the newest one
+            while self._size > self.max_bytes and len(self._chunks) > 1:
+                _, _, dropped = self._chunks.popleft()
+                self._size -= len(dropped)
+            self._cond.notify_all()
+
+    def _stream_closed(self):
+        with self._cond:
+            self._open_streams -= 1
+            if self._open_streams > 0:
+                return
+        returncode = self.process.wait()
+        with self._cond:
+            self.returncode = returncode
+            self._cond.notify_all()
+
+    def read_since(self, seq=0):
+        """Return (chunks, truncated) for every buffered chunk after seq, without blocking
+
+        truncated is True when chunks after seq were already evicted.
+        """
+        with self._cond:
+            chunks = [chunk for chunk in self._chunks if chunk[0] > seq]
+            first = self._chunks[0][0] if self._chunks else self._seq + 1
+            return chunks, seq + 1 < first
+
+    def wait(self, seq, timeout=None):
+        """Block until there is a chunk after seq or the process exited"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._seq > seq or self.closed, timeout=timeout)
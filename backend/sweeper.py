@@ -0,0 +1,37 @@
+"""Election of the one server process that runs the background sweeps.
+
+Under serve.py every worker runs the same background threads, but sweeping
+idle workspaces or leftover pool namespaces should happen in one process
+only. Whichever process holds a non-blocking ``flock`` on a lock file is the
+sweeper; the kernel drops the lock when that process exits, and the next
+worker that asks takes over.
+"""
+import os
+import fcntl
+import threading
+
+
+class SweeperLock:
+    """flock on `path`; held() says whether this process is the sweeper"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._lock = threading.Lock()
+
+    def held(self):
+        """Whether this process is the sweeper, taking the lock if it is free"""
+        with self._lock:
+            if self._fd is not None:
+                return True
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError:
+                return False
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            self._fd = fd
+            return True
@@ -0,0 +1,155 @@
+"""Minimal stand-in for the Kubernetes API's list and watch endpoints.
+
+Objects live in memory per kind; every change gets the next resourceVersion
+and is kept as a watch event. ``compact()`` forgets the history the way etcd
+compaction does, so a watch from an older version is answered with an ERROR
+event of code 410 (or, with ``expired_status``, an HTTP 410 response), and
+``close_watches()`` ends the open watch streams so clients reconnect.
+"""
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from resource_cache import RESOURCES
+
+PATHS = {f'{group}/{plural}': kind for kind, (group, plural, _) in RESOURCES.items()}
+
+
+class FakeAPIServer:
+    """List+watch server on 127.0.0.1; `url` is its address once started"""
+
+    def __init__(self, expired_status=False):
+        self.expired_status = expired_status
+        self.version = 1
+        self.oldest = 1
+        self.objects = {}
+        self.events = []
+        self.lists = 0
+        self.watches = 0
+        self._epoch = 0
+        self._cond = threading.Condition()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.0'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                parsed = urllib.parse.urlparse(self.path)
+                kind = PATHS.get(parsed.path)
+                if kind is None:
+                    self.send_error(404)
+                    return
+                params = dict(urllib.parse.parse_qsl(parsed.query))
+                if params.get('watch'):
+                    fake._serve_watch(self, kind, int(params.get('resourceVersion') or 0))
+                else:
+                    fake._serve_list(self, kind)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.close_watches()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def put(self, kind, obj, record=True):
+        """Add or replace an object; record=False changes it without a watch event"""
+        with self._cond:
+            meta = obj.setdefault('metadata', {})
+            key = (meta.get('namespace', ''), meta['name'])
+            event_type = 'MODIFIED' if key in self.objects.setdefault(kind, {}) else 'ADDED'
+            self._change(kind, key, event_type, obj, record)
+
+    def delete(self, kind, name, namespace='', record=True):
+        with self._cond:
+            obj = self.objects.get(kind, {}).get((namespace, name))
+            if obj is not None:
+                self._change(kind, (namespace, name), 'DELETED', obj, record)
+
+    def _change(self, kind, key, event_type, obj, record):
+        self.version += 1
+        obj['metadata']['resourceVersion'] = str(self.version)
+        if event_type == 'DELETED':
+            del self.objects[kind][key]
+        else:
+            self.objects[kind][key] = obj
+        if record:
+            self.events.append((self.version, kind, {'type': event_type, 'object': obj}))
+        self._cond.notify_all()
+
+    def compact(self):
+        """Drop the event history; watches from older versions now expire"""
+        with self._cond:
+            self.events = []
+            self.oldest = self.version
+
+    def close_watches(self):
+        with self._cond:
+            self._epoch += 1
+            self._cond.notify_all()
+
+    def _send_json(self, handler, status, body):
+        data = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _serve_list(self, handler, kind):
+        with self._cond:
+            self.lists += 1
+            body = {
+                'kind': 'List',
+                'metadata': {'resourceVersion': str(self.version)},
+                'items': [json.loads(json.dumps(obj)) for obj in self.objects.get(kind, {}).values()]
+            }
+        self._send_json(handler, 200, body)
+
+    def _serve_watch(self, handler, kind, since):
+        with self._cond:
+            self.watches += 1
+            expired = since < self.oldest
+            epoch = self._epoch
+        if expired and self.expired_status:
+            self._send_json(handler, 410, {'kind': 'Status', 'code': 410, 'reason': 'Expired'})
+            return
+
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/json')
+        handler.end_headers()
+        if expired:
+            event = {'type': 'ERROR', 'object': {'kind': 'Status', 'code': 410,
+                                                  'message': f'too old resource version: {since}'}}
+            handler.wfile.write(json.dumps(event).encode() + b'\n')
+            return
+
+        sent = since
+        while True:
+            with self._cond:
+                pending = [(version, event) for version, event_kind, event in self.events
+                           if event_kind == kind and version > sent]
+                if not pending:
+                    if self._epoch != epoch:
+                        return
+                    self._cond.wait(0.5)
+                    continue
+            for version, event in pending:
+                handler.wfile.write(json.dumps(event).encode() + b'\n')
+                sent = version
+            handler.wfile.flush()
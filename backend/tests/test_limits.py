@@ -0,0 +1,50 @@
+"""Per-command CPU limit of a long-lived session shell"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from limits import ResourceLimits
+from shell import PersistentShell
+
+# Keeps the shell itself busy for `ms` milliseconds of wall (and so CPU) time
+BUSY = 'end=$(( ${EPOCHREALTIME/./} + %d000 )); while (( ${EPOCHREALTIME/./} < end )); do :; done; echo done'
+
+
+class SessionCpuLimitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.limits = ResourceLimits(cpu_seconds=1)
+        self.shell = PersistentShell(
+            env=dict(os.environ),
+            wrapper=self.limits.wrapper(cpu=False),
+            on_command=self.limits.limit_command
+        )
+
+    def tearDown(self):
+        self.shell.close()
+
+    def test_cpu_time_does_not_add_up_across_commands(self):
+        self.shell.run('true', timeout=10)
+        pid = self.shell.process.pid
+        for _ in range(3):
+            result = self.shell.run(BUSY % 600, timeout=10)
+            self.assertEqual(result.stdout.strip(), 'done')
+            self.assertEqual(self.limits.check(result), [])
+        self.assertEqual(self.shell.process.pid, pid)
+
+    def test_command_over_the_limit_is_stopped(self):
+        result = self.shell.run(BUSY % 5000, timeout=10)
+        self.assertFalse(result.timed_out)
+        self.assertEqual(self.limits.check(result), ['cpu'])
+        self.assertEqual(self.shell.run('echo ok', timeout=10).stdout.strip(), 'ok')
+
+    def test_child_processes_get_the_full_limit(self):
+        self.shell.run(BUSY % 600, timeout=10)
+        result = self.shell.run('bash -c ' + repr(BUSY % 800), timeout=10)
+        self.assertEqual(result.stdout.strip(), 'done')
+
+
+if __name__ == '__main__':
+    unittest.main()
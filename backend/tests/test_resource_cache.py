@@ -0,0 +1,98 @@
+"""ResourceCache against the fake list/watch server: initial sync, events and resync after 410"""
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_apiserver import FakeAPIServer
+from resource_cache import ResourceCache, NotSynced
+
+
+def configmap(name, namespace='student1', **data):
+    return {'metadata': {'name': name, 'namespace': namespace, 'managedFields': [{}]}, 'data': data}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class ResourceCacheTest(unittest.TestCase):
+    expired_status = False
+
+    def setUp(self):
+        self.server = FakeAPIServer(expired_status=self.expired_status).start()
+        self.server.put('namespaces', {'metadata': {'name': 'student1'}})
+        self.server.put('configmaps', configmap('app-config', mode='dev'))
+        self.cache = ResourceCache(self.server.url, kinds=['namespaces', 'configmaps'])
+
+    def tearDown(self):
+        self.cache.stop()
+        self.server.stop()
+
+    def start(self):
+        self.cache.start()
+        self.assertTrue(self.cache.wait_synced(timeout=5))
+
+    def test_not_synced_before_start(self):
+        with self.assertRaises(NotSynced):
+            self.cache.get('configmaps', 'app-config', 'student1')
+        with self.assertRaises(NotSynced):
+            self.cache.get('pods', 'web', 'student1')
+
+    def test_initial_list(self):
+        self.start()
+        obj = self.cache.get('cm', 'app-config', 'student1')
+        self.assertEqual(obj['data'], {'mode': 'dev'})
+        self.assertNotIn('managedFields', obj['metadata'])
+        self.assertIsNotNone(self.cache.get('namespace', 'student1'))
+        self.assertIsNone(self.cache.get('configmaps', 'app-config', 'student2'))
+
+    def test_watch_events(self):
+        self.start()
+        self.server.put('configmaps', configmap('app-config', mode='prod'))
+        self.server.put('configmaps', configmap('other'))
+        self.assertTrue(wait_for(
+            lambda: self.cache.get('configmaps', 'app-config', 'student1')['data'] == {'mode': 'prod'}))
+        self.assertTrue(wait_for(lambda: self.cache.get('configmaps', 'other', 'student1') is not None))
+
+        self.server.delete('configmaps', 'app-config', 'student1')
+        self.assertTrue(wait_for(lambda: self.cache.get('configmaps', 'app-config', 'student1') is None))
+        self.assertEqual(self.cache.stats()['relists'], 2)
+
+    def test_resync_after_watch_expiry(self):
+        self.start()
+        # Changes the cache never sees as events, then history is compacted away
+        self.server.put('configmaps', configmap('missed'), record=False)
+        self.server.delete('configmaps', 'app-config', 'student1', record=False)
+        self.server.compact()
+        self.server.close_watches()
+
+        # Relisted right away, not after the one second error backoff
+        self.assertTrue(wait_for(lambda: self.cache.get('configmaps', 'missed', 'student1') is not None,
+                                 timeout=0.8))
+        self.assertIsNone(self.cache.get('configmaps', 'app-config', 'student1'))
+        stats = self.cache.stats()
+        self.assertGreaterEqual(stats['relists'], 3)
+        self.assertTrue(stats['kinds']['configmaps']['synced'])
+        self.assertIsNone(stats['kinds']['configmaps']['error'])
+
+        # The fresh watch after the relist still delivers events
+        self.server.put('configmaps', configmap('after'))
+        self.assertTrue(wait_for(lambda: self.cache.get('configmaps', 'after', 'student1') is not None))
+
+
+class ResourceCacheExpiredStatusTest(ResourceCacheTest):
+    """The same, with expiry reported as an HTTP 410 response instead of an ERROR event"""
+    expired_status = True
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+"""Cancelling a streamed session-shell command kills what it started"""
+import os
+import sys
+import time
+import queue
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from executor import CommandExecutor
+from shell import PersistentShell
+
+
+def process_gone(pid):
+    """No such process, or only a zombie left for init to reap"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] == 'Z'
+    except FileNotFoundError:
+        return True
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class ShellCancelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = CommandExecutor(max_workers=2, max_queue=4)
+        self.shell = PersistentShell(env=dict(os.environ))
+
+    def tearDown(self):
+        self.shell.close()
+
+    def submit(self, command, on_output=None):
+        """Submitted the way submit_terminal_command does for a session"""
+        cancel = threading.Event()
+        return self.executor.submit(
+            command,
+            timeout=30,
+            kind='terminal',
+            fn=lambda: self.shell.run(command, timeout=30, on_output=on_output, cancel=cancel),
+            on_cancel=cancel.set
+        )
+
+    def test_disconnect_mid_stream_kills_child(self):
+        chunks = queue.Queue()
+        # Padded past the bytes the shell holds back while looking for its sentinel
+        job = self.submit('sleep 60 & echo $! $(printf "%0100d" 0); wait',
+                          on_output=lambda name, data: chunks.put(data))
+        child = int(chunks.get(timeout=5).split()[0])
+        shell_pid = self.shell.process.pid
+        self.assertFalse(process_gone(child))
+
+        # What the stream generator does when the client goes away
+        job.cancel()
+        self.assertTrue(wait_for(lambda: process_gone(child)))
+        self.assertTrue(wait_for(lambda: process_gone(shell_pid)))
+        self.assertTrue(wait_for(job.future.done))
+
+        # The next command gets a fresh shell
+        result = self.submit('echo ok').result(timeout=5)
+        self.assertEqual(result.stdout.strip(), 'ok')
+        self.assertNotEqual(self.shell.process.pid, shell_pid)
+
+    def test_cancel_while_queued_leaves_shell_alone(self):
+        chunks = queue.Queue()
+        running = self.submit('printf "%0100d\\n" 0; sleep 0.5; echo done',
+                              on_output=lambda name, data: chunks.put(data))
+        chunks.get(timeout=5)
+        queued = self.submit('echo never')
+        queued.cancel()
+
+        result = running.result(timeout=5)
+        self.assertEqual(result.stdout.split()[-1], 'done')
+        self.assertTrue(queued.result(timeout=5).cancelled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,323 @@
+"""Running validation.json entries against the cluster.
+
+An entry is a shell command, a command marked read-only (answered from the
+resource cache when it can be), or a structured check evaluated against the
+object it names. ``Validator`` runs single entries, whole validation maps
+with a bounded number of steps in flight, and grades a question across many
+namespaces. It only uses what it is handed (executor, caches, audit hooks)
+and starts nothing on import, so the command-line grader can build its own.
+"""
+import json
+import time
+import fnmatch
+import contextvars
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from executor import QueueFull
+from resource_cache import NotSynced, RESOURCES, canonical_kind, parse_get_command
+from checks import CheckError, fetch_command, normalize as normalize_check, evaluate as evaluate_check
+
+
+def step_sort_key(step):
+    return (0, int(step), '') if step.isdigit() else (1, 0, step)
+
+
+def substitute_namespace(entry, namespace):
+    """Replace ${NAMESPACE} in a command string or in every string of a structured entry"""
+    if isinstance(entry, str):
+        return entry.replace('${NAMESPACE}', namespace)
+    if isinstance(entry, dict):
+        return {key: substitute_namespace(value, namespace) for key, value in entry.items()}
+    if isinstance(entry, list):
+        return [substitute_namespace(value, namespace) for value in entry]
+    return entry
+
+
+def resolve_validation(entry):
+    """Split a validation.json entry into (command, readonly)
+
+    An entry is either a command string or an object such as
+    {"command": "oc get configmap app-config -n ${NAMESPACE}", "readonly": true}.
+    """
+    if isinstance(entry, dict):
+        return entry.get('command'), bool(entry.get('readonly'))
+    return entry, False
+
+
+class Validator:
+    """Runs validation entries through `executor`, sharing identical commands via `cache`
+
+    `audit(kind, **fields)` is called for every check and `scope(**fields)`
+    is a context manager attributing what runs inside to a step or
+    namespace; both are optional.
+    """
+
+    def __init__(self, executor, cache, resource_cache=None, timeout=10, queue_timeout=None,
+                 fanout=4, max_concurrency=16, audit=None, scope=None):
+        self.executor = executor
+        self.cache = cache
+        self.resource_cache = resource_cache
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.fanout = fanout
+        self.max_concurrency = max_concurrency
+        self.audit = audit
+        self.scope = scope or (lambda **fields: nullcontext())
+
+    def _audit(self, command, namespace, body, returncode, started):
+        """Audit one step check; the exit code is None when no command ran (cache, timeout, error)"""
+        if self.audit is None:
+            return
+        self.audit('validation', namespace=namespace or None, command=command, exit_code=returncode,
+                   passed=body.get('passed'), duration_ms=round((time.monotonic() - started) * 1000, 2),
+                   output=body.get('output', body.get('error')))
+
+    def run(self, entry, namespace=''):
+        """Run one validation.json entry and return (result, status code)"""
+        if isinstance(entry, dict) and 'check' in entry:
+            started = time.monotonic()
+            body, status = self.run_check(entry['check'])
+            self._audit(json.dumps(entry['check'], sort_keys=True), namespace, body, None, started)
+            return body, status
+
+        command, readonly = resolve_validation(entry)
+        if not command or not isinstance(command, str):
+            return {"error": "Invalid validation file format"}, 500
+        return self.run_command(command, namespace, readonly=readonly)
+
+    def run_batch(self, entries, namespace='', early_exit=False, fanout=None):
+        """Run every step of a validation map with at most `fanout` steps in flight
+
+        Results come back in step order. With early_exit, steps after the first
+        failing one are cancelled (or discarded if already running) and reported
+        as skipped.
+        """
+        def run_step(step, entry):
+            step_started = time.monotonic()
+            with self.scope(step=step):
+                body, status = self.run(entry, namespace)
+            return body, status, time.monotonic() - step_started
+
+        order = sorted(entries, key=step_sort_key)
+        results = []
+        failed = False
+        pool = ThreadPoolExecutor(max_workers=max(1, fanout or self.fanout))
+        try:
+            # Each step runs in a copy of this context so its commands keep the request id
+            futures = [(step, pool.submit(contextvars.copy_context().run, run_step, step, entries[step]))
+                       for step in order]
+            for step, future in futures:
+                if failed:
+                    future.cancel()
+                    results.append({"step": step, "status": "skipped", "passed": False, "output": ""})
+                    continue
+
+                body, status, duration = future.result()
+                passed = bool(body.get('passed'))
+                if 'error' in body:
+                    state = 'error'
+                else:
+                    state = 'passed' if passed else 'failed'
+                results.append({
+                    "step": step,
+                    "status": state,
+                    "passed": passed,
+                    "output": body.get('output', body.get('error', '')),
+                    "duration_ms": round(duration * 1000, 1)
+                })
+                if early_exit and not passed:
+                    failed = True
+        finally:
+            # Don't hold the response for steps whose results are discarded
+            pool.shutdown(wait=False)
+        return results
+
+    def query_resource_cache(self, command):
+        """Answer a read-only `oc get <kind> <name>` from the watch cache, or None to run it"""
+        if self.resource_cache is None:
+            return None
+
+        parsed = parse_get_command(command)
+        if parsed is None:
+            return None
+        kind, name, namespace = parsed
+        if namespace is None and RESOURCES[kind][2]:
+            # The student's current project is unknown here, let oc resolve it
+            return None
+
+        try:
+            obj = self.resource_cache.get(kind, name, namespace)
+        except NotSynced:
+            return None
+
+        singular = kind[:-1]
+        if obj is None:
+            return {
+                "passed": False,
+                "output": f'Error from server (NotFound): {kind} "{name}" not found'
+            }
+        return {
+            "passed": True,
+            "output": f"{singular}/{name}"
+        }
+
+    def run_shared(self, command, namespace=''):
+        """Run a validation command; concurrent identical commands share one execution"""
+        return self.cache.get_or_run(
+            (command, namespace),
+            lambda: self.executor.run(
+                command,
+                timeout=self.timeout,
+                kind='validation',
+                queue_timeout=self.queue_timeout,
+                client=namespace or None
+            )
+        )
+
+    def run_command(self, command, namespace='', readonly=False):
+        started = time.monotonic()
+        returncode = None
+        if readonly:
+            cached = self.query_resource_cache(command)
+            if cached is not None:
+                self._audit(command, namespace, cached, None, started)
+                return cached, 200
+
+        try:
+            result = self.run_shared(command, namespace)
+
+            if result.timed_out:
+                body, status = {
+                    "passed": False,
+                    "output": f"Command timed out after {self.timeout} seconds"
+                }, 200
+            else:
+                returncode = result.returncode
+                passed = result.returncode == 0
+                output = result.stdout.strip() if passed else result.stderr.strip()
+
+                body, status = {
+                    "passed": passed,
+                    "output": output or "Command executed successfully"
+                }, 200
+        except QueueFull as e:
+            body, status = {
+                "passed": False,
+                "output": str(e)
+            }, 503
+        except Exception as e:
+            body, status = {
+                "passed": False,
+                "output": f"Error executing command: {str(e)}"
+            }, 500
+
+        self._audit(command, namespace, body, returncode, started)
+        return body, status
+
+    def fetch_object(self, kind, name, namespace=None):
+        """Fetch one object for a structured check, from the resource cache when possible
+
+        Returns (obj, error); obj is None when the object does not exist.
+        """
+        cache_kind = canonical_kind(kind)
+        if self.resource_cache is not None and cache_kind and (namespace or not RESOURCES[cache_kind][2]):
+            try:
+                return self.resource_cache.get(cache_kind, name, namespace), None
+            except NotSynced:
+                pass
+
+        command = fetch_command(kind, name, namespace)
+        result = self.run_shared(command, namespace or '')
+        if result.timed_out:
+            return None, f"Command timed out after {self.timeout} seconds"
+        if result.returncode != 0:
+            if 'NotFound' in result.stderr:
+                return None, None
+            return None, result.stderr.strip() or f"'{command}' failed"
+        return json.loads(result.stdout), None
+
+    def run_check(self, check):
+        """Evaluate a structured check against the object it names"""
+        try:
+            kind, name, namespace, assertions = normalize_check(check)
+            obj, error = self.fetch_object(kind, name, namespace)
+            if error:
+                return {"passed": False, "output": error}, 200
+            passed, lines = evaluate_check(obj, assertions)
+        except CheckError as e:
+            return {"error": f"Invalid validation check: {str(e)}"}, 500
+        except QueueFull as e:
+            return {"passed": False, "output": str(e)}, 503
+        except Exception as e:
+            return {"passed": False, "output": f"Error running check: {str(e)}"}, 500
+
+        if obj is None:
+            lines.insert(0, f'{kind} "{name}" not found')
+        return {"passed": passed, "output": "\n".join(lines)}, 200
+
+    def list_namespaces(self, pattern):
+        """Cluster namespaces matching a glob pattern such as 'student-*'"""
+        names = None
+        if self.resource_cache is not None:
+            try:
+                names = [obj['metadata']['name'] for obj in self.resource_cache.list('namespaces')]
+            except NotSynced:
+                pass
+
+        if names is None:
+            result = self.executor.run(
+                "oc get namespaces -o jsonpath='{.items[*].metadata.name}'",
+                timeout=self.timeout,
+                kind='validation',
+                queue_timeout=self.queue_timeout
+            )
+            if result.timed_out or result.returncode != 0:
+                raise RuntimeError(result.stderr.strip() or "Failed to list namespaces")
+            names = result.stdout.split()
+
+        return sorted(name for name in names if fnmatch.fnmatchcase(name, pattern))
+
+    def grade(self, question_id, validation_commands, namespaces, concurrency=None):
+        """Validate every step of a question in each namespace, yielding results as they finish
+
+        Steps within a namespace run one after another, so at most `concurrency`
+        validation commands hit the API server at any time.
+        """
+        concurrency = max(1, min(concurrency or self.max_concurrency, self.max_concurrency))
+
+        def grade(namespace):
+            started = time.monotonic()
+            entries = substitute_namespace(validation_commands, namespace)
+            with self.scope(question_id=question_id, namespace=namespace):
+                steps = self.run_batch(entries, namespace, fanout=1)
+            completed = [step['step'] for step in steps if step['passed']]
+            return {
+                "namespace": namespace,
+                "question_id": question_id,
+                "passed": bool(steps) and len(completed) == len(steps),
+                "completed_steps": completed,
+                "total_steps": len(steps),
+                "steps": steps,
+                "duration_ms": round((time.monotonic() - started) * 1000, 1)
+            }
+
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+        futures = {pool.submit(contextvars.copy_context().run, grade, namespace): namespace
+                   for namespace in namespaces}
+        try:
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    yield {
+                        "namespace": futures[future],
+                        "question_id": question_id,
+                        "passed": False,
+                        "error": str(e)
+                    }
+        finally:
+            # Stop queued namespaces if the client went away
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
@@ -0,0 +1,348 @@
+"""Student workspace directories: created on first use, size-capped, archived when done.
+
+A session only gets a directory (and an empty ``.kube/config`` for its
+isolated kubeconfig) once it runs a command there. Each top-level entry
+under the root is a unit: a question session's directory, or a namespace
+directory holding ``/api/sessions`` terminals. Units of ended sessions, and
+units nobody has used for ``idle_after`` seconds, are packed into
+``<archive dir>/<2 chars>/<unit>.tar.gz`` (or just deleted when they hold
+nothing but the empty kubeconfig) by a background thread, and unpacked
+again when a command needs them. Disk usage is compared with the
+per-workspace quota: commands only queue their workspace for measuring, and
+the background thread walks it, at most every ``quota_interval`` seconds per
+workspace, so requests never pay for the walk and only read the last result.
+"""
+import os
+import time
+import shlex
+import shutil
+import tarfile
+import threading
+
+MB = 1024 * 1024
+
+# Commands still allowed in a workspace that is over its quota, with any arguments
+CLEANUP_COMMANDS = {'rm', 'rmdir', 'ls', 'du', 'df', 'pwd', 'cd'}
+# The only find primaries allowed over quota: tests, operators and -delete/-print
+FIND_PRIMARIES = {
+    '-name', '-iname', '-path', '-ipath', '-type', '-size', '-empty', '-mtime', '-mmin',
+    '-newer', '-user', '-maxdepth', '-mindepth', '-depth', '-xdev', '-not', '-a', '-and',
+    '-o', '-or', '!', '(', ')', '-delete', '-print', '-ls'
+}
+SHELL_OPERATORS = ('>', '<', '|', ';', '&', '$(', '`', '\n')
+
+
+def is_cleanup_command(command):
+    """Whether a command only inspects or frees space (and may run over quota)
+
+    Besides the plain CLEANUP_COMMANDS, only `find` with tests and -delete
+    (no -exec or other actions) and `truncate` to size 0 qualify.
+    """
+    if any(op in command for op in SHELL_OPERATORS):
+        return False
+    try:
+        words = shlex.split(command)
+    except ValueError:
+        return False
+    if not words:
+        return False
+    if words[0] in CLEANUP_COMMANDS:
+        return True
+    if words[0] == 'find':
+        return all(word in FIND_PRIMARIES for word in words[1:] if word.startswith('-') or word in ('!', '(', ')'))
+    if words[0] == 'truncate':
+        return words[1:3] in (['-s', '0'], ['--size', '0']) or words[1:2] in (['-s0'], ['--size=0'])
+    return False
+
+
+class WorkspaceStore:
+    """Workspace directories under `root_dir` with lazy creation, quotas and archival"""
+
+    def __init__(self, root_dir, archive_dir, quota_mb=0, archive_delay=60, idle_after=86400,
+                 sweep_interval=3600, in_use=None, quota_interval=10):
+        self.root_dir = os.path.abspath(root_dir)
+        self.archive_dir = os.path.abspath(archive_dir)
+        self.quota_bytes = int(quota_mb * MB)
+        self.archive_delay = archive_delay
+        self.idle_after = idle_after
+        self.sweep_interval = sweep_interval
+        self.quota_interval = quota_interval
+        # in_use() -> workspace paths of live sessions, which are never archived
+        self.in_use = in_use or (lambda: ())
+        self._cond = threading.Condition()
+        self._busy = set()
+        self._pending = {}
+        self._over_quota = set()
+        # path -> when to measure it next, and when it was last measured
+        self._measure = {}
+        self._measured = {}
+        self._thread = None
+        self._sweeper = None
+        self._stop = threading.Event()
+        self._counts = {'created': 0, 'restored': 0, 'archived': 0, 'deleted_empty': 0,
+                        'quota_hits': 0, 'quota_checks': 0, 'archive_errors': 0, 'bytes_archived': 0, 'archive_bytes': 0}
+
+    def path(self, *parts):
+        return os.path.join(self.root_dir, *parts)
+
+    def kubeconfig(self, path):
+        return os.path.join(path, '.kube', 'config')
+
+    def _unit(self, path):
+        """Top-level directory name `path` belongs to, or None if it is outside the root"""
+        rel = os.path.relpath(os.path.abspath(path), self.root_dir)
+        unit = rel.split(os.sep, 1)[0]
+        if unit in ('', '.', '..'):
+            return None
+        return unit
+
+    def _archive_path(self, unit):
+        return os.path.join(self.archive_dir, unit[:2], f'{unit}.tar.gz')
+
+    def exists(self, path):
+        """Whether a workspace has a directory or an archive"""
+        unit = self._unit(path)
+        return unit is not None and (os.path.isdir(path) or os.path.exists(self._archive_path(unit)))
+
+    def ensure(self, path):
+        """Make sure a workspace directory exists, restoring or creating it; returns the path"""
+        unit = self._unit(path)
+        if unit is None:
+            raise ValueError(f"Workspace {path} is outside {self.root_dir}")
+        unit_dir = self.path(unit)
+        with self._cond:
+            # Wait out an archive or restore of the same unit
+            while unit in self._busy:
+                self._cond.wait()
+            self._pending.pop(unit, None)
+            if os.path.isdir(path):
+                self._touch(unit_dir)
+                return path
+            self._busy.add(unit)
+        try:
+            archive = self._archive_path(unit)
+            if not os.path.isdir(unit_dir) and os.path.exists(archive):
+                self._restore(unit, archive)
+            if not os.path.isdir(path):
+                os.makedirs(os.path.dirname(self.kubeconfig(path)), exist_ok=True)
+                open(self.kubeconfig(path), 'a').close()
+                self._count('created')
+            self._touch(unit_dir)
+        finally:
+            with self._cond:
+                self._busy.discard(unit)
+                self._cond.notify_all()
+        return path
+
+    def _touch(self, unit_dir):
+        # The unit's mtime is its last use, for the idle sweep
+        try:
+            os.utime(unit_dir)
+        except OSError:
+            pass
+
+    def _restore(self, unit, archive):
+        with tarfile.open(archive, 'r:gz') as tar:
+            if hasattr(tarfile, 'data_filter'):
+                tar.extractall(self.root_dir, filter='data')
+            else:
+                for member in tar.getmembers():
+                    if member.name.split('/', 1)[0] != unit or '..' in member.name.split('/'):
+                        raise ValueError(f"Unexpected path {member.name} in {archive}")
+                tar.extractall(self.root_dir)
+        os.remove(archive)
+        self._count('restored')
+
+    def usage(self, path):
+        """Bytes used by the files under a workspace"""
+        total = 0
+        stack = [path]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            total += entry.stat(follow_symlinks=False).st_blocks * 512
+            except OSError:
+                pass
+        return total
+
+    def over_quota(self, path):
+        """Whether the last measurement found the workspace over its quota"""
+        with self._cond:
+            return path in self._over_quota
+
+    def measure_later(self, path, delay=0):
+        """Have the background thread re-measure a workspace a command wrote to
+
+        It is measured `delay` seconds from now, but not sooner than
+        quota_interval after its previous measurement.
+        """
+        if not self.quota_bytes:
+            return
+        with self._cond:
+            due = max(time.monotonic() + delay, self._measured.get(path, 0) + self.quota_interval)
+            if path not in self._measure or due < self._measure[path]:
+                self._measure[path] = due
+                self._cond.notify_all()
+
+    def check_quota(self, path):
+        """Measure a workspace now; returns True if it is over its quota"""
+        if not self.quota_bytes or not os.path.isdir(path):
+            return False
+        over = self.usage(path) > self.quota_bytes
+        with self._cond:
+            self._measured[path] = time.monotonic()
+            self._counts['quota_checks'] += 1
+            if over and path not in self._over_quota:
+                self._counts['quota_hits'] += 1
+            if over:
+                self._over_quota.add(path)
+            else:
+                self._over_quota.discard(path)
+        return over
+
+    def release(self, path):
+        """A session using `path` has ended; archive its unit after archive_delay"""
+        unit = self._unit(path)
+        if unit is None:
+            return
+        with self._cond:
+            self._over_quota.discard(path)
+            self._measure.pop(path, None)
+            self._measured.pop(path, None)
+            self._pending[unit] = time.monotonic() + self.archive_delay
+            self._cond.notify_all()
+
+    def _units_in_use(self):
+        return {unit for unit in (self._unit(path) for path in self.in_use() if path) if unit}
+
+    def archive(self, unit):
+        """Pack a unit into its archive (or delete it if empty); returns False if it is in use"""
+        unit_dir = self.path(unit)
+        in_use = self._units_in_use()
+        with self._cond:
+            if unit in self._busy or unit in in_use:
+                return False
+            self._busy.add(unit)
+        try:
+            if not os.path.isdir(unit_dir):
+                return True
+            used = self.usage(unit_dir)
+            if used == 0:
+                # Only directories and the empty kubeconfig: nothing worth keeping
+                shutil.rmtree(unit_dir)
+                self._count('deleted_empty')
+                return True
+
+            archive = self._archive_path(unit)
+            os.makedirs(os.path.dirname(archive), exist_ok=True)
+            tmp = f'{archive}.tmp'
+            try:
+                with tarfile.open(tmp, 'w:gz', compresslevel=6) as tar:
+                    tar.add(unit_dir, arcname=unit)
+                os.replace(tmp, archive)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+            shutil.rmtree(unit_dir)
+            with self._cond:
+                self._counts['archived'] += 1
+                self._counts['bytes_archived'] += used
+                self._counts['archive_bytes'] += os.path.getsize(archive)
+            return True
+        except OSError:
+            self._count('archive_errors')
+            return False
+        finally:
+            with self._cond:
+                self._busy.discard(unit)
+                self._cond.notify_all()
+
+    def sweep(self):
+        """Archive every unit not used for idle_after seconds; returns how many"""
+        cutoff = time.time() - self.idle_after
+        archived = 0
+        try:
+            entries = list(os.scandir(self.root_dir))
+        except OSError:
+            return 0
+        for entry in entries:
+            if self._stop.is_set():
+                break
+            try:
+                if entry.is_dir(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                    archived += self.archive(entry.name)
+            except OSError:
+                pass
+        return archived
+
+    def start(self, sweeper=None):
+        """Start the background archiver, which also archives idle units found on disk
+
+        With several processes sharing the root, pass `sweeper()` saying
+        whether this one is elected to sweep (asked before every sweep).
+        """
+        self._sweeper = sweeper
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='workspace-archiver', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _run(self):
+        # First sweep shortly after startup, so leftovers from earlier runs are packed
+        next_sweep = time.monotonic() + min(60, self.sweep_interval)
+        while not self._stop.is_set():
+            now = time.monotonic()
+            with self._cond:
+                due = [unit for unit, at in self._pending.items() if at <= now]
+                for unit in due:
+                    del self._pending[unit]
+                measure = [path for path, at in self._measure.items() if at <= now]
+                for path in measure:
+                    del self._measure[path]
+                if not due and not measure:
+                    wake = min(min(self._pending.values(), default=now + 60),
+                               min(self._measure.values(), default=now + 60))
+                    if self.sweep_interval > 0:
+                        wake = min(wake, next_sweep)
+                    self._cond.wait(max(0.05, wake - now))
+            for path in measure:
+                try:
+                    self.check_quota(path)
+                except Exception:
+                    pass
+            for unit in due:
+                try:
+                    self.archive(unit)
+                except Exception:
+                    self._count('archive_errors')
+            if self.sweep_interval > 0 and time.monotonic() >= next_sweep:
+                next_sweep = time.monotonic() + self.sweep_interval
+                try:
+                    if self._sweeper is None or self._sweeper():
+                        self.sweep()
+                except Exception:
+                    pass
+
+    def _count(self, name):
+        with self._cond:
+            self._counts[name] += 1
+
+    def stats(self):
+        with self._cond:
+            return dict(
+                self._counts,
+                quota_mb=self.quota_bytes // MB,
+                pending=len(self._pending),
+                measure_pending=len(self._measure),
+                over_quota=len(self._over_quota)
+            )
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""Load test the lab platform against a fake `oc`.
+
+Starts the server (the Flask dev server or backend/serve.py) with
+bench/fake-oc first on its PATH, then runs simulated students in parallel.
+Each student opens a question, creates a session, alternates terminal
+commands and step checks, and ends the session. Prints throughput, latency
+percentiles per endpoint and the server's process/FD/RSS growth, and writes
+the results as JSON so runs can be compared.
+
+Examples:
+    python3 bench/run.py --students 20 --duration 60
+    python3 bench/run.py --server serve --workers 4 --oc-latency 0.2 --oc-output-bytes 100000
+    python3 bench/run.py --url http://lab.example:80 --pid 1234
+    python3 bench/run.py --compare bench/results/baseline.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import tempfile
+import random
+import argparse
+import platform
+import threading
+import subprocess
+import http.client
+import urllib.parse
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+FAKE_OC_DIR = os.path.join(BENCH_DIR, 'fake-oc')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+TERMINAL_COMMANDS = [
+    'oc get pods -n "$NAMESPACE"',
+    'oc get configmap app-config -n "$NAMESPACE" -o yaml',
+    'oc describe deployment web -n "$NAMESPACE"',
+    'ls -la',
+    'echo "$NAMESPACE"',
+]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Latencies and status codes per endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.statuses = {}
+
+    def add(self, name, seconds, status):
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+            counts = self.statuses.setdefault(name, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    def summary(self, elapsed):
+        endpoints = {}
+        with self._lock:
+            for name, values in sorted(self.samples.items()):
+                values = sorted(values)
+                statuses = self.statuses[name]
+                errors = sum(count for status, count in statuses.items()
+                             if not (isinstance(status, int) and status < 400))
+                endpoints[name] = {
+                    'requests': len(values),
+                    'errors': errors,
+                    'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+                    'throughput_rps': round(len(values) / elapsed, 2),
+                    'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+                    'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+                    'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+                    'max_ms': round(values[-1] * 1000, 2)
+                }
+        total = sum(endpoint['requests'] for endpoint in endpoints.values())
+        return {
+            'requests': total,
+            'errors': sum(endpoint['errors'] for endpoint in endpoints.values()),
+            'throughput_rps': round(total / elapsed, 2),
+            'endpoints': endpoints
+        }
+
+
+class Client:
+    """Keep-alive HTTP/JSON client for one simulated student"""
+
+    def __init__(self, base_url, recorder, timeout=120):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.recorder = recorder
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, name, method, path, body=None):
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        started = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.conn.request(method, path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException) as e:
+            self.close()
+            self.recorder.add(name, time.perf_counter() - started, type(e).__name__)
+            return None, None
+        self.recorder.add(name, time.perf_counter() - started, status)
+        try:
+            return status, json.loads(data) if data else None
+        except ValueError:
+            return status, None
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def student(index, args, recorder, stop):
+    """One simulated student working through a question until stop is set"""
+    client = Client(args.url, recorder)
+    rng = random.Random(index)
+    namespace = f'bench-student-{index}'
+    try:
+        while not stop.is_set():
+            client.request('question', 'GET', f'/api/questions/{args.question}')
+            _, created = client.request('session_create', 'POST', '/api/session/create',
+                                        {'questionId': args.question})
+            session_id = (created or {}).get('sessionId')
+            for step in range(1, args.steps + 1):
+                for _ in range(args.commands_per_step):
+                    if stop.is_set():
+                        break
+                    client.request('terminal_execute', 'POST', '/api/terminal/execute', {
+                        'sessionId': session_id,
+                        'namespace': namespace,
+                        'command': rng.choice(TERMINAL_COMMANDS)
+                    })
+                    stop.wait(rng.uniform(0, args.think_time * 2))
+                if stop.is_set():
+                    break
+                client.request('validate', 'POST', '/api/validate', {
+                    'question_id': args.question,
+                    'step': step,
+                    'namespace': namespace,
+                    'sessionId': session_id
+                })
+            if session_id:
+                client.request('session_end', 'POST', '/api/session/end', {'sessionId': session_id})
+    finally:
+        client.close()
+
+
+def process_tree(pid):
+    """pid and all its descendants, from /proc"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, todo = [], [pid]
+    while todo:
+        current = todo.pop()
+        tree.append(current)
+        todo.extend(children.get(current, []))
+    return tree
+
+
+def sample_resources(pid):
+    """Processes, open FDs and RSS (KiB) of a server process tree"""
+    processes = fds = rss = 0
+    for member in process_tree(pid):
+        try:
+            fds += len(os.listdir(f'/proc/{member}/fd'))
+            with open(f'/proc/{member}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss += int(line.split()[1])
+            processes += 1
+        except (OSError, ValueError):
+            continue
+    return {'processes': processes, 'fds': fds, 'rss_kib': rss}
+
+
+class ResourceSampler(threading.Thread):
+    """Samples the server's process tree in the background"""
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(name='resource-sampler', daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            self.samples.append(sample_resources(self.pid))
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.samples.append(sample_resources(self.pid))
+
+    def summary(self, baseline):
+        result = {'baseline': baseline}
+        for key in ('processes', 'fds', 'rss_kib'):
+            values = [sample[key] for sample in self.samples]
+            result[key] = {
+                'start': baseline[key],
+                'peak': max(values),
+                'end': values[-1],
+                'growth': values[-1] - baseline[key]
+            }
+        return result
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, state_dir):
+    """Launch the app with the fake oc on PATH and its workspaces and databases in state_dir
+
+    Returns (process, base_url).
+    """
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        # Keep the run's sessions, workspaces and audit records out of the real ones
+        'LAB_WORKSPACE_DIR': os.path.join(state_dir, 'workspace'),
+        'LAB_AUDIT_DB': os.path.join(state_dir, 'audit.db'),
+        'LAB_SESSION_DB': os.path.join(state_dir, 'sessions.db'),
+        'PATH': FAKE_OC_DIR + os.pathsep + env.get('PATH', ''),
+        'FAKE_OC_LATENCY': str(args.oc_latency),
+        'FAKE_OC_OUTPUT_BYTES': str(args.oc_output_bytes),
+        'FAKE_OC_FAIL_PERCENT': str(args.oc_fail_percent),
+        'PORT': str(port),
+        'PYTHONUNBUFFERED': '1'
+    })
+    if not args.keep_rate_limits:
+        # Every simulated student comes from 127.0.0.1
+        env.update({'SESSION_RATE_LIMIT': '0', 'IP_RATE_LIMIT': '0'})
+
+    if args.server == 'serve':
+        command = [sys.executable, os.path.join(PROJECT_ROOT, 'backend', 'serve.py'),
+                   '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+                   '--session-db', env['LAB_SESSION_DB']]
+    else:
+        command = [sys.executable, os.path.join(PROJECT_ROOT, 'backend', 'app.py')]
+
+    log = open(os.path.join(RESULTS_DIR, 'server.log'), 'w')
+    process = subprocess.Popen(command, cwd=PROJECT_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Server exited with {process.returncode}; see {log.name}")
+        try:
+            # Ready once a worker has loaded the question catalog
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/api/questions')
+            if conn.getresponse().status == 200:
+                return process, url
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise SystemExit("Server did not start within 30 seconds")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def print_report(results):
+    print(f"\n{results['students']} students for {results['elapsed_seconds']}s "
+          f"({results['config']['server']} server, oc latency {results['config']['oc_latency']}s)")
+    print(f"{'endpoint':<18} {'reqs':>7} {'errors':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, endpoint in results['endpoints'].items():
+        print(f"{name:<18} {endpoint['requests']:>7} {endpoint['errors']:>7} {endpoint['throughput_rps']:>8} "
+              f"{endpoint['p50_ms']:>9} {endpoint['p95_ms']:>9} {endpoint['p99_ms']:>9}")
+    print(f"{'total':<18} {results['requests']:>7} {results['errors']:>7} {results['throughput_rps']:>8}")
+    resources = results.get('resources')
+    if resources:
+        for key in ('processes', 'fds', 'rss_kib'):
+            values = resources[key]
+            print(f"{key:<10} start {values['start']:>8}  peak {values['peak']:>8}  "
+                  f"end {values['end']:>8}  growth {values['growth']:>+8}")
+
+
+def compare(baseline, results, tolerance):
+    """Print latency/throughput changes against a baseline; returns False on regression"""
+    ok = True
+    print(f"\nCompared with {baseline.get('started_at')} (tolerance {tolerance:.0%}):")
+    for name, endpoint in results['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before:
+            continue
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            old, new = before[key], endpoint[key]
+            change = (new - old) / old if old else 0.0
+            flag = ''
+            if change > tolerance:
+                flag = '  REGRESSION'
+                ok = False
+            print(f"  {name:<18} {key:<7} {old:>9} -> {new:>9} ({change:+.1%}){flag}")
+    old, new = baseline.get('throughput_rps', 0), results['throughput_rps']
+    change = (new - old) / old if old else 0.0
+    flag = ''
+    if change < -tolerance:
+        flag = '  REGRESSION'
+        ok = False
+    print(f"  {'total':<18} rps     {old:>9} -> {new:>9} ({change:+.1%}){flag}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the lab platform with a fake oc')
+    parser.add_argument('-s', '--students', type=int, default=10, help='concurrent simulated students')
+    parser.add_argument('-d', '--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('-q', '--question', default='sample-question')
+    parser.add_argument('--steps', type=int, default=4, help='steps checked per session')
+    parser.add_argument('--commands-per-step', type=int, default=3)
+    parser.add_argument('--think-time', type=float, default=0.5,
+                        help='mean seconds between a student\'s commands')
+    parser.add_argument('--server', choices=['dev', 'serve'], default='dev',
+                        help='run backend/app.py or the multi-worker backend/serve.py')
+    parser.add_argument('--workers', type=int, default=2, help='workers for --server serve')
+    parser.add_argument('--url', help='benchmark an already running server instead')
+    parser.add_argument('--pid', type=int, help='server pid to sample with --url')
+    parser.add_argument('--oc-latency', type=float, default=0.05, help='seconds per fake oc call')
+    parser.add_argument('--oc-output-bytes', type=int, default=200, help='bytes per fake oc read')
+    parser.add_argument('--oc-fail-percent', type=int, default=0)
+    parser.add_argument('--keep-rate-limits', action='store_true',
+                        help='leave the per-session/IP rate limits on')
+    parser.add_argument('-o', '--output', help='results file (default: bench/results/<time>.json)')
+    parser.add_argument('--compare', help='baseline results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='allowed slowdown before --compare fails (fraction)')
+    args = parser.parse_args(argv)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    server = None
+    state_dir = None
+    pid = args.pid
+    if args.url is None:
+        state_dir = tempfile.mkdtemp(prefix='lab-bench-')
+        server, args.url = start_server(args, state_dir)
+        pid = server.pid
+
+    sampler = None
+    baseline = None
+    if pid and os.path.isdir('/proc'):
+        baseline = sample_resources(pid)
+        sampler = ResourceSampler(pid)
+        sampler.start()
+
+    recorder = Recorder()
+    stop = threading.Event()
+    started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    started = time.monotonic()
+    threads = [threading.Thread(target=student, args=(i, args, recorder, stop), daemon=True)
+               for i in range(args.students)]
+    try:
+        for thread in threads:
+            thread.start()
+        stop.wait(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=60)
+        elapsed = time.monotonic() - started
+        try:
+            if sampler is not None:
+                sampler.stop()
+        finally:
+            if server is not None:
+                stop_server(server)
+                shutil.rmtree(state_dir, ignore_errors=True)
+
+    results = dict(recorder.summary(elapsed), **{
+        'started_at': started_at,
+        'elapsed_seconds': round(elapsed, 1),
+        'students': args.students,
+        'git_revision': subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                                       capture_output=True, text=True).stdout.strip() or None,
+        'host': {'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'config': {
+            'server': 'external' if server is None else args.server,
+            'workers': args.workers if args.server == 'serve' else 1,
+            'question': args.question,
+            'steps': args.steps,
+            'commands_per_step': args.commands_per_step,
+            'think_time': args.think_time,
+            'oc_latency': args.oc_latency,
+            'oc_output_bytes': args.oc_output_bytes,
+            'oc_fail_percent': args.oc_fail_percent
+        }
+    })
+    if sampler is not None:
+        results['resources'] = sampler.summary(baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print_report(results)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            if not compare(json.load(f), results, args.tolerance):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -168,23 +168,35 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
     
-    // Load a specific question
+    // Load a specific question, start its session and run the initial probes in one request
     async function loadQuestion(questionId) {
         try {
-            const response = await fetch(`/api/questions/${questionId}`);
+            const response = await fetch('/api/bootstrap', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                // Coming back to a question resumes its last workspace
+                body: JSON.stringify({
+                    questionId,
+                    resumeSessionId: localStorage.getItem(`lab-session-${questionId}`)
+                })
+            });
+            const data = await response.json();
             if (!response.ok) {
-                throw new Error(`Failed to load question: ${response.statusText}`);
+                throw new Error(data.error || `Failed to load question: ${response.statusText}`);
             }
             
             currentQuestionId = questionId;
-            currentQuestion = await response.json();
+            currentQuestion = data.question;
+            sessionId = data.sessionId;
+            localStorage.setItem(`lab-session-${questionId}`, sessionId);
             
             // Reset state
             currentStepIndex = 0;
             completedSteps = [];
             
-            // Create a new session for this question
-            await createQuestionSession(questionId);
+            showSessionStart(data);
             
             // Show question view
             displayQuestion();
@@ -195,41 +207,29 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
     
-    // Create a new session for a question
-    async function createQuestionSession(questionId) {
-        try {
-            const response = await fetch('/api/session/create', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({ questionId })
-            });
-            
-            if (!response.ok) {
-                throw new Error('Failed to create session');
-            }
-            
-            const data = await response.json();
-            sessionId = data.sessionId;
-            
-            // Clear terminal and add session info
-            terminalOutput.innerHTML = '';
-            appendToTerminal(`Session started for question: ${currentQuestion.title}`, 'system');
-            appendToTerminal(`Working directory: workspace/namespace/${sessionId}`, 'system');
-            appendToTerminal('Type commands to interact with your environment', 'system');
-            
-            // Execute the oc_workspace_init.sh script to set up isolated kubeconfig
+    // Show session info and the output of the setup commands run by /api/bootstrap
+    function showSessionStart(data) {
+        // Clear terminal and add session info
+        terminalOutput.innerHTML = '';
+        appendToTerminal(`Session started for question: ${currentQuestion.title}`, 'system');
+        appendToTerminal(`Working directory: workspace/namespace/${sessionId}`, 'system');
+        appendToTerminal('Type commands to interact with your environment', 'system');
+        
+        // The server sourced oc_workspace_init.sh to set up an isolated kubeconfig
+        if (data.init) {
             appendToTerminal('Setting up isolated OpenShift environment...', 'system');
-            await executeCommand('source /home/osandikci/workspace/opens/scripts/oc_workspace_init.sh');
+            if (data.init.output) {
+                appendToTerminal(data.init.output);
+            }
             appendToTerminal('Environment setup complete. You can now use the OpenShift CLI with an isolated configuration.', 'system');
-            
-            return true;
-        } catch (error) {
-            console.error('Error creating session:', error);
-            appendToTerminal(`Error creating session: ${error.message}`, 'error');
-            return false;
         }
+        
+        (data.probes || []).forEach(probe => {
+            appendToTerminal(`$ ${probe.command}`, 'command');
+            if (probe.output) {
+                appendToTerminal(probe.output);
+            }
+        });
     }
     
     // Display the current question
@@ -280,7 +280,8 @@ document.addEventListener('DOMContentLoaded', () => {
         updateStepIndicator();
         
         // Display step content with Markdown parsing
-        stepContent.innerHTML = parseMarkdown(step.content || 'No content for this step');
+        // Steps come pre-rendered (and sanitized) by the server
+        stepContent.innerHTML = step.html || parseMarkdown(step.content || 'No content for this step');
         
         // Add syntax highlighting and copy buttons to code blocks
         highlightCodeBlocks();